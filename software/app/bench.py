@@ -0,0 +1,1766 @@
+"""Benchmarks for the visualizer's hot paths. Run with `python bench.py <name>`.
+
+`python bench.py check` runs the quick correctness checks instead, e.g. in CI.
+"""
+
+import argparse
+import base64
+import http.server
+import json
+import math
+import os
+import random
+import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+import numpy as np
+from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
+from pocketbase import PocketBase
+
+from clickstore import (
+    DB_PATH as DATA_DB,
+    ClickStore,
+    create_tables,
+    parse_time,
+    pb_time,
+)
+from coverage import (
+    CACHE_BYTES,
+    MIN_BEACONS,
+    CoverageEngine,
+    FootprintCache,
+)
+from filters import FILTERS, FilterStage
+from grid import GridModel
+from headless import Layout as HeadlessLayout, load_layout, run
+from ingest import ReadingQueue, parse_reading, tag_reading
+from layout import (
+    LAYOUT_KEY,
+    Coverage,
+    Layout,
+    decode_layout,
+    encode_layout,
+    read_layout,
+    write_sidecar,
+)
+from mapcache import FloorPlanCache, open_plan
+from pbclient import PocketBaseService
+from repository import BUILDINGS, DEVICES, Repository
+from session import SessionRecorder, read_session
+from solver import cell_positions, locate, locate_many, solve
+from spatial import BeaconIndex
+
+
+def legacy_draw_circle(num_rows, num_cols, cell_width, cell_height, cell, radius):
+    """The per-cell loop draw_circle used before the coverage engine, minus Tk calls."""
+    row, col = cell
+    covered = 0
+    for r in range(num_rows):
+        for c in range(num_cols):
+            cell_center_x = c * cell_width + cell_width / 2
+            cell_center_y = r * cell_height + cell_height / 2
+
+            center_x = col * cell_width + cell_width / 2
+            center_y = row * cell_height + cell_height / 2
+
+            distance_to_cell = (
+                (center_x - cell_center_x) ** 2 + (center_y - cell_center_y) ** 2
+            ) ** 0.5
+            if distance_to_cell <= radius:
+                covered += 1
+    return covered
+
+
+def legacy_repaint(cells):
+    """The full-grid classification pass visualize_distances used to run, minus Tk calls."""
+    fills = []
+    for row_cells in cells:
+        for cell in row_cells:
+            if "in_range_beacons" in cell and len(set(cell["in_range_beacons"])) >= 3:
+                fills.append("green")
+            elif "in_range_beacons" in cell and len(set(cell["in_range_beacons"])) > 0:
+                fills.append("#D3D3D3")
+            else:
+                fills.append("")
+    return len(fills)  # One itemconfig call per cell
+
+
+def timed(func, *args, repeat=1):
+    """Return the best wall time of func(*args) over repeat runs and its result."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_coverage(args):
+    """Compare the legacy draw_circle loop with CoverageEngine.footprint.
+
+    Cold runs start from an empty footprint cache, so they build the offsets;
+    warm runs find them cached and only shift them to the beacon. The
+    speedup is legacy over cold.
+    """
+    print(
+        f"{'cells':>10} {'legacy (ms)':>12} {'cold (ms)':>10} {'warm (ms)':>10}"
+        f" {'speedup':>8}"
+    )
+    for cells in (10_000, 100_000, 1_000_000):
+        side = int(math.sqrt(cells))
+        cell_size = 4.0
+        beacon = (side // 2, side // 2)
+        radius = side * cell_size / 4  # Circle covers roughly a fifth of the grid
+
+        legacy, expected = timed(
+            legacy_draw_circle, side, side, cell_size, cell_size, beacon, radius
+        )
+
+        engine = CoverageEngine(GridModel(side, side), cell_size, cell_size)
+
+        def cold_footprint():
+            engine.cache.clear()
+            return engine.footprint(beacon, radius)
+
+        cold, footprint = timed(cold_footprint, repeat=args.repeat)
+        assert len(footprint) == expected
+        warm, footprint = timed(engine.footprint, beacon, radius, repeat=args.repeat)
+        assert len(footprint) == expected
+
+        print(
+            f"{side * side:>10} {legacy * 1e3:>12.1f} {cold * 1e3:>10.2f}"
+            f" {warm * 1e3:>10.3f} {legacy / cold:>7.0f}x"
+        )
+
+
+def bench_updates(args):
+    """Replay jittery readings from 20 beacons and compare full and incremental repaints."""
+    rng = random.Random(0)
+    side, cell_size, readings = 300, 4.0, 200
+    beacons = {f"b{i}": (rng.randrange(side), rng.randrange(side)) for i in range(20)}
+    ranges = {beacon_id: rng.uniform(40, 120) for beacon_id in beacons}
+
+    engine = CoverageEngine(GridModel(side, side), cell_size, cell_size)
+    engine.update({b: (cell, ranges[b] * cell_size) for b, cell in beacons.items()})
+    cells = [[{} for _ in range(side)] for _ in range(side)]
+    for beacon_id, footprint in engine.footprints.items():
+        for index in footprint.tolist():
+            cells[index // side][index % side].setdefault(
+                "in_range_beacons", []
+            ).append(beacon_id)
+
+    legacy, legacy_calls = timed(legacy_repaint, cells)
+
+    changed = 0
+    start = time.perf_counter()
+    for _ in range(readings):
+        beacon_id = rng.choice(list(beacons))
+        radius = (ranges[beacon_id] + rng.gauss(0, 1)) * cell_size
+        indices, _ = engine.update({beacon_id: (beacons[beacon_id], radius)})
+        changed += len(indices)
+    incremental = (time.perf_counter() - start) / readings
+
+    print(f"grid {side}x{side}, 20 beacons, {readings} jittered readings")
+    print(f"full repaint:  {legacy * 1e3:8.2f} ms, {legacy_calls} itemconfig calls")
+    print(
+        f"incremental:   {incremental * 1e3:8.2f} ms,"
+        f" {changed / readings:.0f} itemconfig calls on average"
+    )
+
+
+def legacy_cells(num_rows, num_cols):
+    """The list-of-dicts grid generate_grid used to build, with Tk IDs faked."""
+    return [
+        [
+            {
+                "rect": row * num_cols + col + 1,
+                "beacon": False,
+                "overlap_count": 0,
+                "in_range_beacons": [],
+            }
+            for col in range(num_cols)
+        ]
+        for row in range(num_rows)
+    ]
+
+
+def measured(func, *args):
+    """Return (seconds, peak traced bytes, result) of func(*args).
+
+    Time and memory come from separate runs, since tracing slows allocation down.
+    """
+    elapsed, result = timed(func, *args)
+    del result
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def bench_grid(args):
+    """Compare memory, build time and beacon reverse lookup of the two grid models."""
+    side, beacons = 1000, 1000
+    rng = random.Random(0)
+    cells = rng.sample(range(side * side), beacons)
+
+    grid_time, _, grid = measured(GridModel, side, side)
+    grid_bytes = grid.nbytes()
+    legacy_time, legacy_peak, legacy = measured(legacy_cells, side, side)
+    del legacy
+
+    beacon_data = {}
+    for beacon_id, index in enumerate(cells):
+        beacon_data[str(beacon_id)] = divmod(index, side)
+        grid.add_beacon(str(beacon_id), divmod(index, side))
+
+    def legacy_lookup():
+        for index in cells:
+            cell = divmod(index, side)
+            [k for k, v in beacon_data.items() if v == cell]
+
+    def grid_lookup():
+        for index in cells:
+            grid.beacon_id_at(divmod(index, side))
+
+    scan, _ = timed(legacy_lookup)
+    reverse, _ = timed(grid_lookup, repeat=args.repeat)
+
+    print(f"{side * side} cells, {beacons} beacons")
+    print(f"{'':12} {'build (ms)':>11} {'memory (MB)':>12} {'lookup (us)':>12}")
+    print(
+        f"{'list/dict':12} {legacy_time * 1e3:>11.0f} {legacy_peak / 1e6:>12.1f}"
+        f" {scan / beacons * 1e6:>12.1f}"
+    )
+    print(
+        f"{'GridModel':12} {grid_time * 1e3:>11.1f} {grid_bytes / 1e6:>12.1f}"
+        f" {reverse / beacons * 1e6:>12.2f}"
+    )
+    print(f"GridModel with {beacons} beacons placed: {grid.nbytes() / 1e6:.1f} MB")
+
+
+def soak(seconds, samples=60):
+    """Replay seconds of 10 Hz readings per beacon, drained at 30 fps like render_frame.
+
+    Returns (queue, engine, elapsed, traced, depth): traced memory sampled
+    samples times over the run, and the deepest the queue got before a drain.
+    Traced memory leaves out the footprint cache, which fills with radius
+    bands for a while but is capped at its max_bytes.
+    """
+    rng = random.Random(0)
+    side, cell_size, beacons, rate, frame_rate = 400, 4.0, 20, 10, 30
+    positions = {
+        f"b{i}": (rng.randrange(side), rng.randrange(side)) for i in range(beacons)
+    }
+    ranges = {beacon_id: rng.uniform(5, 30) for beacon_id in positions}
+
+    grid = GridModel(side, side)
+    for beacon_id, cell in positions.items():
+        grid.add_beacon(beacon_id, cell)
+    engine = CoverageEngine(grid, cell_size, cell_size)
+    queue = ReadingQueue()
+
+    # Readings arrive at rate Hz per beacon and are drained at frame_rate like render_frame
+    frames = int(seconds * frame_rate)
+    sample_every = max(1, frames // samples)
+    per_frame = beacons * rate / frame_rate
+    pending = 0.0
+    traced, depth = [], 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for frame in range(frames):
+        pending += per_frame
+        while pending >= 1:
+            beacon_id = rng.choice(list(positions))
+            queue.put(beacon_id, max(0.0, ranges[beacon_id] + rng.gauss(0, 2)))
+            pending -= 1
+        depth = max(depth, queue.depth())
+        latest = queue.drain()
+        engine.update(
+            {
+                beacon_id: (positions[beacon_id], distance * cell_size)
+                for beacon_id, (distance, _) in latest.items()
+            }
+        )
+        if frame % sample_every == 0:
+            traced.append(tracemalloc.get_traced_memory()[0] - engine.cache.nbytes)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return queue, engine, elapsed, traced, depth
+
+
+def soak_growth(traced):
+    """Bytes traced memory varied by after the first 10% of a soak.
+
+    The start is ignored, while every beacon's footprint is first allocated.
+    """
+    steady = traced[len(traced) // 10 :]
+    return max(steady) - min(steady), min(steady), max(steady)
+
+
+def bench_soak(args):
+    """Replay an hour of 10 Hz readings per beacon and fail if memory keeps growing."""
+    queue, engine, elapsed, traced, _ = soak(args.hours * 3600, int(args.hours * 60))
+    growth, low, high = soak_growth(traced)
+    print(
+        f"{queue.received} readings in {elapsed:.0f} s, "
+        f"{queue.merged} merged, footprints {engine.footprints.nbytes() / 1e3:.0f} kB"
+    )
+    print(f"traced memory over the last 90%: {low / 1e6:.2f} to {high / 1e6:.2f} MB")
+    if growth > 1e6:
+        raise SystemExit(f"memory grew by {growth / 1e6:.2f} MB during the soak")
+    print("memory stayed flat")
+
+
+def bench_solver(args):
+    """Batched position solves/sec, against one solve per reading and the coverage pass."""
+    rng = np.random.default_rng(0)
+    side, grid_size, beacons, noise = 1000, 0.1, 8, 0.1
+    beacon_data = {
+        f"b{i}": tuple(cell)
+        for i, cell in enumerate(rng.integers(0, side, (beacons, 2)))
+    }
+    beacon_ids, anchors = cell_positions(beacon_data, grid_size)
+
+    def readings(count):
+        truth = rng.uniform(0, side * grid_size, (count, 2))
+        distances = np.linalg.norm(truth[:, None, :] - anchors, axis=-1)
+        return truth, distances + rng.normal(0, noise, distances.shape)
+
+    print(f"{beacons} beacons, range noise {noise} m")
+    print(f"{'batch':>8} {'solves/s':>10} {'median error (m)':>17}")
+    for batch in (1, 100, 10_000, 1_000_000):
+        truth, distances = readings(batch)
+        elapsed, (positions, _) = timed(solve, anchors, distances, repeat=args.repeat)
+        error = np.median(np.linalg.norm(positions - truth, axis=1))
+        print(f"{batch:>8} {batch / elapsed:>10.0f} {error:>17.3f}")
+
+    # What the coverage view spends on the same reading to shade where it could be
+    grid = GridModel(side, side)
+    engine = CoverageEngine(grid, 1.0, 1.0)
+    _, distances = readings(1)
+    ranges = {
+        beacon_id: (beacon_data[beacon_id], distance / grid_size)
+        for beacon_id, distance in zip(beacon_ids, distances[0])
+    }
+    coverage, _ = timed(engine.update, ranges)
+    print(f"coverage pass on {side}x{side} cells: {coverage * 1e3:.1f} ms per reading")
+
+
+def jittery_trace(rng, beacons, seconds, rate, noise):
+    """Timestamped (time, beacon_id, true metres, measured metres) samples.
+
+    Half the beacons see a stationary clicker, the others one walking back
+    and forth at 1 m/s, all with Gaussian ToF noise.
+    """
+    samples = []
+    for i in range(beacons):
+        base = rng.uniform(3, 15)
+        walking = i % 2
+        for n in range(int(seconds * rate)):
+            t = n / rate + rng.random() / rate
+            true = base + (abs((t % 20) - 10) - 5 if walking else 0)
+            samples.append((t, f"b{i}", true, true + rng.gauss(0, noise)))
+    samples.sort()
+    return samples
+
+
+def bench_filters(args):
+    """Render passes and repainted cells saved by each filter on a jittery trace."""
+    rng = random.Random(0)
+    side, grid_size, cell_size, frame_rate = 200, 0.5, 4.0, 30
+    beacons, seconds, rate, noise = 20, 120, 10, 0.15
+    trace = jittery_trace(rng, beacons, seconds, rate, noise)
+    cells = {
+        f"b{i}": (rng.randrange(side), rng.randrange(side)) for i in range(beacons)
+    }
+    print(
+        f"{beacons} beacons at {rate} Hz for {seconds} s, noise {noise} m,"
+        f" dead-band 0.25 cells ({0.25 * grid_size} m)"
+    )
+    print(
+        f"{'filter':>9} {'passes':>7} {'saved':>6} {'cells':>8}"
+        f" {'error (m)':>10} {'us/sample':>10}"
+    )
+    for kind in FILTERS:
+        for dead_band in (0.0, 0.25):
+            stage = FilterStage(kind, dead_band * grid_size)
+            start = time.perf_counter()
+            for _, beacon_id, _, measured in trace:
+                stage.process(beacon_id, measured)
+            cost = (time.perf_counter() - start) / len(trace)
+
+            # Replay through the queue and coverage engine, one drain per frame
+            stage = FilterStage(kind, dead_band * grid_size)
+            queue = ReadingQueue()
+            engine = CoverageEngine(GridModel(side, side), cell_size, cell_size)
+            shown = {}
+            passes = repainted = 0
+            error = 0.0
+            frame_end = 1 / frame_rate
+            for t, beacon_id, true, measured in trace:
+                while t >= frame_end:
+                    latest = queue.drain()
+                    if latest:
+                        passes += 1
+                        indices, _ = engine.update(
+                            {
+                                b: (cells[b], d / grid_size * cell_size)
+                                for b, (d, _) in latest.items()
+                            }
+                        )
+                        repainted += len(indices)
+                        shown.update({b: d for b, (d, _) in latest.items()})
+                    frame_end += 1 / frame_rate
+                distance = stage.process(beacon_id, measured)
+                if distance is not None:
+                    queue.put(beacon_id, distance)
+                error += abs(shown.get(beacon_id, true) - true)
+
+            if kind == "None" and dead_band == 0:
+                baseline = passes
+            name = kind if dead_band == 0 else f"{kind}+db"
+            print(
+                f"{name:>9} {passes:>7} {1 - passes / baseline:>6.0%} {repainted:>8}"
+                f" {error / len(trace):>10.3f} {cost * 1e6:>10.2f}"
+            )
+
+
+class UncachedEngine(CoverageEngine):
+    """CoverageEngine before FootprintCache: a distance test per cell for every reading."""
+
+    def footprint(self, cell, radius, band=None):
+        row, col = cell
+        if radius < 0:
+            return np.empty(0, dtype=np.intp)
+        center_x = self.center_x[col]
+        center_y = self.center_y[row]
+        r0 = np.searchsorted(self.center_y, center_y - radius, side="left")
+        r1 = np.searchsorted(self.center_y, center_y + radius, side="right")
+        c0 = np.searchsorted(self.center_x, center_x - radius, side="left")
+        c1 = np.searchsorted(self.center_x, center_x + radius, side="right")
+        dx = self.center_x[c0:c1] - center_x
+        dy = self.center_y[r0:r1] - center_y
+        local_rows, local_cols = np.nonzero(
+            dy[:, None] ** 2 + dx[None, :] ** 2 <= radius**2
+        )
+        return (local_rows + r0) * self.num_cols + (local_cols + c0)
+
+    def update(self, readings):
+        return self.restore(
+            {
+                beacon_id: self.footprint(cell, radius)
+                for beacon_id, (cell, radius) in readings.items()
+            }
+        )
+
+
+def bench_footprints(args):
+    """Coverage updates on a recorded jittery trace, with and without the footprint cache."""
+    rng = random.Random(0)
+    side, grid_size, cell_size, frame_rate = 300, 0.5, 4.0, 30
+    beacons, seconds, rate, noise = 20, 120, 10, 0.15
+    trace = jittery_trace(rng, beacons, seconds, rate, noise)
+    cells = {
+        f"b{i}": (rng.randrange(side), rng.randrange(side)) for i in range(beacons)
+    }
+
+    with tempfile.TemporaryDirectory() as session_dir:
+        path = os.path.join(session_dir, "trace.session")
+        recorder = SessionRecorder(path)
+        for t, beacon_id, _, measured in trace:
+            recorder.record(f"{beacon_id}:{measured:.2f}".encode(), timestamp=t)
+        recorder.close()
+        # One coverage pass per frame with the latest raw reading of each beacon
+        frames = []
+        frame = {}
+        frame_end = 1 / frame_rate
+        for t, line in read_session(path):
+            while t >= frame_end:
+                if frame:
+                    frames.append(frame)
+                    frame = {}
+                frame_end += 1 / frame_rate
+            beacon_id, distance = line.decode().split(":")
+            radius = float(distance) / grid_size * cell_size
+            frame[beacon_id] = (cells[beacon_id], radius)
+        frames.append(frame)
+    readings = sum(len(frame) for frame in frames)
+    print(
+        f"{readings} readings from {beacons} beacons at {rate} Hz, noise {noise} m,"
+        f" in {len(frames)} frames; {side}x{side} grid of {grid_size} m cells"
+    )
+
+    def replay(engine):
+        """Seconds spent in update() and, of those, in footprint()."""
+        geometry = 0.0
+        footprint = engine.footprint
+
+        def timed_footprint(*args):
+            nonlocal geometry
+            start = time.perf_counter()
+            result = footprint(*args)
+            geometry += time.perf_counter() - start
+            return result
+
+        engine.footprint = timed_footprint
+        start = time.perf_counter()
+        for frame in frames:
+            engine.update(frame)
+        return time.perf_counter() - start, geometry
+
+    print(
+        f"{'us per reading':>22} {'update':>7} {'footprint':>10} {'tested':>7}"
+        f" {'hit rate':>9} {'entries':>8} {'KB':>6} {'evicted':>8}"
+    )
+    uncached = UncachedEngine(GridModel(side, side), cell_size, cell_size)
+    elapsed, geometry = replay(uncached)
+    print(
+        f"{'distance test per cell':>22} {elapsed / readings * 1e6:>7.1f}"
+        f" {geometry / readings * 1e6:>10.1f} {readings:>7}"
+    )
+    for label, max_bytes in (("cache", CACHE_BYTES), ("cache, 64 KB cap", 64 << 10)):
+        cache = FootprintCache(max_bytes)
+        engine = CoverageEngine(GridModel(side, side), cell_size, cell_size, cache)
+        elapsed, geometry = replay(engine)
+        assert np.array_equal(engine.counts, uncached.counts)
+        stats = cache.stats()
+        print(
+            f"{label:>22} {elapsed / readings * 1e6:>7.1f}"
+            f" {geometry / readings * 1e6:>10.1f} {stats['misses']:>7}"
+            f" {stats['hit_rate']:>9.1%} {stats['entries']:>8}"
+            f" {stats['bytes'] >> 10:>6} {stats['evictions']:>8}"
+        )
+        print(
+            f"{'':>22} {engine.unchanged} readings kept their band and footprint,"
+            f" {stats['hits']} reused cached offsets"
+        )
+
+    # A new grid with the same cell size keeps the cache; a new cell size clears it
+    CoverageEngine(GridModel(side, side), cell_size, cell_size, cache)
+    assert cache.stats()["entries"] == stats["entries"]
+    CoverageEngine(GridModel(side, side), cell_size * 2, cell_size * 2, cache)
+    assert cache.stats()["entries"] == 0
+    print("cache kept for the same cell size, cleared for a new one: ok")
+
+
+def every_cell(engine, readings):
+    """Count the beacons covering each cell by testing every cell against every beacon."""
+    counts = np.zeros((engine.num_rows, engine.num_cols), dtype=np.int32)
+    for (row, col), radius in readings.values():
+        dx = engine.center_x - engine.center_x[col]
+        dy = engine.center_y - engine.center_y[row]
+        counts += dy[:, None] ** 2 + dx[None, :] ** 2 <= radius**2
+    return np.flatnonzero(counts.ravel() >= MIN_BEACONS)
+
+
+def bench_pyramid(args):
+    """Cells covered by three or more beacons: every cell, per-beacon footprints, coarse to fine."""
+    rng = random.Random(0)
+    width, image_size, beacons = 100.0, 2000, 20  # A 100 m square floor, 2000 px wide
+    # The same beacons and radii at every grid size, in metres
+    placed = [(rng.random(), rng.random(), rng.uniform(8, 20)) for _ in range(beacons)]
+    print(
+        f"{beacons} beacons with 8-20 m radii on a {width:.0f} m square floor;"
+        f" ms per full pass"
+    )
+    print(
+        f"{'cells':>10} {'every cell':>11} {'footprints':>11} {'pyramid':>8}"
+        f" {'count':>6} {'speedup':>8} {'green':>9} {'tests':>7}"
+    )
+    for cells in (10_000, 100_000, 1_000_000, 10_000_000):
+        side = round(math.sqrt(cells))
+        cell_size = image_size / side
+        readings = {
+            f"b{i}": (
+                (int(y * side), int(x * side)),
+                metres / width * image_size,
+            )
+            for i, (x, y, metres) in enumerate(placed)
+        }
+        engine = CoverageEngine(GridModel(side, side), cell_size, cell_size)
+        repeat = args.repeat if cells < 10_000_000 else 1
+        flat, expected = timed(every_cell, engine, readings, repeat=repeat)
+
+        def footprints():
+            engine.remove(list(readings))
+            engine.update(readings)
+            return np.flatnonzero(engine.counts >= MIN_BEACONS)
+
+        counted, green = timed(footprints, repeat=repeat)
+        pyramid, covered = timed(engine.covered, repeat=args.repeat)
+        tested = engine.pyramid.tested
+        # The stats panel only needs how many, which skips listing the cells
+        total, count = timed(engine.pyramid.count, engine.bands, repeat=args.repeat)
+        assert np.array_equal(green, expected)
+        assert np.array_equal(covered, expected)
+        assert count == len(expected)
+        print(
+            f"{side * side:>10} {flat * 1e3:>11.1f} {counted * 1e3:>11.1f}"
+            f" {pyramid * 1e3:>8.1f} {total * 1e3:>6.1f} {flat / pyramid:>7.1f}x"
+            f" {len(covered):>9} {tested:>7}"
+        )
+    print("speedup is every cell over pyramid; tests are block-beacon pairs judged")
+
+
+def bench_replay(args):
+    """Record a synthetic session, check it round-trips, and replay it headless."""
+    rng = random.Random(0)
+    beacons, seconds, rate = 20, 60, 10
+    trace = jittery_trace(rng, beacons, seconds, rate, 0.15)
+    lines = [
+        f"{beacon_id}:{measured:.2f}".encode() for _, beacon_id, _, measured in trace
+    ]
+    layout = load_layout("Vitality-Metadata.png")
+
+    with tempfile.TemporaryDirectory() as session_dir:
+        path = os.path.join(session_dir, "trace.session")
+        recorder = SessionRecorder(path)
+        for (t, *_), line in zip(trace, lines):
+            recorder.record(line, timestamp=t)
+        recorder.close()
+        replayed = list(read_session(path))
+        assert [line for _, line in replayed] == lines
+        start = trace[0][0]
+        assert all(
+            abs(t - start - u) < 1e-6 for (t, *_), (u, _) in zip(trace, replayed)
+        )
+
+        raw = sum(len(line) + 1 for line in lines)
+        size = os.path.getsize(path)
+        print(
+            f"{len(lines)} lines over {seconds} s: {size / len(lines):.1f} bytes/line"
+            f" recorded, {raw / len(lines):.1f} as raw text"
+        )
+        print(
+            f"{'speed':>6} {'wall (s)':>9} {'updates/s':>10} {'frames':>7}  stages (ms)"
+        )
+        for speed in (0, 10):
+            start = time.perf_counter()
+            pipeline = run(path, layout, speed)
+            elapsed = time.perf_counter() - start
+            stages = " ".join(
+                f"{stage} {seconds * 1e3:.0f}"
+                for stage, seconds in pipeline.seconds.items()
+            )
+            print(
+                f"{speed or 'max':>6} {elapsed:>9.2f} {len(lines) / elapsed:>10.0f}"
+                f" {pipeline.frames:>7}  {stages}"
+            )
+
+
+def synthetic_plan(path, width, height):
+    """Write a CAD-like floor plan: thin dark lines on white, with layout metadata."""
+    rng = random.Random(0)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(width * height // 20_000):
+        x, y = rng.randrange(width), rng.randrange(height)
+        if rng.random() < 0.5:
+            draw.line((x, y, x + rng.randrange(2000), y), fill=(40, 40, 40), width=3)
+        else:
+            draw.line((x, y, x, y + rng.randrange(2000)), fill=(40, 40, 40), width=3)
+    metadata = PngInfo()
+    metadata.add_text("width", "150")
+    metadata.add_text("grid_size", "0.5")
+    image.save(path, "PNG", pnginfo=metadata, compress_level=1)
+
+
+def legacy_load(path, max_height):
+    """What upload_image did on the UI thread: decode everything, then LANCZOS resize."""
+    image = open_plan(path)
+    width, height = image.size
+    if height > max_height:
+        image = image.resize(
+            (int(max_height * width / height), max_height), Image.Resampling.LANCZOS
+        )
+    return image, dict(image.info)
+
+
+def cached_load(cache_dir, path, max_height):
+    plan = FloorPlanCache(cache_dir).open(path)
+    width, height = plan.size
+    return plan.fit(int(max_height * width / height), max_height), plan.info
+
+
+def bench_maps(args):
+    """Cold and warm floor-plan loads through the map cache against a plain decode."""
+    width, height = args.map_size
+    max_height = 540  # Half of a 1080p screen, as upload_image limits it
+    with tempfile.TemporaryDirectory() as map_dir:
+        path = os.path.join(map_dir, "plan.png")
+        synthetic_plan(path, width, height)
+        cache_dir = os.path.join(map_dir, "cache")
+        print(f"{width}x{height} plan, {os.path.getsize(path) / 1e6:.1f} MB PNG")
+
+        legacy, (expected, _) = timed(legacy_load, path, max_height)
+        cold, (image, info) = timed(cached_load, cache_dir, path, max_height)
+        warm, (image, info) = timed(
+            cached_load, cache_dir, path, max_height, repeat=args.repeat
+        )
+        assert image.size == expected.size and info["width"] == "150"
+
+        plan = FloorPlanCache(cache_dir).open(path)
+        window, _ = timed(
+            plan.region,
+            0,
+            width // 2,
+            height // 2,
+            width // 2 + 1200,
+            height // 2 + 800,
+            repeat=args.repeat,
+        )
+        cached = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(cache_dir)
+            for name in names
+        )
+        print(f"{'decode + LANCZOS':>22} {legacy * 1e3:>9.0f} ms (on the UI thread)")
+        print(f"{'cache cold':>22} {cold * 1e3:>9.0f} ms (worker thread)")
+        print(f"{'cache warm':>22} {warm * 1e3:>9.1f} ms (worker thread)")
+        print(f"{'1200x800 full-res view':>22} {window * 1e3:>9.1f} ms")
+        print(f"cache on disk: {cached / 1e6:.0f} MB in {len(plan.levels)} levels")
+
+
+def placed_layout(count, side):
+    """Return ({beacon_id: cell}, {beacon_id: metres}) for count random beacons."""
+    rng = random.Random(count)
+    cells = rng.sample(range(side * side), count)
+    beacons = {f"beacon-{i}": divmod(index, side) for i, index in enumerate(cells)}
+    distances = {b: rng.uniform(1, 4) for b in beacons}
+    return beacons, distances
+
+
+def legacy_layout_load(path, side, cell_size, grid_size):
+    """What apply_metadata did: eval the beacons, then recompute every footprint."""
+    with Image.open(path) as image:
+        beacons = eval(image.info["beacons"])
+        distances = eval(image.info["distances"])
+    grid = GridModel(side, side)
+    engine = CoverageEngine(grid, cell_size, cell_size)
+    for beacon_id, cell in beacons.items():
+        grid.add_beacon(beacon_id, cell)
+    engine.update(
+        {b: (cell, distances[b] / grid_size * cell_size) for b, cell in beacons.items()}
+    )
+    return engine
+
+
+def layout_load(path, side, cell_size):
+    with Image.open(path) as image:
+        layout = read_layout(image.info, path)
+    grid = GridModel(side, side)
+    engine = CoverageEngine(grid, cell_size, cell_size)
+    for beacon_id, cell in layout.beacons.items():
+        grid.add_beacon(beacon_id, cell)
+    engine.restore(layout.coverage.footprints)
+    return engine
+
+
+def bench_layout(args):
+    """Round-trip the layout format, then time layout loads against str()/eval."""
+    side, cell_size, grid_size = 500, 4.0, 0.5
+    image = Image.new("RGB", (64, 64), "white")
+
+    with tempfile.TemporaryDirectory() as layout_dir:
+        print(f"{side}x{side} cells")
+        print(
+            f"{'beacons':>8} {'eval (ms)':>10} {'layout (ms)':>12}"
+            f" {'eval (kB)':>10} {'layout (kB)':>12}"
+        )
+        for count in (10, 1000, 10_000):
+            beacons, distances = placed_layout(count, side)
+
+            # Legacy export: str() of each value in plain text chunks
+            legacy_path = os.path.join(layout_dir, f"legacy-{count}.png")
+            metadata = PngInfo()
+            metadata.add_text("beacons", str(beacons))
+            metadata.add_text("distances", str(distances))
+            image.save(legacy_path, "PNG", pnginfo=metadata)
+            legacy, expected = timed(
+                legacy_layout_load, legacy_path, side, cell_size, grid_size
+            )
+
+            layout = Layout(
+                side * grid_size,
+                side * grid_size,
+                grid_size,
+                side,
+                side,
+                beacons,
+                Coverage(distances, dict(expected.footprints.items())),
+            )
+            path = os.path.join(layout_dir, f"layout-{count}.png")
+            metadata = PngInfo()
+            metadata.add_itxt("layout", encode_layout(layout), zip=True)
+            image.save(path, "PNG", pnginfo=metadata)
+            fast, engine = timed(layout_load, path, side, cell_size, repeat=args.repeat)
+
+            # Round trip: the restored state matches the recomputed one exactly
+            assert np.array_equal(engine.counts, expected.counts)
+            assert all(
+                np.array_equal(engine.footprints.get(b), footprint)
+                for b, footprint in expected.footprints.items()
+            )
+            with Image.open(path) as saved:
+                restored = read_layout(saved.info)
+            assert restored.beacons == beacons
+            assert restored.coverage.distances == distances
+            write_sidecar(path, restored)
+            sidecar = read_layout({}, path)
+            assert sidecar.beacons == beacons and all(
+                np.array_equal(sidecar.coverage.footprints[b], footprint)
+                for b, footprint in expected.footprints.items()
+            )
+
+            print(
+                f"{count:>8} {legacy * 1e3:>10.1f} {fast * 1e3:>12.1f}"
+                f" {os.path.getsize(legacy_path) / 1e3:>10.1f}"
+                f" {os.path.getsize(path) / 1e3:>12.1f}"
+            )
+    print("round trip through the PNG chunk and the sidecar: ok")
+
+
+def linear_within(beacon_data, point, radius):
+    """Range query by scanning every beacon, as a plain dict allows."""
+    y, x = point
+    found = []
+    for beacon_id, (row, col) in beacon_data.items():
+        distance = math.hypot(row + 0.5 - y, col + 0.5 - x)
+        if distance <= radius:
+            found.append((distance, beacon_id))
+    found.sort()
+    return found
+
+
+def linear_at(beacon_data, cell):
+    """Reverse lookup by scanning every beacon, as select_cell once did."""
+    for beacon_id, beacon_cell in beacon_data.items():
+        if beacon_cell == cell:
+            return beacon_id
+    return None
+
+
+def bench_spatial(args):
+    """Check BeaconIndex against linear scans under churn, then time its queries."""
+    side = 400  # 200 m x 200 m at 0.5 m cells
+    radius = 20  # Cells, about a 10 m range
+    rng = random.Random(0)
+    print(f"{side}x{side} cells, {radius}-cell range, times per query")
+    print(
+        f"{'beacons':>8} {'query':>8} {'linear (us)':>12} {'index (us)':>11}"
+        f" {'speedup':>8}"
+    )
+    for count in (100, 10_000):
+        cells = rng.sample([(r, c) for r in range(side) for c in range(side)], count)
+        beacon_data = {f"b{i}": cell for i, cell in enumerate(cells)}
+        index = BeaconIndex(beacon_data)
+        points = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(200)]
+
+        # Churn: random moves, removals and re-adds must leave the index exact
+        for step in range(2000):
+            beacon_id = f"b{rng.randrange(count)}"
+            cell = (rng.randrange(side), rng.randrange(side))
+            if cell in index.at_cell:
+                continue
+            if beacon_id not in beacon_data:
+                index.add(beacon_id, cell)
+                beacon_data[beacon_id] = cell
+            elif step % 3 == 0:
+                index.remove(beacon_id)
+                del beacon_data[beacon_id]
+            else:
+                index.move(beacon_id, cell)
+                beacon_data[beacon_id] = cell
+        assert dict(index.items()) == beacon_data
+        for point in points:
+            assert index.within(point, radius) == linear_within(
+                beacon_data, point, radius
+            )
+            assert (
+                index.nearest(point, 3)
+                == linear_within(beacon_data, point, 2 * side)[:3]
+            )
+        for cell in list(beacon_data.values())[:100]:
+            assert index.at(cell) == linear_at(beacon_data, cell)
+
+        queries = {
+            "at": (
+                lambda: [linear_at(beacon_data, cell) for cell in cells[:200]],
+                lambda: [index.at(cell) for cell in cells[:200]],
+            ),
+            "within": (
+                lambda: [linear_within(beacon_data, p, radius) for p in points],
+                lambda: [index.within(p, radius) for p in points],
+            ),
+            "nearest": (
+                lambda: [linear_within(beacon_data, p, 2 * side)[:1] for p in points],
+                lambda: [index.nearest(p) for p in points],
+            ),
+        }
+        for name, (linear, indexed) in queries.items():
+            slow, _ = timed(linear, repeat=args.repeat)
+            fast, _ = timed(indexed, repeat=args.repeat)
+            print(
+                f"{count:>8} {name:>8} {slow / 200 * 1e6:>12.1f}"
+                f" {fast / 200 * 1e6:>11.1f} {slow / fast:>7.0f}x"
+            )
+
+        # Updates: one select_cell add and remove per beacon
+        start = time.perf_counter()
+        scratch = BeaconIndex()
+        for beacon_id, cell in beacon_data.items():
+            scratch.add(beacon_id, cell)
+        for beacon_id in beacon_data:
+            scratch.remove(beacon_id)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{count:>8} {'add+rm':>8} {'':>12}"
+            f" {elapsed / len(beacon_data) * 1e6:>11.1f}"
+        )
+    print("index matches linear scans after add/move/remove churn: ok")
+
+
+def walking_clickers(rng, beacons, count, seconds, rate, heard, noise, grid_size):
+    """Tagged serial lines from count clickers walking straight lines at 1 m/s.
+
+    Each reports its heard nearest beacons at rate Hz. Returns the timestamped
+    lines and every clicker's true final (x, y) in metres.
+    """
+    index = BeaconIndex(beacons)
+    side = max(max(cell) for cell in beacons.values()) * grid_size
+    lines = []
+    finals = {}
+    for k in range(count):
+        start = np.array([rng.uniform(0, side), rng.uniform(0, side)])
+        angle = rng.uniform(0, 2 * math.pi)
+        velocity = np.array([math.cos(angle), math.sin(angle)])
+        for n in range(int(seconds * rate)):
+            t = n / rate + rng.random() / rate
+            x, y = np.clip(start + velocity * t, 0, side)
+            for distance, beacon_id in index.nearest(
+                (y / grid_size, x / grid_size), heard
+            ):
+                measured = distance * grid_size + rng.gauss(0, noise)
+                lines.append((t, f"c{k}\t{beacon_id}:{measured:.2f}".encode()))
+        finals[f"c{k}"] = (x, y)
+    lines.sort()
+    return lines, finals
+
+
+def bench_clickers(args):
+    """Headless throughput from 1 to 64 clickers, and one batched solve against a loop."""
+    rng = random.Random(0)
+    side, grid_size, spacing = 200, 0.5, 20  # A beacon every 10 m on 100 m x 100 m
+    beacons = {
+        f"b{r}_{c}": (r, c)
+        for r in range(spacing // 2, side, spacing)
+        for c in range(spacing // 2, side, spacing)
+    }
+    layout = HeadlessLayout(
+        800, 800, side * grid_size, side * grid_size, grid_size, beacons
+    )
+    seconds, rate, heard = 30, 10, 4
+    print(
+        f"{len(beacons)} beacons, {heard} heard per reading at {rate} Hz, {seconds} s"
+    )
+    print(
+        f"{'clickers':>8} {'lines':>7} {'updates/s':>10} {'frame (ms)':>11}"
+        f" {'solve (ms)':>11} {'loop (ms)':>10} {'error (m)':>10}"
+    )
+    for count in (1, 4, 16, 64):
+        lines, finals = walking_clickers(
+            rng, beacons, count, seconds, rate, heard, 0.15, grid_size
+        )
+        with tempfile.TemporaryDirectory() as session_dir:
+            path = os.path.join(session_dir, "clickers.session")
+            recorder = SessionRecorder(path)
+            for t, line in lines:
+                recorder.record(line, timestamp=t)
+            recorder.close()
+            start = time.perf_counter()
+            pipeline = run(path, layout, 0, filter_kind="Kalman", dead_band=0)
+            elapsed = time.perf_counter() - start
+
+        clickers = [pipeline.clickers.get(device) for device in finals]
+        assert all(c.position is not None for c in clickers)
+        errors = sorted(math.dist(c.position, finals[c.device]) for c in clickers)
+        readings = {c.device: c.recent(c.last_seen) for c in clickers}
+        batched, _ = timed(
+            locate_many, pipeline.beacon_data, readings, grid_size, repeat=args.repeat
+        )
+        loop, _ = timed(
+            lambda: [
+                locate(pipeline.beacon_data, d, grid_size) for d in readings.values()
+            ],
+            repeat=args.repeat,
+        )
+        frame = sum(pipeline.seconds.values()) / pipeline.frames
+        print(
+            f"{count:>8} {len(lines):>7} {len(lines) / elapsed:>10.0f}"
+            f" {frame * 1e3:>11.2f} {batched * 1e3:>11.2f} {loop * 1e3:>10.2f}"
+            f" {errors[len(errors) // 2]:>10.2f}"
+        )
+
+
+def stub_token(ttl, serial):
+    """An unsigned JWT shaped like PocketBase's, expiring ttl seconds from now."""
+    claims = {"id": "user1", "type": "auth", "exp": int(time.time() + ttl), "n": serial}
+    parts = [{"alg": "HS256", "typ": "JWT"}, claims]
+    encoded = [
+        base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=").decode()
+        for part in parts
+    ]
+    return ".".join(encoded + ["signature"])
+
+
+class StubPocketBase(http.server.BaseHTTPRequestHandler):
+    """Password auth, token refresh and record lists, with simulated network costs."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.server.connect_delay)  # TCP + TLS handshake
+        self.server.connections += 1
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def auth(self):
+        server = self.server
+        with server.lock:
+            server.serial += 1
+            token = stub_token(server.ttl, server.serial)
+            server.tokens.add(token)
+        record = {"id": "user1", "collectionName": "users", "email": "a@b.c"}
+        self.reply(200, {"token": token, "record": record})
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or "{}")
+        time.sleep(server.delay)
+        if self.path.endswith("/auth-with-password"):
+            time.sleep(server.hash_delay)  # Password hashing on the server
+            if body.get("password") != "secret":
+                self.reply(400, {"message": "Failed to authenticate."})
+            else:
+                self.auth()
+        elif self.path.endswith("/auth-refresh"):
+            if self.headers.get("Authorization") not in server.tokens:
+                self.reply(401, {"message": "Invalid token."})
+            else:
+                server.refreshes += 1
+                self.auth()
+        else:
+            self.reply(404, {})
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        if self.headers.get("Authorization") not in self.server.tokens:
+            self.reply(401, {"message": "Invalid token."})
+            return
+        self.reply(
+            200,
+            {"page": 1, "perPage": 30, "totalItems": 0, "totalPages": 0, "items": []},
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_pocketbase(delay, hash_delay, connect_delay, ttl, handler=StubPocketBase):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.hash_delay = hash_delay
+    server.connect_delay = connect_delay
+    server.ttl = ttl
+    server.lock = threading.Lock()
+    server.tokens = set()
+    server.serial = 0
+    server.refreshes = 0
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def settle(service, seconds=10):
+    """Deliver results like the Tk loop would until one arrives; returns the time taken."""
+    start = time.perf_counter()
+    while service.results.empty() and time.perf_counter() - start < seconds:
+        time.sleep(0.001)
+    service.deliver()
+    return time.perf_counter() - start
+
+
+def bench_startup(args):
+    """Startup-to-home-page and UI-thread blocking against a stub PocketBase server."""
+    delay, hash_delay, connect_delay = 0.005, 0.1, 0.02
+    server, url = stub_pocketbase(delay, hash_delay, connect_delay, ttl=3600)
+    print(
+        f"stub server: {delay * 1e3:.0f} ms per request, {hash_delay * 1e3:.0f} ms"
+        f" password hash, {connect_delay * 1e3:.0f} ms per new connection"
+    )
+
+    with tempfile.TemporaryDirectory() as token_dir:
+        token_path = os.path.join(token_dir, "token.json")
+
+        def legacy_start():
+            # What App did on every start: a new client and a password login
+            PocketBase(url).collection("users").auth_with_password("a@b.c", "secret")
+
+        def cold_start():
+            if os.path.exists(token_path):
+                os.remove(token_path)
+            service = PocketBaseService(url, token_path)
+            assert not service.restore()
+            home = []
+            service.login("a@b.c", "secret", on_done=home.append)
+            settle(service)
+            assert home
+            service.close()
+
+        def warm_start():
+            service = PocketBaseService(url, token_path)
+            assert service.restore()
+            service.close()
+
+        legacy, _ = timed(legacy_start, repeat=args.repeat)
+        cold, _ = timed(cold_start, repeat=args.repeat)
+        mode = stat.S_IMODE(os.stat(token_path).st_mode)
+        warm, _ = timed(warm_start, repeat=args.repeat)
+        print(f"{'start':>24} {'to home page (ms)':>18}")
+        print(f"{'login every start':>24} {legacy * 1e3:>18.1f}")
+        print(f"{'service, no token':>24} {cold * 1e3:>18.1f}")
+        print(f"{'service, saved token':>24} {warm * 1e3:>18.2f}")
+        print(f"token file mode {mode:o}")
+        assert os.name != "posix" or mode == 0o600
+
+        # Twenty collection reads: how long the Tk thread is blocked, and wall time
+        calls = 20
+        print(
+            f"{f'{calls} record lists':>24} {'Tk (ms)':>10} {'done (ms)':>10}"
+            f" {'conns':>6}"
+        )
+        service = PocketBaseService(url, token_path)
+        service.restore()
+        token = service.store.token
+
+        def one_client_per_call():
+            for _ in range(calls):
+                client = PocketBase(url)
+                client.auth_store.save(token)
+                client.collection("devices").get_list()
+
+        connections = server.connections
+        blocked = done = timed(one_client_per_call)[0]
+        print(
+            f"{'new client per call':>24} {blocked * 1e3:>10.1f} {done * 1e3:>10.1f}"
+            f" {server.connections - connections:>6}"
+        )
+
+        def shared_blocking():
+            for _ in range(calls):
+                service.client.collection("devices").get_list()
+
+        connections = server.connections
+        blocked = done = timed(shared_blocking)[0]
+        print(
+            f"{'shared session, Tk':>24} {blocked * 1e3:>10.1f} {done * 1e3:>10.1f}"
+            f" {server.connections - connections:>6}"
+        )
+
+        connections = server.connections
+        results = []
+        start = time.perf_counter()
+        for _ in range(calls):
+            service.call(
+                lambda client: client.collection("devices").get_list(),
+                on_done=results.append,
+            )
+        blocked = time.perf_counter() - start
+        while len(results) < calls:
+            settle(service)
+        done = time.perf_counter() - start
+        print(
+            f"{'shared session, pool':>24} {blocked * 1e3:>10.1f} {done * 1e3:>10.1f}"
+            f" {server.connections - connections:>6}"
+        )
+        service.close()
+
+        # A short-lived token is refreshed before it expires, and saved
+        server.ttl = 2
+        os.remove(token_path)
+        service = PocketBaseService(url, token_path, refresh_margin=3600)
+        service.login("a@b.c", "secret")
+        time.sleep(1.5)
+        assert server.refreshes >= 1
+        with open(token_path) as f:
+            assert json.load(f)["token"] == service.store.token
+        assert service.store.is_valid
+        print(f"short-lived token refreshed {server.refreshes}x before expiry: ok")
+
+        # A token the server no longer accepts sends the user back to the login page
+        logged_out = []
+        service.on_logout = logged_out.append
+        server.tokens.clear()
+        service.call(
+            lambda client: client.collection("devices").get_list(),
+            on_error=lambda e: None,
+        )
+        settle(service)
+        settle(service, 1)
+        assert logged_out and not os.path.exists(token_path)
+        print("rejected token logs out and deletes the token file: ok")
+        service.close()
+    server.shutdown()
+
+
+class StubRecords(StubPocketBase):
+    """Record lists, single records with an expanded devices relation, and file downloads.
+
+    Understands just enough of PocketBase's query parameters for the
+    repository: page/perPage, `field = 'x' || ...` and `updated >= 'x'`
+    filters, `fields` and `expand=devices`.
+    """
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.delay)
+        with server.lock:
+            server.requests += 1
+        if self.headers.get("Authorization") not in server.tokens:
+            self.reply(401, {"message": "Invalid token."})
+            return
+        path, _, query = self.path.partition("?")
+        params = dict(urllib.parse.parse_qsl(query))
+        parts = path.strip("/").split("/")
+        if parts[:2] == ["api", "files"]:
+            data = server.files[parts[-1]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        records = server.collections[parts[2]]
+        if len(parts) == 5:
+            record = dict(records[parts[4]])
+            if params.get("expand") == "devices":
+                related = [server.collections[DEVICES][d] for d in record["devices"]]
+                if params.get("fields", "*").startswith("*,"):
+                    related = [
+                        {"id": d["id"], "updated": d["updated"]} for d in related
+                    ]
+                record["expand"] = {"devices": related}
+            self.reply(200, record)
+            return
+        items = sorted(records.values(), key=lambda r: (r["updated"], r["id"]))
+        if "filter" in params:
+            clauses = re.findall(r"(\w+) (>=|=) '([^']*)'", params["filter"])
+            items = [
+                r
+                for r in items
+                if any(
+                    r[field] >= value if op == ">=" else r[field] == value
+                    for field, op, value in clauses
+                )
+            ]
+        if params.get("fields") == "id":
+            items = [{"id": r["id"]} for r in items]
+        page, per_page = int(params.get("page", 1)), int(params.get("perPage", 30))
+        items = items[(page - 1) * per_page : page * per_page]
+        self.reply(200, {"page": page, "perPage": per_page, "items": items})
+
+
+def stub_timestamp(serial):
+    """PocketBase's autodate format, one millisecond per serial."""
+    seconds, millis = divmod(serial, 1000)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_790_000_000 + seconds)) + (
+        f".{millis:03d}Z"
+    )
+
+
+def stub_records(server, buildings, devices_each, map_bytes):
+    """Fill a StubRecords server with buildings, their devices and a map file each."""
+    rng = random.Random(0)
+    server.requests = 0
+    server.clock = 0
+    server.collections = {DEVICES: {}, BUILDINGS: {}}
+    server.files = {}
+
+    def touch(record):
+        server.clock += 1
+        record["updated"] = stub_timestamp(server.clock)
+
+    server.touch = touch
+    for b in range(buildings):
+        building_id = f"building{b:07d}"
+        device_ids = []
+        for d in range(devices_each):
+            device = {
+                "id": f"dev{b:04d}{d:08d}",
+                "type": rng.choice(["Clicker", "Beacon"]),
+                "building": building_id,
+                "created": "",
+            }
+            touch(device)
+            server.collections[DEVICES][device["id"]] = device
+            device_ids.append(device["id"])
+        filename = f"plan_{b}_{rng.getrandbits(40):010x}.png"
+        server.files[filename] = rng.randbytes(map_bytes)
+        building = {"id": building_id, "map": filename, "devices": device_ids}
+        touch(building)
+        server.collections[BUILDINGS][building_id] = building
+
+
+def bench_repository(args):
+    """Opening a building and syncing devices through the repository against a stub PocketBase."""
+    delay, buildings, devices_each, map_bytes = 0.005, 4, 500, 4 << 20
+    server, url = stub_pocketbase(delay, 0, 0, ttl=3600, handler=StubRecords)
+    stub_records(server, buildings, devices_each, map_bytes)
+    print(
+        f"stub server: {delay * 1e3:.0f} ms per request, {buildings} buildings of"
+        f" {devices_each} devices, {map_bytes >> 20} MB maps"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = PocketBaseService(url, os.path.join(tmp, "token.json"))
+        service.login("a@b.c", "secret").result()
+        client = service.client
+        building_id = "building0000000"
+
+        def n_plus_one():
+            # Every related record and the map, fetched one request at a time
+            building = client.send(
+                f"/api/collections/{BUILDINGS}/records/{building_id}", {}
+            )
+            devices = [
+                client.send(f"/api/collections/{DEVICES}/records/{d}", {})
+                for d in building["devices"]
+            ]
+            data = client.http_client.get(
+                client.build_url(
+                    f"/api/files/{BUILDINGS}/{building_id}/{building['map']}"
+                ),
+                headers={"Authorization": client.auth_store.token},
+            ).content
+            return building, devices, data
+
+        print(f"{'open a building':>28} {'requests':>9} {'ms':>9}")
+
+        def row(label, func):
+            requests = server.requests
+            elapsed, result = timed(func)
+            print(f"{label:>28} {server.requests - requests:>9} {elapsed * 1e3:>9.1f}")
+            return result
+
+        expected = row("one request per record", n_plus_one)[1]
+        repository = Repository(service, os.path.join(tmp, "cache"))
+        opened = row(
+            "repository, cold cache", lambda: repository.open_building(building_id)
+        )
+        assert opened.devices == expected
+        with open(opened.map_path, "rb") as f:
+            assert f.read() == server.files[opened.record["map"]]
+        row("repository, warm cache", lambda: repository.open_building(building_id))
+
+        changed = list(server.collections[DEVICES].values())[:5]
+        for device in changed:
+            device["type"] = "Beacon" if device["type"] == "Clicker" else "Clicker"
+            server.touch(device)
+        opened = row("5 devices changed", lambda: repository.open_building(building_id))
+        assert [d["type"] for d in opened.devices[:5]] == [d["type"] for d in changed]
+        repository.close()
+
+        repository = Repository(service, os.path.join(tmp, "cache"))
+        row("restarted, SQLite only", lambda: repository.open_building(building_id))
+        row("LRU warm", lambda: repository.open_building(building_id))
+        assert repository.downloads == 0
+        repository.close()
+
+        # Incremental sync of the whole devices collection
+        repository = Repository(service, os.path.join(tmp, "sync"))
+        total = len(server.collections[DEVICES])
+        print(f"{'sync devices':>28} {'requests':>9} {'ms':>9} {'changed':>8}")
+
+        def sync_row(label, func):
+            requests = server.requests
+            elapsed, changed = timed(func)
+            print(
+                f"{label:>28} {server.requests - requests:>9} {elapsed * 1e3:>9.1f}"
+                f" {changed:>8}"
+            )
+            return changed
+
+        assert (
+            sync_row(f"first sync, {total}", lambda: repository.sync(DEVICES)) == total
+        )
+        assert sync_row("nothing new", lambda: repository.sync(DEVICES)) == 0
+        for device in list(server.collections[DEVICES].values())[-20:]:
+            device["type"] = "Beacon"
+            server.touch(device)
+        assert sync_row("20 updated", lambda: repository.sync(DEVICES)) == 20
+        for device_id in list(server.collections[DEVICES])[:3]:
+            del server.collections[DEVICES][device_id]
+        assert sync_row("3 deleted (prune)", lambda: repository.prune(DEVICES)) == 3
+        assert len(repository.all(DEVICES)) == total - 3
+        repository.close()
+        service.close()
+    server.shutdown()
+
+
+def synthetic_clicks(rng, count, clickers, start, seconds, side):
+    """Yield (clicker_id, epoch, x, y) clicks in time order, each clicker walking slowly."""
+    block_seconds = 3600  # Clicks are generated an hour at a time
+    blocks = math.ceil(seconds / block_seconds)
+    per_clicker = count / clickers / blocks
+    positions = rng.uniform(0, side, (clickers, 2))
+    made = 0
+    for block in range(blocks):
+        ids, times, xs, ys = [], [], [], []
+        for c in range(clickers):
+            n = count - made if block == blocks - 1 and c == clickers - 1 else 0
+            n = n or min(rng.poisson(per_clicker), count - made)
+            made += n
+            if n == 0:
+                continue
+            walk = positions[c] + np.cumsum(rng.normal(0, 0.2, (n, 2)), axis=0)
+            walk = side - np.abs(side - np.abs(walk) % (2 * side))  # Bounce off walls
+            positions[c] = walk[-1]
+            ids.extend([f"clicker{c:03d}"] * n)
+            times.append(start + (block + np.sort(rng.random(n))) * block_seconds)
+            xs.append(walk[:, 0])
+            ys.append(walk[:, 1])
+        if not ids:
+            continue
+        times, xs, ys = np.concatenate(times), np.concatenate(xs), np.concatenate(ys)
+        order = np.argsort(times, kind="stable")
+        yield from zip(
+            np.array(ids)[order].tolist(),
+            times[order].round(3).tolist(),
+            xs[order].round(2).tolist(),
+            ys[order].round(2).tolist(),
+        )
+
+
+def copy_data_db(directory):
+    """Copy the PocketBase data.db, with its WAL, and add the click tables to it."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "data.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATA_DB + suffix):
+            shutil.copyfile(DATA_DB + suffix, path + suffix)
+    create_tables(path)
+    return path
+
+
+def raw_counts(db, start, end, clicker_id=None, span=60):
+    """Per-minute or per-hour counts straight from the clicks table, to check the rollups."""
+    bucket = "substr(click_time, 1, 17) || '00.000Z'"
+    if span == 3600:
+        bucket = "substr(click_time, 1, 14) || '00:00.000Z'"
+    query = (
+        f"SELECT {bucket}, count(*) FROM clicks"
+        " WHERE click_time >= ? AND click_time < ?"
+    )
+    params = [pb_time(start), pb_time(end)]
+    if clicker_id is not None:
+        query += " AND clicker_id = ?"
+        params.append(clicker_id)
+    rows = db.execute(query + " GROUP BY 1 ORDER BY 1", params)
+    return [(parse_time(minute), count) for minute, count in rows]
+
+
+def raw_heatmap(db, start, end, clicker_id=None):
+    query = (
+        "SELECT CAST(x AS INTEGER), CAST(y AS INTEGER), count(*) FROM clicks"
+        " WHERE click_time >= ? AND click_time < ?"
+    )
+    params = [pb_time(start), pb_time(end)]
+    if clicker_id is not None:
+        query += " AND clicker_id = ?"
+        params.append(clicker_id)
+    rows = db.execute(query + " GROUP BY 1, 2", params)
+    return {(cell_x, cell_y): count for cell_x, cell_y, count in rows}
+
+
+def bench_clicks(args):
+    """Click inserts, and range and heatmap queries from rollups, at study scale."""
+    rng = np.random.default_rng(0)
+    count, clickers, days, side = args.clicks, 50, 7, 100.0
+    start = 1_792_281_600  # A midnight, UTC
+    seconds = days * 86400
+    print(f"{count} clicks from {clickers} clickers over {days} days, 1 m cells")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # One transaction per click, as with one record per request
+        store = ClickStore(copy_data_db(os.path.join(tmp, "single")))
+        sample = list(
+            synthetic_clicks(
+                np.random.default_rng(1), 5000, clickers, start, 3600, side
+            )
+        )
+        elapsed, _ = timed(lambda: [store.add([click]) for click in sample])
+        single = len(sample) / elapsed
+        store.close()
+
+        path = copy_data_db(os.path.join(tmp, "batched"))
+        store = ClickStore(path)
+        clicks = synthetic_clicks(rng, count, clickers, start, seconds, side)
+        elapsed, added = timed(store.add, clicks)
+        assert added == count
+        rollups = [
+            store.db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+            for table in ("click_counts", "click_cells")
+        ]
+        store.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size = os.path.getsize(path)
+        print(f"{'insert':>28} {'clicks/s':>10}")
+        print(f"{'transaction per click':>28} {single:>10.0f}")
+        print(
+            f"{f'batches of {store.batch_size}':>28} {count / elapsed:>10.0f}"
+            f"   ({elapsed:.1f} s total incl. generation)"
+        )
+        print(
+            f"rollup rows: {rollups[0]} counts, {rollups[1]} cells;"
+            f" data.db {size / 1e6:.0f} MB"
+        )
+
+        day = start + 3 * 86400
+        queries = [
+            ("counts, 1 clicker, 1 day", "counts", (day, day + 86400, "clicker007")),
+            ("counts, all, 1 hour", "counts", (day, day + 3600)),
+            (
+                "hourly counts, all, study",
+                "counts",
+                (start, start + seconds, None, 3600),
+            ),
+            ("heatmap, all, 1 hour", "heatmap", (day, day + 3600)),
+            ("heatmap, all, 1 day", "heatmap", (day, day + 86400)),
+            (
+                "heatmap, 1 clicker, study",
+                "heatmap",
+                (start, start + seconds, "clicker007"),
+            ),
+        ]
+        raw = {"counts": raw_counts, "heatmap": raw_heatmap}
+        print(
+            f"{'query':>28} {'rollups (ms)':>13} {'raw scan (ms)':>14} {'speedup':>8}"
+        )
+        for label, name, query in queries:
+            fast, result = timed(getattr(store, name), *query, repeat=args.repeat)
+            slow, expected = timed(raw[name], store.db, *query)
+            assert result == expected
+            print(
+                f"{label:>28} {fast * 1e3:>13.1f} {slow * 1e3:>14.1f} {slow / fast:>7.0f}x"
+            )
+        elapsed, found = timed(
+            store.clicks, "clicker007", day, day + 600, repeat=args.repeat
+        )
+        print(
+            f"{'raw clicks, 1 clicker, 10 min':>28} {elapsed * 1e3:>13.2f}  ({len(found)} clicks)"
+        )
+        store.close()
+
+
+def check_ingest(args):
+    """Device tags survive a record and replay for POSIX and Windows port names."""
+    for device in ("/dev/ttyUSB0", "/dev/tty.usbserial-1420", "COM3", "c7", "42"):
+        for beacon_id in ("B1", "beacon-7", "5"):
+            line = tag_reading(f"{beacon_id}:2.50", device)
+            assert parse_reading(line, "other") == (device, beacon_id, 2.5), line
+    # A line that already names its device keeps it, and untagged lines take the port's
+    assert tag_reading(b"c1\tB1:1", "COM3") == b"c1\tB1:1"
+    assert parse_reading(b"B1:1", "COM3") == ("COM3", "B1", 1.0)
+    # Recordings made with the old slash separator still replay
+    assert parse_reading(b"/dev/ttyUSB0/B1:2.5") == ("/dev/ttyUSB0", "B1", 2.5)
+    assert parse_reading(b"COM3/B1:2.5") == ("COM3", "B1", 2.5)
+
+    with tempfile.TemporaryDirectory() as session_dir:
+        path = os.path.join(session_dir, "session.blv")
+        recorder = SessionRecorder(path)
+        recorder.record(tag_reading(b"B1:2.5", "/dev/ttyACM0"), 0.0)
+        recorder.close()
+        ((_, line),) = read_session(path)
+    assert parse_reading(line) == ("/dev/ttyACM0", "B1", 2.5)
+
+
+def check_soak(args):
+    """A soak of args.soak_seconds: memory stays flat and the reading queue never backs up."""
+    queue, engine, _, traced, depth = soak(args.soak_seconds)
+    growth, _, _ = soak_growth(traced)
+    assert growth < 1e6, f"memory grew by {growth / 1e6:.2f} MB"
+    # 200 readings/s at 30 fps is 7 per frame; every drain empties the queue
+    assert depth <= 8 and queue.depth() == 0, depth
+    assert queue.dropped == 0, queue.dropped
+    # One footprint per beacon, however many readings arrived
+    assert len(engine.footprints) == 20
+    assert engine.footprints.nbytes() <= 20 * len(engine.grid) * 4
+    assert engine.cache.nbytes <= engine.cache.max_bytes
+
+
+def check_layout(args):
+    """Layouts round-trip through the PNG chunk and the sidecar, legacy exports upgrade,
+    and malformed documents are rejected with ValueError before anything is built.
+    """
+    side, cell_size, grid_size = 60, 4.0, 0.5
+    beacons, distances = placed_layout(50, side)
+    engine = CoverageEngine(GridModel(side, side), cell_size, cell_size)
+    engine.update(
+        {b: (cell, distances[b] / grid_size * cell_size) for b, cell in beacons.items()}
+    )
+    footprints = dict(engine.footprints.items())
+    layout = Layout(
+        side * grid_size,
+        side * grid_size,
+        grid_size,
+        side,
+        side,
+        beacons,
+        Coverage(distances, footprints),
+    )
+    image = Image.new("RGB", (64, 64), "white")
+
+    def same(restored):
+        assert restored[:6] == layout[:6]
+        assert restored.coverage.distances == distances
+        assert restored.coverage.footprints.keys() == footprints.keys()
+        for beacon_id, footprint in footprints.items():
+            assert np.array_equal(restored.coverage.footprints[beacon_id], footprint)
+
+    with tempfile.TemporaryDirectory() as layout_dir:
+        # encode -> PNG chunk -> read, then the sidecar, which wins over the chunk
+        path = os.path.join(layout_dir, "plan.png")
+        metadata = PngInfo()
+        metadata.add_itxt(LAYOUT_KEY, encode_layout(layout), zip=True)
+        image.save(path, "PNG", pnginfo=metadata)
+        with Image.open(path) as saved:
+            same(read_layout(saved.info))
+        write_sidecar(path, layout._replace(beacons={}, coverage=None))
+        with Image.open(path) as saved:
+            assert read_layout(saved.info, path).beacons == {}
+
+        # Legacy str() exports load without eval and upgrade to the current format
+        legacy_path = os.path.join(layout_dir, "legacy.png")
+        metadata = PngInfo()
+        metadata.add_text("width", str(side * grid_size))
+        metadata.add_text("height", str(side * grid_size))
+        metadata.add_text("grid_size", str(grid_size))
+        metadata.add_text("beacons", str(beacons))
+        image.save(legacy_path, "PNG", pnginfo=metadata)
+        with Image.open(legacy_path) as saved:
+            legacy = read_layout(saved.info)
+        assert legacy == layout._replace(coverage=None)
+        assert decode_layout(encode_layout(legacy)) == legacy
+
+    # Malformed documents fail in decoding, where apply_metadata reports them
+    first, second = list(beacons)[:2]
+    off_grid = np.append(footprints[first][:-1], side * side)
+    documents = {
+        "shared cell": layout._replace(beacons={**beacons, second: beacons[first]}),
+        "cell off the grid": layout._replace(beacons={**beacons, first: (side, 0)}),
+        "footprint off the grid": layout._replace(
+            coverage=Coverage(distances, {**footprints, first: off_grid})
+        ),
+    }
+    documents = {
+        name: json.loads(encode_layout(bad)) for name, bad in documents.items()
+    }
+    document = json.loads(encode_layout(layout))
+    edits = {
+        "repeated ID": ("beacons", "ids", [first] * len(beacons)),
+        "lengths not adding up": ("coverage", "lengths", [1] * len(footprints)),
+        "missing distances": ("coverage", "distances", []),
+    }
+    for name, (part, key, value) in edits.items():
+        documents[name] = json.loads(json.dumps(document))
+        documents[name][part][key] = value
+    for name, bad in documents.items():
+        try:
+            decode_layout(json.dumps(bad))
+        except ValueError:
+            continue
+        raise AssertionError(f"a layout with a {name} was accepted")
+    for text in (
+        "{'a': (1, 1), 'b': (1, 1)}",  # Shared cell
+        "{'a': (0, 999)}",  # Off the grid
+        "{'a': 5}",  # Not a cell
+        "__import__('os')",  # Never evaluated
+    ):
+        try:
+            read_layout({"width": "10", "height": "10", "beacons": text})
+        except (ValueError, SyntaxError):
+            continue
+        raise AssertionError(f"legacy beacons {text} were accepted")
+    try:
+        BeaconIndex({first: (1, 1), second: (1, 1)})
+    except ValueError as e:
+        assert first in str(e) and second in str(e)
+    else:
+        raise AssertionError("BeaconIndex accepted a shared cell")
+
+
+CHECKS = {
+    "ingest": check_ingest,
+    "layout": check_layout,
+    "soak": check_soak,
+}
+
+
+def bench_check(args):
+    """Run the quick correctness checks, e.g. in CI; fails on the first broken one."""
+    for name, check in CHECKS.items():
+        check(args)
+        print(f"{name}: ok")
+
+
+BENCHMARKS = {
+    "check": bench_check,
+    "clicks": bench_clicks,
+    "clickers": bench_clickers,
+    "coverage": bench_coverage,
+    "filters": bench_filters,
+    "footprints": bench_footprints,
+    "grid": bench_grid,
+    "layout": bench_layout,
+    "maps": bench_maps,
+    "pyramid": bench_pyramid,
+    "replay": bench_replay,
+    "repository": bench_repository,
+    "soak": bench_soak,
+    "spatial": bench_spatial,
+    "startup": bench_startup,
+    "solver": bench_solver,
+    "updates": bench_updates,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--hours", type=float, default=1.0, help="soak duration")
+    parser.add_argument(
+        "--soak-seconds", type=float, default=120, help="soak check duration"
+    )
+    parser.add_argument("--clicks", type=int, default=10_000_000)
+    parser.add_argument(
+        "--map-size", type=int, nargs=2, default=(15_000, 10_000), help="pixels"
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
@@ -0,0 +1,127 @@
+import threading
+import time
+
+from filters import FilterStage
+
+DEFAULT_DEVICE = "local"  # Readings without a device, e.g. from the Simulate box
+ACTIVE_SECONDS = 10.0  # A clicker unheard for longer is no longer drawn
+RANGE_SECONDS = 2.0  # Older ranges are left out of a clicker's position solve
+
+
+class Clicker:
+    """One clicker's filter, latest filtered distances and solved position."""
+
+    __slots__ = (
+        "device",
+        "filter",
+        "distances",
+        "heard_at",
+        "position",
+        "rms",
+        "last_seen",
+    )
+
+    def __init__(self, device, filter_stage):
+        self.device = device
+        self.filter = filter_stage  # Used by the reader thread the clicker is on
+        self.distances = {}  # beacon_id -> latest filtered metres
+        self.heard_at = {}  # beacon_id -> timestamp of that distance
+        self.position = None  # (x, y) metres from the last solve
+        self.rms = None
+        self.last_seen = None  # Timestamp of the latest reading
+
+    def recent(self, now=None, max_age=RANGE_SECONDS):
+        """Return the distances heard within max_age, the ones a moving clicker can trust."""
+        if now is None:
+            now = time.monotonic()
+        return {
+            beacon_id: distance
+            for beacon_id, distance in self.distances.items()
+            if now - self.heard_at.get(beacon_id, now) <= max_age
+        }
+
+
+class ClickerRegistry:
+    """Every clicker heard so far, keyed by device UUID.
+
+    Reader threads look clickers up to filter their readings; the Tk thread
+    applies the drained readings and reads distances and positions.
+    """
+
+    def __init__(self, filter_kind="None", dead_band=0.0):
+        self.filter_kind = filter_kind
+        self.dead_band = dead_band
+        self._clickers = {}
+        self._lock = threading.Lock()
+        self.get(DEFAULT_DEVICE)
+
+    def __contains__(self, device):
+        return device in self._clickers
+
+    def __len__(self):
+        return len(self._clickers)
+
+    def get(self, device):
+        """Return the clicker for device, creating it on first sight."""
+        clicker = self._clickers.get(device)
+        if clicker is None:
+            with self._lock:
+                clicker = self._clickers.get(device)
+                if clicker is None:
+                    stage = FilterStage(self.filter_kind, self.dead_band)
+                    clicker = self._clickers[device] = Clicker(device, stage)
+        return clicker
+
+    def devices(self):
+        return list(self._clickers)
+
+    def configure(self, filter_kind, dead_band):
+        """Give every clicker a new filter stage of the given kind and dead-band."""
+        self.filter_kind = filter_kind
+        self.dead_band = dead_band
+        for clicker in list(self._clickers.values()):
+            # A new stage rather than mutating the one a reader thread is using
+            clicker.filter = FilterStage(filter_kind, dead_band)
+
+    def apply(self, latest):
+        """Store drained {(device, beacon_id): (distance, timestamp)} readings.
+
+        Returns {device: {beacon_id: distance}} with the new readings per clicker.
+        """
+        updates = {}
+        for (device, beacon_id), (distance, timestamp) in latest.items():
+            clicker = self.get(device)
+            clicker.distances[beacon_id] = distance
+            clicker.heard_at[beacon_id] = timestamp
+            if clicker.last_seen is None or timestamp > clicker.last_seen:
+                clicker.last_seen = timestamp
+            updates.setdefault(device, {})[beacon_id] = distance
+        return updates
+
+    def active(self, now=None):
+        """Return the clickers heard within ACTIVE_SECONDS."""
+        if now is None:
+            now = time.monotonic()
+        return [
+            clicker
+            for clicker in list(self._clickers.values())
+            if clicker.last_seen is not None
+            and now - clicker.last_seen <= ACTIVE_SECONDS
+        ]
+
+    def forget_beacon(self, beacon_id):
+        """Drop a removed beacon's distance and filter state from every clicker."""
+        for clicker in list(self._clickers.values()):
+            clicker.distances.pop(beacon_id, None)
+            clicker.heard_at.pop(beacon_id, None)
+            clicker.filter.forget(beacon_id)
+
+    def reset(self):
+        """Clear every clicker's distances and position, e.g. for a new grid."""
+        for clicker in list(self._clickers.values()):
+            clicker.distances.clear()
+            clicker.heard_at.clear()
+            clicker.position = clicker.rms = None
+
+    def suppressed(self):
+        return sum(c.filter.suppressed for c in list(self._clickers.values()))
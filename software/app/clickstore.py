@@ -0,0 +1,291 @@
+"""Click events in PocketBase's data.db, with per-minute and per-cell counts rolled up alongside.
+
+The clicks, click_counts and click_cells collections come from the
+migrations in db/pb_migrations. ClickStore writes their tables directly, in
+batched transactions, and adds each batch to the rollups in the same
+transaction, so count and heatmap queries never scan clicks.
+"""
+
+import collections
+import datetime
+import math
+import os
+import secrets
+import sqlite3
+import time
+
+DB_PATH = os.environ.get(
+    "DASHBOARD_DATA_DB",
+    os.path.join(os.path.dirname(__file__), "..", "db", "pb_data", "data.db"),
+)
+BATCH_SIZE = 20_000  # Clicks per transaction
+CELL_SIZE = 1.0  # Click coordinate units per heatmap cell
+BUSY_TIMEOUT = 10.0  # Seconds to wait while PocketBase holds the write lock
+CACHE_KIB = 65536  # SQLite page cache; the default 2 MB thrashes on large indexes
+MINUTE = 60
+HOUR = 3600
+ALL = ""  # clicker_id of the rollup rows that count every clicker
+ID_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+ID_PAIRS = [a + b for a in ID_DIGITS for b in ID_DIGITS]  # Two base-36 digits at a time
+
+# The tables PocketBase creates from the click migrations,
+# for databases it has not migrated, such as benchmark copies
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS `clicks` (
+    `id` TEXT PRIMARY KEY DEFAULT ('r'||lower(hex(randomblob(7)))) NOT NULL,
+    `clicker_id` TEXT DEFAULT '' NOT NULL,
+    `click_time` TEXT DEFAULT '' NOT NULL,
+    `x` NUMERIC DEFAULT 0 NOT NULL,
+    `y` NUMERIC DEFAULT 0 NOT NULL
+);
+CREATE INDEX IF NOT EXISTS `idx_clicks_clicker_time` ON `clicks` (`clicker_id`, `click_time`);
+CREATE TABLE IF NOT EXISTS `click_counts` (
+    `id` TEXT PRIMARY KEY DEFAULT ('r'||lower(hex(randomblob(7)))) NOT NULL,
+    `clicker_id` TEXT DEFAULT '' NOT NULL,
+    `span` NUMERIC DEFAULT 0 NOT NULL,
+    `bucket` TEXT DEFAULT '' NOT NULL,
+    `count` NUMERIC DEFAULT 0 NOT NULL,
+    `updated` TEXT DEFAULT '' NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS `idx_click_counts_key`
+    ON `click_counts` (`clicker_id`, `span`, `bucket`);
+CREATE TABLE IF NOT EXISTS `click_cells` (
+    `id` TEXT PRIMARY KEY DEFAULT ('r'||lower(hex(randomblob(7)))) NOT NULL,
+    `clicker_id` TEXT DEFAULT '' NOT NULL,
+    `span` NUMERIC DEFAULT 0 NOT NULL,
+    `bucket` TEXT DEFAULT '' NOT NULL,
+    `cell_x` NUMERIC DEFAULT 0 NOT NULL,
+    `cell_y` NUMERIC DEFAULT 0 NOT NULL,
+    `count` NUMERIC DEFAULT 0 NOT NULL,
+    `updated` TEXT DEFAULT '' NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS `idx_click_cells_key`
+    ON `click_cells` (`clicker_id`, `span`, `bucket`, `cell_x`, `cell_y`);
+"""
+
+Click = collections.namedtuple("Click", "clicker_id click_time x y")
+
+
+def create_tables(path):
+    """Create the click tables in a database PocketBase has not migrated."""
+    db = sqlite3.connect(path)
+    with db:
+        db.executescript(SCHEMA)
+    db.close()
+
+
+def _minute_text(minute):
+    return time.strftime("%Y-%m-%d %H:%M:", time.gmtime(minute * MINUTE))
+
+
+def pb_time(epoch):
+    """Format epoch seconds as a PocketBase date, e.g. 2026-10-18 09:30:05.250Z."""
+    minute, millis = divmod(round(epoch * 1000), MINUTE * 1000)
+    return f"{_minute_text(minute)}{millis / 1000:06.3f}Z"
+
+
+def parse_time(text):
+    """Epoch seconds from a PocketBase date."""
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def _base36(number, width):
+    digits = []
+    for _ in range(width):
+        number, digit = divmod(number, 36)
+        digits.append(ID_DIGITS[digit])
+    return "".join(reversed(digits))
+
+
+class ClickStore:
+    """Batched click inserts and rollup-backed count and heatmap queries.
+
+    Every click is counted per minute and per hour in click_counts, and per
+    minute and per hour in its cell in click_cells, once for its clicker and
+    once for all clickers together (clicker_id ALL). A heatmap reads hour
+    rows for the whole hours in its range and minute rows for the ends, so
+    its cost follows the hours covered rather than the clicks. Times are
+    epoch seconds; rollup queries round start down and end up to whole
+    minutes.
+    """
+
+    def __init__(self, path=DB_PATH, cell_size=CELL_SIZE, batch_size=BATCH_SIZE):
+        self.cell_size = cell_size
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")  # What PocketBase runs with
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+        self.minutes = {}  # minute number -> "YYYY-MM-DD HH:MM:" prefix
+        self.salt = _base36(secrets.randbelow(36**3), 3)  # Tells stores apart
+        self.sequence = 0
+
+    def record_ids(self, count):
+        """Return count new 15-character PocketBase record IDs, in ascending order.
+
+        Each is the time in milliseconds, this store's salt and a sequence
+        number, so new rows are appended to the end of the primary-key
+        index instead of landing on random pages of it.
+        """
+        stamp = _base36(time.time_ns() // 1_000_000, 8) + self.salt
+        first = self.sequence
+        self.sequence = (first + count) % 36**4
+        pairs = ID_PAIRS
+        return [
+            stamp + pairs[n // 1296] + pairs[n % 1296]
+            for n in ((first + i) % 36**4 for i in range(count))
+        ]
+
+    def _prefix(self, minute):
+        prefix = self.minutes.get(minute)
+        if prefix is None:
+            if len(self.minutes) > 100_000:
+                self.minutes.clear()
+            prefix = self.minutes[minute] = _minute_text(minute)
+        return prefix
+
+    def add(self, clicks):
+        """Insert (clicker_id, epoch, x, y) clicks batch_size per transaction; returns the count."""
+        added = 0
+        batch = []
+        for click in clicks:
+            batch.append(click)
+            if len(batch) == self.batch_size:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, batch):
+        rows = []
+        counts = collections.Counter()  # (clicker_id, minute, cell_x, cell_y) -> clicks
+        size = self.cell_size
+        for clicker_id, epoch, x, y in batch:
+            minute, millis = divmod(round(epoch * 1000), MINUTE * 1000)
+            rows.append(
+                (clicker_id, f"{self._prefix(minute)}{millis / 1000:06.3f}Z", x, y)
+            )
+            counts[clicker_id, minute, math.floor(x / size), math.floor(y / size)] += 1
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO clicks (id, clicker_id, click_time, x, y)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(i,) + row for i, row in zip(self.record_ids(len(rows)), rows)],
+            )
+            self._roll_up(counts)
+        return len(rows)
+
+    def _roll_up(self, counts):
+        """Add {(clicker_id, minute number, cell_x, cell_y): clicks} to the rollups."""
+        totals = collections.Counter()
+        cells = collections.Counter()
+        for (clicker_id, minute, cell_x, cell_y), count in counts.items():
+            hour = minute - minute % (HOUR // MINUTE)
+            for who in (clicker_id, ALL):
+                totals[who, MINUTE, minute] += count
+                totals[who, HOUR, hour] += count
+                cells[who, MINUTE, minute, cell_x, cell_y] += count
+                cells[who, HOUR, hour, cell_x, cell_y] += count
+        now = pb_time(time.time())
+        self.db.executemany(
+            "INSERT INTO click_counts (id, clicker_id, span, bucket, count, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (clicker_id, span, bucket)"
+            " DO UPDATE SET count = count + excluded.count, updated = excluded.updated",
+            [
+                (i, who, span, f"{self._prefix(minute)}00.000Z", count, now)
+                for i, ((who, span, minute), count) in zip(
+                    self.record_ids(len(totals)), totals.items()
+                )
+            ],
+        )
+        self.db.executemany(
+            "INSERT INTO click_cells"
+            " (id, clicker_id, span, bucket, cell_x, cell_y, count, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (clicker_id, span, bucket, cell_x, cell_y)"
+            " DO UPDATE SET count = count + excluded.count, updated = excluded.updated",
+            [
+                (i, who, span, f"{self._prefix(minute)}00.000Z", x, y, count, now)
+                for i, ((who, span, minute, x, y), count) in zip(
+                    self.record_ids(len(cells)), cells.items()
+                )
+            ],
+        )
+
+    def rebuild_rollups(self):
+        """Recount the rollups from clicks, e.g. after clicks were added through PocketBase."""
+        counts = collections.Counter()
+        size = self.cell_size
+        rows = self.db.execute("SELECT clicker_id, click_time, x, y FROM clicks")
+        for clicker_id, click_time, x, y in rows:
+            minute = int(parse_time(click_time)) // MINUTE
+            counts[clicker_id, minute, math.floor(x / size), math.floor(y / size)] += 1
+        with self.db:
+            self.db.execute("DELETE FROM click_counts")
+            self.db.execute("DELETE FROM click_cells")
+            self._roll_up(counts)
+
+    def clicks(self, clicker_id, start, end):
+        """Return one clicker's raw clicks with start <= time < end, oldest first."""
+        rows = self.db.execute(
+            "SELECT clicker_id, click_time, x, y FROM clicks"
+            " WHERE clicker_id = ? AND click_time >= ? AND click_time < ?"
+            " ORDER BY click_time",
+            (clicker_id, pb_time(start), pb_time(end)),
+        )
+        return [Click(c, parse_time(t), x, y) for c, t, x, y in rows]
+
+    def counts(self, start, end, clicker_id=None, span=MINUTE):
+        """Return [(bucket start epoch, clicks)] per minute, or per hour with span=HOUR.
+
+        Buckets without clicks are left out.
+        """
+        first = math.floor(start / span) * span
+        last = math.ceil(end / span) * span
+        rows = self.db.execute(
+            "SELECT bucket, count FROM click_counts"
+            " WHERE clicker_id = ? AND span = ? AND bucket >= ? AND bucket < ?"
+            " ORDER BY bucket",
+            (
+                ALL if clicker_id is None else clicker_id,
+                span,
+                pb_time(first),
+                pb_time(last),
+            ),
+        )
+        return [(parse_time(bucket), count) for bucket, count in rows]
+
+    def heatmap(self, start, end, clicker_id=None):
+        """Return {(cell_x, cell_y): clicks} over the minutes in range."""
+        first = math.floor(start / MINUTE) * MINUTE
+        last = math.ceil(end / MINUTE) * MINUTE
+        # Whole hours inside the range come from hour rows, the ends from minute rows
+        first_hour = math.ceil(first / HOUR) * HOUR
+        last_hour = math.floor(last / HOUR) * HOUR
+        if first_hour >= last_hour:
+            ranges = [(MINUTE, first, last)]
+        else:
+            ranges = [
+                (MINUTE, first, first_hour),
+                (HOUR, first_hour, last_hour),
+                (MINUTE, last_hour, last),
+            ]
+        who = ALL if clicker_id is None else clicker_id
+        query = " UNION ALL ".join(
+            "SELECT cell_x, cell_y, count FROM click_cells"
+            " WHERE clicker_id = ? AND span = ? AND bucket >= ? AND bucket < ?"
+            for _ in ranges
+        )
+        params = []
+        for span, low, high in ranges:
+            params += [who, span, pb_time(low), pb_time(high)]
+        rows = self.db.execute(
+            f"SELECT cell_x, cell_y, sum(count) FROM ({query}) GROUP BY cell_x, cell_y",
+            params,
+        )
+        return {(cell_x, cell_y): count for cell_x, cell_y, count in rows}
+
+    def close(self):
+        self.db.close()
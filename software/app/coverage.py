@@ -0,0 +1,449 @@
+import bisect
+import collections
+
+import numpy as np
+
+# Colour state of a cell, derived from how many beacons cover it
+NO_COVERAGE = 0
+PARTIAL_COVERAGE = 1
+FULL_COVERAGE = 2
+
+MIN_BEACONS = 3  # Beacons needed before a cell counts as fully covered
+CACHE_BYTES = 32 << 20  # Memory cap for cached footprint offsets
+
+
+class FootprintRegistry:
+    """The cells each beacon currently covers, as sorted flat indices.
+
+    Replacing or removing a footprint costs O(cells covered) and memory per
+    beacon stays bounded by its current footprint, however many readings arrive.
+    """
+
+    def __init__(self, size):
+        self._footprints = {}  # beacon_id -> sorted int32 flat indices
+        self._scratch = np.zeros(size, dtype=bool)  # All False between calls
+
+    def __contains__(self, beacon_id):
+        return beacon_id in self._footprints
+
+    def __len__(self):
+        return len(self._footprints)
+
+    def get(self, beacon_id):
+        return self._footprints.get(beacon_id)
+
+    def items(self):
+        return self._footprints.items()
+
+    def replace(self, beacon_id, footprint):
+        """Store a beacon's new footprint and return the (added, removed) cells."""
+        footprint = footprint.astype(np.int32)
+        old = self._footprints.get(beacon_id)
+        self._footprints[beacon_id] = footprint
+        if old is None:
+            return footprint, None
+
+        # Diff through a scratch mask: O(cells covered), with no sorting
+        scratch = self._scratch
+        scratch[old] = True
+        added = footprint[~scratch[footprint]]
+        scratch[old] = False
+        scratch[footprint] = True
+        removed = old[~scratch[old]]
+        scratch[footprint] = False
+        return added, removed
+
+    def covering(self, index):
+        """Return the IDs of the beacons whose footprint includes flat index."""
+        covering = []
+        for beacon_id, footprint in self._footprints.items():
+            # Footprints are sorted, so a binary search finds the cell
+            at = np.searchsorted(footprint, index)
+            if at < len(footprint) and footprint[at] == index:
+                covering.append(beacon_id)
+        return covering
+
+    def pop(self, beacon_id):
+        """Forget a beacon and return the cells it covered, or None."""
+        return self._footprints.pop(beacon_id, None)
+
+    def nbytes(self):
+        return sum(footprint.nbytes for footprint in self._footprints.values())
+
+
+class FootprintCache:
+    """Covered-cell offsets per radius band, shared by every beacon on a grid.
+
+    With evenly sized cells the offsets (d_row, d_col) a circle covers do
+    not depend on where it is centred, and they only change when the radius
+    crosses the distance to another cell center. Radii are therefore
+    quantized to a band: the number of distinct offset distances inside the
+    circle. Every radius in a band covers exactly the same cells, so the
+    cached offsets give the same footprint as testing each cell.
+    Least-recently-used bands are evicted beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.cell_width = None
+        self.cell_height = None
+        self.num_cols = None
+        self.entries = collections.OrderedDict()  # band -> offsets() result
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._limit = 0.0  # Radius the distance table reaches
+        self._distances = [0.0]  # Sorted distinct squared offset distances
+
+    def configure(self, cell_width, cell_height, num_cols):
+        """Start over if the cells changed, e.g. a new grid size or image size."""
+        if (cell_width, cell_height, num_cols) != (
+            self.cell_width,
+            self.cell_height,
+            self.num_cols,
+        ):
+            self.cell_width = cell_width
+            self.cell_height = cell_height
+            self.num_cols = num_cols
+            self.clear()
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+        self._limit = 0.0
+        self._distances = [0.0]
+
+    def _squared(self, rows, cols):
+        """Squared distances between cell centers rows and cols cells apart, in pixels."""
+        return (cols * self.cell_width) ** 2 + (rows * self.cell_height) ** 2
+
+    def band(self, radius):
+        """Return the band of a radius in pixels: how many distinct offset distances it reaches."""
+        if radius < 0:
+            return 0
+        if radius > self._limit:
+            # Grow the table geometrically so repeated growth stays cheap
+            limit = max(radius, 2 * self._limit)
+            # One extra row and column in case the division rounds down
+            rows = np.arange(int(limit // self.cell_height) + 2)
+            cols = np.arange(int(limit // self.cell_width) + 2)
+            squared = self._squared(rows[:, None], cols[None, :]).ravel()
+            self._distances = np.unique(squared[squared <= limit**2]).tolist()
+            self._limit = limit
+        return bisect.bisect_right(self._distances, radius**2)
+
+    def reach(self, band):
+        """Return the squared pixel distance a band reaches, or -1 for band 0, which covers nothing."""
+        return self._distances[band - 1] if band else -1.0
+
+    def offsets(self, radius, band=None):
+        """Return (d_rows, d_cols, flat, height, width) for the cells a circle of radius pixels covers.
+
+        The offsets are in row-major order; flat holds them as flat index
+        offsets, for circles that fit on the grid. height and width are the
+        largest |d_row| and |d_col|.
+        Pass band if it is already known, to skip looking it up again.
+        """
+        if band is None:
+            band = self.band(radius)
+        entry = self.entries.get(band)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(band)
+            return entry
+        self.misses += 1
+        if band == 0:
+            empty = np.empty(0, dtype=np.int32)
+            entry = (empty, empty, empty, 0, 0)
+        else:
+            reach = self.reach(band)
+            rows = int(radius // self.cell_height) + 1
+            cols = int(radius // self.cell_width) + 1
+            d_rows, d_cols = np.nonzero(
+                self._squared(
+                    np.arange(-rows, rows + 1)[:, None],
+                    np.arange(-cols, cols + 1)[None, :],
+                )
+                <= reach
+            )
+            d_cols = (d_cols - cols).astype(np.int32)
+            d_rows = (d_rows - rows).astype(np.int32)
+            flat = d_rows * self.num_cols + d_cols
+            entry = (d_rows, d_cols, flat, int(d_rows[-1]), int(d_cols.max()))
+        self.entries[band] = entry
+        self.nbytes += sum(part.nbytes for part in entry[:3])
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= sum(part.nbytes for part in evicted[:3])
+            self.evictions += 1
+        return entry
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+        }
+
+
+def coverage_states(counts, min_beacons=MIN_BEACONS):
+    """Return the colour state for each count of covering beacons."""
+    return np.where(counts >= min_beacons, FULL_COVERAGE, counts > 0).astype(np.int8)
+
+
+class CoveragePyramid:
+    """Coverage states of a whole grid worked out coarse to fine, from beacon bands.
+
+    The grid is split into square blocks, starting with one block over the
+    whole grid. For each block, a beacon covers either every cell, none or
+    some, judged from the nearest and farthest cell offsets in the block.
+    A block whose state is the same however its partly covered beacons fall
+    is settled whole; the others are split in four, down to single cells.
+    Work follows the edges where the state changes rather than the number
+    of cells, and the states match the per-cell distance test exactly.
+    """
+
+    def __init__(self, num_rows, num_cols, cache):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cache = cache
+        self.tested = 0  # Block-beacon pairs judged by the last call, for benchmarks
+
+    def blocks(self, bands, min_beacons=MIN_BEACONS):
+        """Return (row0, row1, col0, col1, state) arrays of settled blocks, ends exclusive.
+
+        bands maps beacon_id -> (cell, band), as CoverageEngine.bands holds
+        them. Blocks with no coverage are left out.
+        """
+        cache = self.cache
+        beacons = [(cell, cache.reach(band)) for cell, band in bands.values() if band]
+        self.tested = 0
+        if not beacons:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, empty, empty.astype(np.int8)
+        rows = np.array([cell[0] for cell, _ in beacons], dtype=np.int64)
+        cols = np.array([cell[1] for cell, _ in beacons], dtype=np.int64)
+        reach = np.array([reach for _, reach in beacons])
+
+        size = 1 << (max(self.num_rows, self.num_cols) - 1).bit_length()
+        row0 = np.zeros(1, dtype=np.int64)
+        col0 = np.zeros(1, dtype=np.int64)
+        base = np.zeros(1, dtype=np.int64)  # Beacons covering the whole block
+        # (block, beacon) pairs still to judge: only beacons that cut the parent
+        pair_block = np.zeros(len(beacons), dtype=np.int64)
+        pair_beacon = np.arange(len(beacons))
+        found = []
+        while len(row0):
+            row1 = np.minimum(row0 + size, self.num_rows)
+            col1 = np.minimum(col0 + size, self.num_cols)
+            # Nearest and farthest offsets from each beacon to a cell of its block
+            b_rows, b_cols = rows[pair_beacon], cols[pair_beacon]
+            above = row0[pair_block] - b_rows
+            below = b_rows - (row1[pair_block] - 1)
+            left = col0[pair_block] - b_cols
+            right = b_cols - (col1[pair_block] - 1)
+            near = cache._squared(
+                np.maximum(np.maximum(above, below), 0),
+                np.maximum(np.maximum(left, right), 0),
+            )
+            far = cache._squared(
+                np.maximum(np.abs(above), np.abs(below)),
+                np.maximum(np.abs(left), np.abs(right)),
+            )
+            self.tested += len(near)
+            b_reach = reach[pair_beacon]
+            whole = far <= b_reach
+            cut = (near <= b_reach) & ~whole
+
+            # Bounds on the beacons covering any one cell of each block
+            base = base + np.bincount(pair_block[whole], minlength=len(row0))
+            top = base + np.bincount(pair_block[cut], minlength=len(row0))
+            low = coverage_states(base, min_beacons)
+            done = low == coverage_states(top, min_beacons)
+            keep = done & (low != NO_COVERAGE)
+            found.append((row0[keep], row1[keep], col0[keep], col1[keep], low[keep]))
+
+            # Split the rest into quarters, dropping any that fall off the grid
+            split = np.flatnonzero(~done)
+            renumber = np.full(len(row0), -1, dtype=np.int64)
+            renumber[split] = np.arange(len(split))
+            pair_block, pair_beacon = renumber[pair_block[cut]], pair_beacon[cut]
+            keep_pair = pair_block >= 0
+            pair_block, pair_beacon = pair_block[keep_pair], pair_beacon[keep_pair]
+            row0, col0, base = row0[split], col0[split], base[split]
+            size //= 2
+            stride = len(split)
+            row0 = np.concatenate((row0, row0, row0 + size, row0 + size))
+            col0 = np.concatenate((col0, col0 + size, col0, col0 + size))
+            base = np.tile(base, 4)
+            pair_block = np.concatenate([pair_block + i * stride for i in range(4)])
+            pair_beacon = np.tile(pair_beacon, 4)
+            inside = (row0 < self.num_rows) & (col0 < self.num_cols)
+            renumber = np.cumsum(inside) - 1
+            on_grid = inside[pair_block]
+            pair_block, pair_beacon = (
+                renumber[pair_block[on_grid]],
+                pair_beacon[on_grid],
+            )
+            row0, col0, base = row0[inside], col0[inside], base[inside]
+        return tuple(np.concatenate(parts) for parts in zip(*found))
+
+    def cells(self, bands, state=FULL_COVERAGE, min_beacons=MIN_BEACONS):
+        """Return the sorted flat indices of the cells in the given state."""
+        row0, row1, col0, col1, states = self.blocks(bands, min_beacons)
+        chosen = states == state
+        row0, row1 = row0[chosen], row1[chosen]
+        col0, col1 = col0[chosen], col1[chosen]
+        # One run of flat indices per row of each block
+        heights = row1 - row0
+        firsts = np.repeat(row0 - np.cumsum(heights) + heights, heights)
+        run_rows = np.arange(heights.sum()) + firsts
+        widths = np.repeat(col1 - col0, heights)
+        starts = run_rows * self.num_cols + np.repeat(col0, heights)
+        indices = np.arange(widths.sum()) + np.repeat(
+            starts - np.cumsum(widths) + widths, widths
+        )
+        indices.sort()
+        return indices
+
+    def count(self, bands, state=FULL_COVERAGE, min_beacons=MIN_BEACONS):
+        """Return how many cells are in the given state, without listing them."""
+        row0, row1, col0, col1, states = self.blocks(bands, min_beacons)
+        chosen = states == state
+        return int(((row1 - row0) * (col1 - col0))[chosen].sum())
+
+
+class CoverageEngine:
+    """Vectorized, incremental beacon coverage over the cell centers of a grid."""
+
+    def __init__(self, grid, cell_width, cell_height, cache=None):
+        self.grid = grid
+        num_rows, num_cols = grid.num_rows, grid.num_cols
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+
+        # Cell centers in image pixels, computed once and shared by every beacon
+        self.center_x = np.arange(num_cols) * cell_width + cell_width / 2
+        self.center_y = np.arange(num_rows) * cell_height + cell_height / 2
+
+        # Number of beacons covering each cell, indexed by row * num_cols + col
+        self.counts = grid.overlap
+        self.footprints = FootprintRegistry(num_rows * num_cols)
+
+        # Shared across grids by the caller, who keeps it warm while the cell size holds
+        self.cache = FootprintCache() if cache is None else cache
+        self.cache.configure(cell_width, cell_height, num_cols)
+        self.bands = {}  # beacon_id -> (cell, band) its current footprint was made from
+        self.unchanged = 0  # Readings that stayed in their beacon's band
+        self.pyramid = CoveragePyramid(num_rows, num_cols, self.cache)
+
+    def footprint(self, cell, radius, band=None):
+        """Return the sorted flat indices of the cells whose center lies within radius pixels of cell."""
+        row, col = cell
+        d_rows, d_cols, flat, height, width = self.cache.offsets(radius, band)
+        if not len(d_rows):
+            return np.empty(0, dtype=np.intp)
+        if (
+            row - height >= 0
+            and row + height < self.num_rows
+            and col - width >= 0
+            and col + width < self.num_cols
+        ):
+            return flat + (row * self.num_cols + col)
+        # Clip a circle that reaches past the edge of the grid
+        rows = d_rows + row
+        cols = d_cols + col
+        inside = (rows >= 0) & (rows < self.num_rows)
+        inside &= (cols >= 0) & (cols < self.num_cols)
+        return rows[inside].astype(np.intp) * self.num_cols + cols[inside]
+
+    def states(self, indices):
+        """Return the colour state of the given flat cell indices."""
+        return coverage_states(self.counts[indices])
+
+    def beacons_covering(self, cell):
+        """Return the IDs of the beacons whose coverage includes cell."""
+        return self.footprints.covering(self.grid.index(cell))
+
+    def covered(self, state=FULL_COVERAGE):
+        """Return the sorted flat indices of the cells in state, e.g. the green ones.
+
+        Worked out coarse to fine from the beacons' bands; restored
+        footprints have no band, so with any of those every cell is checked.
+        """
+        if len(self.bands) == len(self.footprints):
+            return self.pyramid.cells(self.bands, state)
+        return np.flatnonzero(coverage_states(self.counts) == state)
+
+    def update(self, readings):
+        """Replace the footprints of {beacon_id: (cell, radius)} and return the state changes.
+
+        A beacon whose radius stays in the same band at the same cell keeps
+        its footprint, since it covers exactly the same cells.
+        """
+        footprints = {}
+        bands = {}
+        for beacon_id, (cell, radius) in readings.items():
+            key = (tuple(cell), self.cache.band(radius))
+            if self.bands.get(beacon_id) == key:
+                self.unchanged += 1
+                continue
+            footprints[beacon_id] = self.footprint(cell, radius, key[1])
+            bands[beacon_id] = key
+        changes = self._replace(footprints)
+        self.bands.update(bands)
+        return changes
+
+    def restore(self, footprints):
+        """Install precomputed {beacon_id: flat indices} footprints and return the state changes."""
+        for beacon_id in footprints:
+            self.bands.pop(beacon_id, None)
+        return self._replace(footprints)
+
+    def _replace(self, footprints):
+        diffs = []
+        for beacon_id, footprint in footprints.items():
+            added, removed = self.footprints.replace(beacon_id, footprint)
+            diffs.append((beacon_id, added, removed))
+        return self._apply(diffs)
+
+    def remove(self, beacon_ids):
+        """Forget the given beacons and return the state changes."""
+        diffs = []
+        for beacon_id in beacon_ids:
+            self.bands.pop(beacon_id, None)
+            old = self.footprints.pop(beacon_id)
+            if old is not None:
+                diffs.append((beacon_id, None, old))
+        return self._apply(diffs)
+
+    def _apply(self, diffs):
+        """Apply (beacon_id, added, removed) index diffs to the grid.
+
+        Returns (indices, states) for exactly the cells whose colour state
+        differs from before the call.
+        """
+        touched = [part for diff in diffs for part in diff[1:] if part is not None]
+        if not touched:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty.astype(np.int8)
+        touched = np.unique(np.concatenate(touched))
+        before = self.states(touched)
+
+        for beacon_id, added, removed in diffs:
+            # Indices within one footprint are unique, so plain fancy indexing is safe
+            if added is not None:
+                self.counts[added] += 1
+            if removed is not None:
+                self.counts[removed] -= 1
+
+        after = self.states(touched)
+        changed = before != after
+        return touched[changed], after[changed]
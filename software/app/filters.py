@@ -0,0 +1,114 @@
+import math
+
+
+class EmaFilter:
+    """Exponential moving average; alpha is the weight of the newest sample."""
+
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, sample):
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value += self.alpha * (sample - self.value)
+        return self.value
+
+
+class MedianFilter:
+    """Median of the last size samples, kept in a preallocated ring buffer."""
+
+    __slots__ = ("size", "window", "next", "count")
+
+    def __init__(self, size=5):
+        self.size = size
+        self.window = [0.0] * size
+        self.next = 0
+        self.count = 0
+
+    def update(self, sample):
+        self.window[self.next] = sample
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        # Sorting a fixed, small window keeps each sample constant-time
+        ordered = sorted(self.window[: self.count])
+        middle = self.count // 2
+        if self.count % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class KalmanFilter:
+    """1D Kalman filter for a beacon distance that drifts slowly.
+
+    process_noise is the variance the true distance gains per sample and
+    measurement_noise the variance of a ToF reading, both in square metres.
+    """
+
+    __slots__ = ("process_noise", "measurement_noise", "value", "variance")
+
+    def __init__(self, process_noise=0.01, measurement_noise=0.25):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.value = None
+        self.variance = math.inf
+
+    def update(self, sample):
+        if self.value is None:
+            self.value = sample
+            self.variance = self.measurement_noise
+            return self.value
+        variance = self.variance + self.process_noise
+        gain = variance / (variance + self.measurement_noise)
+        self.value += gain * (sample - self.value)
+        self.variance = (1 - gain) * variance
+        return self.value
+
+
+FILTERS = {
+    "None": None,
+    "EMA": EmaFilter,
+    "Median": MedianFilter,
+    "Kalman": KalmanFilter,
+}
+
+
+class FilterStage:
+    """Per-beacon smoothing between parsing and rendering.
+
+    process() returns the smoothed distance, or None when it moved less than
+    dead_band metres from the last value passed on, so jitter that would not
+    change the picture never reaches the render queue.
+    """
+
+    def __init__(self, kind="None", dead_band=0.0):
+        self.kind = kind
+        self.factory = FILTERS[kind]
+        self.dead_band = dead_band
+        self._filters = {}  # beacon_id -> filter, created on the first sample
+        self._emitted = {}  # beacon_id -> last distance passed on
+
+        self.samples = 0
+        self.suppressed = 0  # Samples held back by the dead-band
+
+    def process(self, beacon_id, distance):
+        self.samples += 1
+        if self.factory is not None:
+            smoother = self._filters.get(beacon_id)
+            if smoother is None:
+                smoother = self._filters[beacon_id] = self.factory()
+            distance = smoother.update(distance)
+
+        last = self._emitted.get(beacon_id)
+        if last is not None and abs(distance - last) < self.dead_band:
+            self.suppressed += 1
+            return None
+        self._emitted[beacon_id] = distance
+        return distance
+
+    def forget(self, beacon_id):
+        self._filters.pop(beacon_id, None)
+        self._emitted.pop(beacon_id, None)
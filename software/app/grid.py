@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class GridModel:
+    """Compact, array-backed state of every grid cell.
+
+    Cells are addressed by flat index (row * num_cols + col). Per-cell state
+    lives in typed arrays instead of one dict per cell. Which beacons cover
+    a cell is answered by the coverage engine from its footprints.
+    """
+
+    __slots__ = (
+        "num_rows",
+        "num_cols",
+        "rects",
+        "beacon",
+        "overlap",
+        "beacon_at",
+    )
+
+    def __init__(self, num_rows, num_cols):
+        size = num_rows * num_cols
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+
+        self.rects = np.zeros(size, dtype=np.int32)  # Canvas item ID, 0 if none
+        self.beacon = np.zeros(size, dtype=bool)  # Cell holds a beacon
+        self.overlap = np.zeros(size, dtype=np.int32)  # Beacons covering the cell
+
+        self.beacon_at = {}  # flat index -> beacon_id, for O(1) reverse lookup
+
+    def __len__(self):
+        return self.num_rows * self.num_cols
+
+    def index(self, cell):
+        row, col = cell
+        return row * self.num_cols + col
+
+    def beacon_id_at(self, cell):
+        return self.beacon_at.get(self.index(cell))
+
+    def add_beacon(self, beacon_id, cell):
+        index = self.index(cell)
+        self.beacon[index] = True
+        self.beacon_at[index] = beacon_id
+
+    def remove_beacon(self, cell):
+        """Clear the beacon at cell and return its ID, or None if there is none."""
+        index = self.index(cell)
+        beacon_id = self.beacon_at.pop(index, None)
+        if beacon_id is None:
+            return None
+        self.beacon[index] = False
+        return beacon_id
+
+    def nbytes(self):
+        return self.rects.nbytes + self.beacon.nbytes + self.overlap.nbytes
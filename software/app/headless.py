@@ -0,0 +1,236 @@
+"""Replay a recorded session through the visualizer's pipeline without a display.
+
+Runs the same stages as BuildingLayoutApp (parse, per-clicker filter, queue,
+coverage and tile rendering for the focused clicker, and one batched position
+solve for every clicker) and reports updates/sec, per-stage timings and peak
+memory. Example:
+
+    python headless.py trace.session --layout Vitality-Metadata.png --speed 0
+"""
+
+import argparse
+import collections
+import random
+import time
+import tracemalloc
+
+from PIL import Image
+
+from clickers import DEFAULT_DEVICE, ClickerRegistry
+from coverage import CoverageEngine
+from filters import FILTERS
+from grid import GridModel
+from ingest import ReadingQueue, parse_reading
+from layout import read_layout
+from render import HeadlessRenderer
+from session import paced, read_session
+from solver import locate_many
+from spatial import BeaconIndex
+
+STAGES = ("parse", "filter", "queue", "coverage", "render", "solve")
+
+Layout = collections.namedtuple(
+    "Layout", "image_width image_height width height grid_size beacons"
+)
+
+
+def load_layout(path):
+    """Read the dimensions and beacons an exported floor plan carries in its metadata."""
+    with Image.open(path) as image:
+        saved = read_layout(image.info, path)
+        image_width, image_height = image.size
+    if saved is None:
+        raise ValueError(f"{path} has no layout metadata")
+    return Layout(
+        image_width,
+        image_height,
+        saved.width,
+        saved.height,
+        saved.grid_size,
+        saved.beacons,
+    )
+
+
+class Pipeline:
+    """The grid, coverage and render state generate_grid builds, plus stage timers."""
+
+    def __init__(self, layout, filter_kind="None", dead_band=0.25):
+        self.layout = layout
+        num_cols = max(1, int(layout.width / layout.grid_size))
+        num_rows = max(1, int(layout.height / layout.grid_size))
+        self.cell_width = layout.image_width / num_cols
+        self.cell_height = layout.image_height / num_rows
+
+        self.grid = GridModel(num_rows, num_cols)
+        self.renderer = HeadlessRenderer(self.grid)
+        self.renderer.draw_grid(self.cell_width, self.cell_height)
+        self.coverage = CoverageEngine(self.grid, self.cell_width, self.cell_height)
+        self.clickers = ClickerRegistry(filter_kind, dead_band * layout.grid_size)
+        self.focus = None  # The first clicker heard, as the app would pick
+        self.readings = ReadingQueue()
+
+        self.beacon_data = BeaconIndex(layout.beacons)
+        for beacon_id, cell in self.beacon_data.items():
+            self.grid.add_beacon(beacon_id, cell)
+        self.rng = random.Random(0)
+        self.placed = 0  # Beacons in the session but not the layout
+
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.lines = 0
+        self.rejected = 0
+        self.frames = 0
+        self.cells_changed = 0
+
+    def place(self, beacon_id):
+        """Put a beacon the layout does not know on a free random cell."""
+        while True:
+            cell = (
+                self.rng.randrange(self.grid.num_rows),
+                self.rng.randrange(self.grid.num_cols),
+            )
+            if self.beacon_data.at(cell) is None:
+                break
+        self.beacon_data.add(beacon_id, cell)
+        self.grid.add_beacon(beacon_id, cell)
+        self.placed += 1
+
+    def feed(self, line, timestamp=None):
+        """What process_serial_data does for one raw line."""
+        self.lines += 1
+        start = time.perf_counter()
+        try:
+            reading = parse_reading(line, DEFAULT_DEVICE)
+        except ValueError:
+            reading = None
+        parsed = time.perf_counter()
+        self.seconds["parse"] += parsed - start
+        if reading is None:
+            self.rejected += 1
+            return
+
+        device, beacon_id, distance = reading
+        distance = self.clickers.get(device).filter.process(beacon_id, distance)
+        filtered = time.perf_counter()
+        self.seconds["filter"] += filtered - parsed
+        if distance is not None:
+            self.readings.put((device, beacon_id), distance, timestamp)
+            self.seconds["queue"] += time.perf_counter() - filtered
+
+    def frame(self, now=None):
+        """What render_frame, visualize_distances and draw_position do once per frame."""
+        start = time.perf_counter()
+        latest = self.readings.drain()
+        updates = self.clickers.apply(latest)
+        drained = time.perf_counter()
+        self.seconds["queue"] += drained - start
+        if not latest:
+            return
+        self.frames += 1
+        if self.focus is None:
+            self.focus = next(iter(updates))
+
+        readings = {}
+        for beacon_id, distance in updates.get(self.focus, {}).items():
+            if beacon_id not in self.beacon_data:
+                self.place(beacon_id)
+            cell = self.beacon_data[beacon_id]
+            radius = distance / self.layout.grid_size * self.cell_width
+            readings[beacon_id] = (cell, radius)
+        indices, states = self.coverage.update(readings)
+        updated = time.perf_counter()
+        self.seconds["coverage"] += updated - drained
+
+        self.renderer.paint(indices, states)
+        self.cells_changed += len(indices)
+        painted = time.perf_counter()
+        self.seconds["render"] += painted - updated
+
+        # Every clicker's position, as Position view draws them
+        for beacon_ids in updates.values():
+            for beacon_id in beacon_ids:
+                if beacon_id not in self.beacon_data:
+                    self.place(beacon_id)
+        estimates = locate_many(
+            self.beacon_data,
+            {c.device: c.recent(now) for c in self.clickers.active(now)},
+            self.layout.grid_size,
+        )
+        for device, (position, rms) in estimates.items():
+            clicker = self.clickers.get(device)
+            clicker.position, clicker.rms = position, rms
+        self.seconds["solve"] += time.perf_counter() - painted
+
+
+def run(session_path, layout, speed=0, frame_rate=30, **options):
+    """Replay a session through a new Pipeline; frames follow the recorded clock."""
+    pipeline = Pipeline(layout, **options)
+    frame_end = 1 / frame_rate
+    # Readings are stamped with the recorded clock, so staleness follows the session
+    for t, line in paced(read_session(session_path), speed):
+        while t >= frame_end:
+            pipeline.frame(frame_end)
+            frame_end += 1 / frame_rate
+        pipeline.feed(line, t)
+    pipeline.frame(frame_end)
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("session")
+    parser.add_argument("--layout", help="exported floor plan with beacon metadata")
+    parser.add_argument("--width", type=float, help="metres, overrides the layout")
+    parser.add_argument("--height", type=float, help="metres, overrides the layout")
+    parser.add_argument("--grid-size", type=float, help="metres per cell")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(1200, 900))
+    parser.add_argument(
+        "--speed", type=float, default=0, help="1 = recorded pace, 0 = max"
+    )
+    parser.add_argument("--frame-rate", type=int, default=30)
+    parser.add_argument("--filter", choices=sorted(FILTERS), default="None")
+    parser.add_argument("--dead-band", type=float, default=0.25, help="cells")
+    args = parser.parse_args()
+
+    if args.layout:
+        layout = load_layout(args.layout)
+    else:
+        layout = Layout(*args.image_size, 40.0, 30.0, 0.5, {})
+    layout = layout._replace(
+        width=args.width or layout.width,
+        height=args.height or layout.height,
+        grid_size=args.grid_size or layout.grid_size,
+    )
+    options = {"filter_kind": args.filter, "dead_band": args.dead_band}
+
+    start = time.perf_counter()
+    pipeline = run(args.session, layout, args.speed, args.frame_rate, **options)
+    elapsed = time.perf_counter() - start
+
+    # Memory from a separate untimed pass, since tracing slows everything down
+    tracemalloc.start()
+    run(args.session, layout, 0, args.frame_rate, **options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    grid = pipeline.grid
+    print(
+        f"{grid.num_rows}x{grid.num_cols} cells, {len(pipeline.beacon_data)} beacons"
+        f" ({pipeline.placed} not in the layout, placed at random)"
+    )
+    print(
+        f"{pipeline.lines} lines in {elapsed:.2f} s: {pipeline.lines / elapsed:.0f}"
+        f" updates/s, {pipeline.frames} frames, {pipeline.rejected} rejected,"
+        f" {pipeline.clickers.suppressed()} filtered,"
+        f" {sum(1 for c in pipeline.clickers.active() if c.distances)} clickers"
+    )
+    print(f"{'stage':>9} {'total (ms)':>11} {'share':>6}")
+    busy = sum(pipeline.seconds.values())
+    for stage, seconds in pipeline.seconds.items():
+        print(f"{stage:>9} {seconds * 1e3:>11.1f} {seconds / busy:>6.0%}")
+    print(f"{pipeline.cells_changed} cell state changes rendered")
+    print(f"{len(pipeline.coverage.covered())} cells fully covered at the end")
+    print(f"peak traced memory: {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import collections
+import os
+import threading
+import time
+
+# DEVICE<tab>BEACON_ID:DISTANCE names the clicker that sent a line; a tab never
+# appears in a port name such as /dev/ttyUSB0 or COM3, nor in a beacon ID
+DEVICE_SEPARATOR = "\t"
+LEGACY_SEPARATOR = "/"  # Used by older recordings: DEVICE/BEACON_ID:DISTANCE
+# Metres per tof unit in umbra's binary frames, whose text frames give centimetres
+TOF_METRES = float(os.environ.get("VISUALIZER_TOF_METRES", "0.01"))
+
+
+def parse_reading(data, device=None):
+    """Parse a serial line of the form [DEVICE<tab>]BEACON_ID:DISTANCE into (device, beacon_id, metres).
+
+    A line without a device prefix is credited to device, e.g. the port it
+    was read from. Older recordings used DEVICE/BEACON_ID:DISTANCE, split at
+    the last slash so /dev/tty* devices survive. Returns None for lines in
+    any other format and raises ValueError when the distance is not a number.
+    """
+    # Decode bytes if necessary, then strip unwanted characters
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    data = data.strip()
+    if ":" not in data:
+        return None
+    if DEVICE_SEPARATOR in data:
+        device, data = data.split(DEVICE_SEPARATOR, 1)
+    elif LEGACY_SEPARATOR in data.partition(":")[0]:
+        device, data = data.rsplit(LEGACY_SEPARATOR, 1)
+    beacon_id, distance = data.split(":")
+    return device, beacon_id, float(distance)
+
+
+def payload_readings(payload):
+    """Return [(device, beacon_id, metres)] for an umbra /api/click payload.
+
+    Text frames range each beacon in centimetres; binary frames give a tof,
+    scaled by TOF_METRES.
+    """
+    device = str(payload["clicker_id"])
+    readings = []
+    for beacon in payload["beacons"]:
+        if "centimeter" in beacon:
+            beacon_id, metres = beacon["beacon_id"], beacon["centimeter"] / 100
+        else:
+            beacon_id, metres = beacon["uuid"], beacon["tof"] * TOF_METRES
+        readings.append((device, str(beacon_id).strip(), metres))
+    return readings
+
+
+def tag_reading(data, device):
+    """Prefix a raw line with device unless it already names one, e.g. before recording it."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if device is None or DEVICE_SEPARATOR.encode() in data:
+        return data
+    return device.encode("utf-8") + DEVICE_SEPARATOR.encode() + data
+
+
+class ReadingQueue:
+    """Bounded, thread-safe buffer of (key, distance, timestamp) readings.
+
+    Reader threads put parsed readings in; the Tk main loop drains them once
+    per frame. When the buffer is full the oldest reading is dropped, since a
+    newer reading for the same key supersedes it anyway.
+    """
+
+    def __init__(self, maxlen=4096):
+        self.maxlen = maxlen
+        self._buffer = collections.deque()
+        self._lock = threading.Lock()
+
+        self.received = 0  # Readings put into the queue
+        self.dropped = 0  # Readings discarded because the queue was full
+        self.merged = 0  # Readings superseded by a newer one in the same frame
+
+    def put(self, key, distance, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            if len(self._buffer) >= self.maxlen:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append((key, distance, timestamp))
+            self.received += 1
+
+    def drain(self):
+        """Take everything queued and return {key: (distance, timestamp)} with the latest value per key.
+
+        The key is a beacon ID, or a (device, beacon_id) pair with several clickers.
+        """
+        with self._lock:
+            readings, self._buffer = self._buffer, collections.deque()
+
+        latest = {}
+        for key, distance, timestamp in readings:
+            latest[key] = (distance, timestamp)
+        self.merged += len(readings) - len(latest)
+        return latest
+
+    def depth(self):
+        return len(self._buffer)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "received": self.received,
+            "dropped": self.dropped,
+            "merged": self.merged,
+        }
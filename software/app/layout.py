@@ -0,0 +1,179 @@
+"""Versioned layout metadata for exported floor plans.
+
+A layout is JSON, stored zlib-compressed in an iTXt chunk of the exported
+PNG and optionally in a gzip sidecar next to the image (plan.png.layout),
+which can be rewritten without re-encoding a large plan. It never goes
+through eval: beacon cells and the optional coverage cache are plain
+numbers or base64-encoded int32 arrays.
+"""
+
+import ast
+import base64
+import collections
+import gzip
+import json
+import os
+import zlib
+
+import numpy as np
+from PIL import PngImagePlugin
+
+FORMAT_VERSION = 1
+LAYOUT_KEY = "layout"  # PNG text chunk holding the layout
+SIDECAR_SUFFIX = ".layout"
+LEGACY_KEYS = ("width", "height", "grid_size", "beacons")  # str()/eval exports
+
+# Pillow refuses text chunks over 1 MB by default; a coverage cache can be larger
+PngImagePlugin.MAX_TEXT_CHUNK = max(PngImagePlugin.MAX_TEXT_CHUNK, 256 << 20)
+PngImagePlugin.MAX_TEXT_MEMORY = max(PngImagePlugin.MAX_TEXT_MEMORY, 256 << 20)
+
+Layout = collections.namedtuple(
+    "Layout", "width height grid_size num_rows num_cols beacons coverage"
+)
+# distances: {beacon_id: metres}; footprints: {beacon_id: flat cell indices}
+Coverage = collections.namedtuple("Coverage", "distances footprints")
+
+
+def _pack(array):
+    data = np.ascontiguousarray(array, dtype="<i4").tobytes()
+    return base64.b64encode(zlib.compress(data)).decode("ascii")
+
+
+def _unpack(text):
+    return np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype="<i4")
+
+
+def encode_layout(layout):
+    """Serialize a Layout to a JSON string."""
+    ids = list(layout.beacons)
+    document = {
+        "version": FORMAT_VERSION,
+        "width": layout.width,
+        "height": layout.height,
+        "grid_size": layout.grid_size,
+        "num_rows": layout.num_rows,
+        "num_cols": layout.num_cols,
+        "beacons": {
+            "ids": ids,
+            "cells": _pack([layout.beacons[b] for b in ids]),
+        },
+    }
+    if layout.coverage is not None:
+        covered = [b for b in ids if b in layout.coverage.footprints]
+        footprints = [layout.coverage.footprints[b] for b in covered]
+        document["coverage"] = {
+            "ids": covered,
+            "distances": [layout.coverage.distances[b] for b in covered],
+            "lengths": [len(footprint) for footprint in footprints],
+            "cells": _pack(np.concatenate(footprints) if footprints else []),
+        }
+    return json.dumps(document, separators=(",", ":"))
+
+
+def decode_layout(text):
+    """Parse a JSON layout written by encode_layout(); raises ValueError if it is not one."""
+    document = json.loads(text)
+    version = document.get("version") if isinstance(document, dict) else None
+    if not isinstance(version, int) or version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported layout version: {version}")
+    try:
+        return _decode_document(document)
+    except (KeyError, TypeError, zlib.error) as e:
+        raise ValueError(f"Malformed layout: {e!r}") from e
+
+
+def _check_beacons(beacons, num_rows, num_cols):
+    """Raise ValueError unless every beacon has a cell of its own inside the grid."""
+    placed = {}
+    for beacon_id, (row, col) in beacons.items():
+        if not (0 <= row < num_rows and 0 <= col < num_cols):
+            raise ValueError(
+                f"Beacon {beacon_id} at {(row, col)} is outside the"
+                f" {num_rows}x{num_cols} grid"
+            )
+        other = placed.setdefault((row, col), beacon_id)
+        if other != beacon_id:
+            raise ValueError(f"Beacons {other} and {beacon_id} share cell {(row, col)}")
+
+
+def _decode_document(document):
+    num_rows = int(document["num_rows"])
+    num_cols = int(document["num_cols"])
+    ids = document["beacons"]["ids"]
+    cells = _unpack(document["beacons"]["cells"]).reshape(-1, 2).tolist()
+    if len(cells) != len(ids) or len(set(ids)) != len(ids):
+        raise ValueError("Layout beacon IDs and cells do not match")
+    beacons = {beacon_id: tuple(cell) for beacon_id, cell in zip(ids, cells)}
+    _check_beacons(beacons, num_rows, num_cols)
+
+    coverage = None
+    if "coverage" in document:
+        saved = document["coverage"]
+        cells = _unpack(saved["cells"])
+        lengths = saved["lengths"]
+        if not len(saved["ids"]) == len(lengths) == len(saved["distances"]):
+            raise ValueError("Layout coverage columns do not match")
+        if min(lengths, default=0) < 0 or sum(lengths) != len(cells):
+            raise ValueError("Layout coverage lengths do not match its cells")
+        # Restoring writes straight into the grid's arrays, so check every index
+        if len(cells) and (cells.min() < 0 or cells.max() >= num_rows * num_cols):
+            raise ValueError("Layout coverage has cells outside the grid")
+        ends = np.cumsum(lengths)
+        footprints = dict(zip(saved["ids"], np.split(cells, ends[:-1])))
+        coverage = Coverage(dict(zip(saved["ids"], saved["distances"])), footprints)
+
+    return Layout(
+        float(document["width"]),
+        float(document["height"]),
+        float(document["grid_size"]),
+        num_rows,
+        num_cols,
+        beacons,
+        coverage,
+    )
+
+
+def decode_legacy(metadata):
+    """Read the separate width/height/grid_size/beacons text chunks of older exports.
+
+    The beacons were written with str(dict), so they are parsed as a Python
+    literal rather than evaluated.
+    """
+    width = float(metadata["width"])
+    height = float(metadata["height"])
+    grid_size = float(metadata.get("grid_size", 0.5))
+    num_rows = max(1, int(height / grid_size))
+    num_cols = max(1, int(width / grid_size))
+    try:
+        beacons = ast.literal_eval(metadata.get("beacons", "{}"))
+        beacons = {str(b): tuple(cell) for b, cell in beacons.items()}
+        _check_beacons(beacons, num_rows, num_cols)
+    except (AttributeError, TypeError) as e:
+        raise ValueError(f"Malformed legacy beacons: {e!r}") from e
+    return Layout(width, height, grid_size, num_rows, num_cols, beacons, None)
+
+
+def sidecar_path(image_path):
+    return image_path + SIDECAR_SUFFIX
+
+
+def write_sidecar(image_path, layout):
+    path = sidecar_path(image_path)
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        f.write(encode_layout(layout))
+    os.replace(path + ".tmp", path)
+
+
+def read_layout(metadata, image_path=None):
+    """Return the Layout for an image from its sidecar, its layout chunk or legacy chunks.
+
+    Returns None if the image carries no layout at all.
+    """
+    if image_path is not None and os.path.exists(sidecar_path(image_path)):
+        with gzip.open(sidecar_path(image_path), "rt", encoding="utf-8") as f:
+            return decode_layout(f.read())
+    if LAYOUT_KEY in metadata:
+        return decode_layout(metadata[LAYOUT_KEY])
+    if "width" in metadata and "height" in metadata:
+        return decode_legacy(metadata)
+    return None
@@ -1,10 +1,55 @@
+import json
+import os
+import queue
+import socket
 import threading  # For running the serial reader in a separate thread
+import time
 import tkinter as tk
 from tkinter import filedialog, simpledialog
 import serial  # Newly added for serial communication
-from PIL import Image, ImageTk
+from PIL import ImageTk
 from PIL.PngImagePlugin import PngInfo
 
+import metrics
+from clickers import DEFAULT_DEVICE, ClickerRegistry
+from coverage import CoverageEngine, FootprintCache
+from filters import FILTERS
+from grid import GridModel
+from ingest import ReadingQueue, parse_reading, payload_readings, tag_reading
+from layout import (
+    LAYOUT_KEY,
+    LEGACY_KEYS,
+    Coverage,
+    Layout,
+    encode_layout,
+    read_layout,
+    sidecar_path,
+    write_sidecar,
+)
+from mapcache import FloorPlanCache
+from render import RENDERERS
+from session import SessionRecorder, replay
+from solver import locate_many, nearest_beacon
+from spatial import BeaconIndex
+
+FRAME_INTERVAL_MS = 33  # Render queued serial readings at roughly 30 fps
+VIEW_MODES = ("Coverage", "Position")
+STATS_INTERVAL_MS = 1000  # Stats panel refresh while metrics are on
+METRICS_PATH = os.environ.get("VISUALIZER_METRICS", "visualizer-metrics.json")
+MAP_CACHE_DIR = os.environ.get("VISUALIZER_MAP_CACHE", ".map-cache")
+SUBSCRIBE_ADDRESS = os.environ.get("VISUALIZER_SUBSCRIBE", "127.0.0.1:8765")
+
+SERIAL_READ_TIME = metrics.timer("serial.read")
+SERIAL_LINES = metrics.counter("serial.lines")
+FILTER_TIME = metrics.timer("filter")
+COVERAGE_TIME = metrics.timer("coverage")
+SOLVE_TIME = metrics.timer("solve")
+PAINT_TIME = metrics.timer("render.paint")
+CANVAS_TIME = metrics.timer("render.canvas")
+FRAME_TIME = metrics.timer("frame")
+SUBSCRIBE_LATENCY = metrics.histogram("subscribe.latency")  # umbra's read to here
+SCREEN_LATENCY = metrics.histogram("subscribe.screen")  # umbra's read to drawn
+
 
 class BuildingLayoutApp:
 
@@ -15,17 +60,37 @@ class BuildingLayoutApp:
 
         # Initialize variables
         self.image = None
+        self.image_path = None  # File the floor plan was loaded from
         self.canvas = None
         self.canvas_image = None
-        self.cells = []
-        self.beacon_cells = []
-        self.beacon_data = {}  # To store beacon IDs and coordinates
+        self.grid = None  # Per-cell state, created by generate_grid
+        self.beacon_data = BeaconIndex()  # Beacon IDs and cells, spatially indexed
         self.grid_size = 0.5  # Default grid size
+        self.coverage = None  # Coverage engine, created by generate_grid
+        self.footprint_cache = (
+            FootprintCache()
+        )  # Kept across grids of the same cell size
+        self.renderer = None  # Draws the grid, created by generate_grid
+        self.clickers = ClickerRegistry()  # Filters, distances and position per device
+        self.focus = DEFAULT_DEVICE  # Clicker whose coverage is shaded
+        self.known_clickers = 1  # Clickers already in the Clicker menu
+        self.distances = self.clickers.get(DEFAULT_DEVICE).distances  # The focus's
+        self.readings = ReadingQueue()  # Filled by the serial thread, drained per frame
+        self.recorder = None  # Set while raw serial lines are being recorded
+        self.subscribe_read_at = None  # When umbra read the oldest frame not yet drawn
+        self.subscribe_address = None  # (host, port) the subscriber thread connects to
+        self.subscribe_sock = None  # Its current connection, if any
+        self.subscriber_thread = None  # Started by the first Subscribe click
+        self.dumper = None  # Writes METRICS_PATH while metrics are on
+        self.profiler = metrics.Profiler()
+        self.frame_time = 0.0  # Seconds spent rendering the last frame
+        self.ui_tasks = queue.Queue()  # Callables from worker threads, run per frame
 
         # Create UI elements
         self.create_ui()
 
         # Serial reader will be initiated by the user via the "Start Serial Reader" button
+        self.root.after(FRAME_INTERVAL_MS, self.render_frame)
 
         # Beacon simulation functionality
         self.beacon_circles = {}  # Dictionary to track visualized distances
@@ -46,6 +111,11 @@ class BuildingLayoutApp:
         )
         self.export_button.pack()
 
+        self.save_layout_button = tk.Button(
+            self.root, text="Save Layout", command=self.save_layout
+        )
+        self.save_layout_button.pack()
+
         self.close_button = tk.Button(
             self.root, text="Close", command=self.root.destroy
         )
@@ -70,6 +140,28 @@ class BuildingLayoutApp:
         self.grid_size_entry.insert(0, "0.5")  # Default value
         self.grid_size_entry.grid(row=0, column=1)
 
+        # Items draws one rectangle per cell, Image composites the grid into tiles
+        tk.Label(grid_size_frame, text="Render:").grid(row=0, column=2)
+        self.render_mode = tk.StringVar(value="Items")
+        tk.OptionMenu(grid_size_frame, self.render_mode, *RENDERERS).grid(
+            row=0, column=3
+        )
+
+        # Coverage shades cells in range, Position marks the solved location only
+        tk.Label(grid_size_frame, text="View:").grid(row=0, column=4)
+        self.view_mode = tk.StringVar(value="Coverage")
+        tk.OptionMenu(
+            grid_size_frame, self.view_mode, *VIEW_MODES, command=self.set_view_mode
+        ).grid(row=0, column=5)
+
+        # Clickers are added as they are heard; coverage follows the selected one
+        tk.Label(grid_size_frame, text="Clicker:").grid(row=0, column=6)
+        self.clicker_var = tk.StringVar(value=DEFAULT_DEVICE)
+        self.clicker_menu = tk.OptionMenu(
+            grid_size_frame, self.clicker_var, DEFAULT_DEVICE, command=self.set_focus
+        )
+        self.clicker_menu.grid(row=0, column=7)
+
         self.generate_grid_button = tk.Button(
             self.root, text="Generate Grid", command=self.generate_grid
         )
@@ -79,8 +171,9 @@ class BuildingLayoutApp:
         serial_frame = tk.Frame(self.root)
         serial_frame.pack()
 
-        tk.Label(serial_frame, text="COM Port:").grid(row=0, column=0)
-        self.com_port_entry = tk.Entry(serial_frame, width=10)
+        # Several ports, comma-separated, are read concurrently, one clicker each
+        tk.Label(serial_frame, text="COM Ports:").grid(row=0, column=0)
+        self.com_port_entry = tk.Entry(serial_frame, width=20)
         self.com_port_entry.insert(0, "COM3")  # Default COM port
         self.com_port_entry.grid(row=0, column=1)
 
@@ -94,6 +187,55 @@ class BuildingLayoutApp:
         )
         self.start_serial_button.grid(row=0, column=4)
 
+        # Or subscribe to the frames a running umbra, which owns the ports, republishes
+        tk.Label(serial_frame, text="umbra:").grid(row=1, column=0)
+        self.subscribe_entry = tk.Entry(serial_frame, width=20)
+        self.subscribe_entry.insert(0, SUBSCRIBE_ADDRESS)
+        self.subscribe_entry.grid(row=1, column=1)
+
+        self.subscribe_button = tk.Button(
+            serial_frame, text="Subscribe", command=self.start_subscriber
+        )
+        self.subscribe_button.grid(row=1, column=4)
+
+        self.ingest_label = tk.Label(serial_frame, text="")
+        self.ingest_label.grid(row=2, column=0, columnspan=5)
+
+        # Smoothing for serial distances; changes within the dead-band are not redrawn
+        filter_frame = tk.Frame(self.root)
+        filter_frame.pack()
+
+        tk.Label(filter_frame, text="Filter:").grid(row=0, column=0)
+        self.filter_mode = tk.StringVar(value="None")
+        tk.OptionMenu(
+            filter_frame, self.filter_mode, *FILTERS, command=self.configure_filter
+        ).grid(row=0, column=1)
+
+        tk.Label(filter_frame, text="Dead-band (cells):").grid(row=0, column=2)
+        self.dead_band_entry = tk.Entry(filter_frame, width=5)
+        self.dead_band_entry.insert(0, "0.25")  # Default value
+        self.dead_band_entry.grid(row=0, column=3)
+        self.dead_band_entry.bind("<Return>", self.configure_filter)
+
+        # Record raw serial lines, or feed a recording back in instead of a device
+        session_frame = tk.Frame(self.root)
+        session_frame.pack()
+
+        self.record_button = tk.Button(
+            session_frame, text="Record Session", command=self.toggle_recording
+        )
+        self.record_button.grid(row=0, column=0)
+
+        self.replay_button = tk.Button(
+            session_frame, text="Replay Session", command=self.start_replay
+        )
+        self.replay_button.grid(row=0, column=1)
+
+        tk.Label(session_frame, text="Speed (0 = max):").grid(row=0, column=2)
+        self.replay_speed_entry = tk.Entry(session_frame, width=5)
+        self.replay_speed_entry.insert(0, "1")  # Default value
+        self.replay_speed_entry.grid(row=0, column=3)
+
         # Input for beacon simulation
         beacon_simulation_frame = tk.Frame(self.root)
         beacon_simulation_frame.pack()
@@ -113,41 +255,74 @@ class BuildingLayoutApp:
         )
         self.simulate_button.grid(row=0, column=4)
 
+        # Metrics switch the stats panel on; Profile captures the UI thread
+        metrics_frame = tk.Frame(self.root)
+        metrics_frame.pack()
+
+        self.metrics_enabled = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            metrics_frame,
+            text="Metrics",
+            variable=self.metrics_enabled,
+            command=self.toggle_metrics,
+        ).grid(row=0, column=0)
+
+        self.profile_enabled = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            metrics_frame,
+            text="Profile",
+            variable=self.profile_enabled,
+            command=self.toggle_profile,
+        ).grid(row=0, column=1)
+
         # Listbox for active beacons and distances
         self.beacon_listbox = tk.Listbox(self.root, height=10, width=50)
         self.beacon_listbox.pack(side=tk.LEFT, fill=tk.Y, padx=10, pady=10)
 
+        self.stats_label = tk.Label(
+            self.root, text="", justify=tk.LEFT, anchor=tk.NW, font=("Courier", 9)
+        )
+        self.stats_label.pack(side=tk.LEFT, fill=tk.Y, padx=10, pady=10)
+
     def upload_image(self):
-        """Upload and display an image on the canvas while resizing canvas to fit the image."""
+        """Load a floor plan off the UI thread, then display it scaled to fit the screen."""
         file_path = filedialog.askopenfilename(
             filetypes=[("Image files", "*.png;*.jpg;*.jpeg")]
         )
         if not file_path:
             print("No file selected.")
             return
-        try:
-            uploaded_img = Image.open(file_path)
-
-            # Get screen dimensions
-            screen_height = self.root.winfo_screenheight()
-
-            # Limit image height to half of the screen
-            max_height = screen_height // 2
-            img_width, img_height = uploaded_img.size
-            if img_height > max_height:
-                aspect_ratio = img_width / img_height
-                img_height = max_height
-                img_width = int(max_height * aspect_ratio)
-                uploaded_img = uploaded_img.resize(
-                    (img_width, img_height), Image.Resampling.LANCZOS
-                )
 
-            self.image = uploaded_img
+        # Limit image height to half of the screen
+        max_height = self.root.winfo_screenheight() // 2
+
+        def load():
+            try:
+                # Decoded once into the map cache; later loads read one small level
+                plan = FloorPlanCache(MAP_CACHE_DIR).open(file_path)
+                img_width, img_height = plan.size
+                if img_height > max_height:
+                    aspect_ratio = img_width / img_height
+                    img_height = max_height
+                    img_width = int(max_height * aspect_ratio)
+                image = plan.fit(img_width, img_height)
+                self.ui_tasks.put(lambda: self.show_image(file_path, image, plan.info))
+            except Exception as e:
+                print(f"Error uploading image: {e}")
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def show_image(self, file_path, image, metadata):
+        """Display a loaded floor plan on the canvas and apply its layout metadata."""
+        try:
+            self.image = image
+            self.image_path = file_path
+            img_width, img_height = image.size
 
             # Adjust canvas size to fit the image
             self.canvas.config(width=img_width, height=img_height)
 
-            self.canvas_image = ImageTk.PhotoImage(uploaded_img)
+            self.canvas_image = ImageTk.PhotoImage(image)
 
             # Calculate horizontal offset to center the image if necessary
             offset_x = max((self.canvas.winfo_width() - img_width) // 2, 0)
@@ -161,21 +336,8 @@ class BuildingLayoutApp:
             )
             print(f"Image uploaded successfully: {file_path}")
 
-            # Check for all metadata and dynamically apply settings
-            metadata = {}
-            for key, value in uploaded_img.info.items():
-                try:
-                    # Decode metadata bytes, if applicable
-                    decoded_value = (
-                        value.decode("utf-8") if isinstance(value, bytes) else value
-                    )
-                    metadata[key] = decoded_value
-                except Exception:
-                    print(f"Failed to decode metadata key {key}: {value}")
-            if metadata:
-                self.apply_metadata(metadata)
-            else:
-                print("No metadata found in the image.")
+            # Restore the layout from a sidecar or the image's own metadata
+            self.apply_metadata(metadata, file_path)
         except Exception as e:
             print(f"Error uploading image: {e}")
 
@@ -186,6 +348,9 @@ class BuildingLayoutApp:
             return
 
         try:
+            layout = self.current_layout()
+            if layout is None:
+                return
             file_path = filedialog.asksaveasfilename(
                 defaultextension=".png", filetypes=[("PNG files", "*.png")]
             )
@@ -195,133 +360,372 @@ class BuildingLayoutApp:
             # Create a copy of the existing image
             export_image = self.image.copy()
 
-            # Embed metadata into image (as a dictionary)
-            metadata = {
-                "width": self.width_entry.get(),
-                "height": self.height_entry.get(),
-                "grid_size": self.grid_size_entry.get(),
-                "beacons": self.beacon_data,
-            }
-
-            # Save the image as PNG with metadata
+            # Save the image as PNG with the layout embedded
             export_image.save(
-                file_path, "PNG", pnginfo=self.create_png_metadata(metadata)
+                file_path, "PNG", pnginfo=self.create_png_metadata(layout)
             )
             print(f"Image exported successfully with metadata to {file_path}.")
         except Exception as e:
             print(f"Error during export: {e}")
 
-    def create_png_metadata(self, metadata):
-        """Create a PNGInfo object with metadata."""
+    def save_layout(self):
+        """Write the layout to a sidecar next to the loaded image, without re-encoding it."""
+        if self.image_path is None:
+            print("No image available to save a layout for.")
+            return
+        layout = self.current_layout()
+        if layout is None:
+            return
+        try:
+            write_sidecar(self.image_path, layout)
+            print(f"Layout saved to {sidecar_path(self.image_path)}.")
+        except OSError as e:
+            print(f"Error saving layout: {e}")
+
+    def current_layout(self):
+        """Return the grid, beacons and current coverage as a Layout, or None without a grid."""
+        if self.grid is None:
+            print("Please generate a grid first.")
+            return None
+        try:
+            width = float(self.width_entry.get())
+            height = float(self.height_entry.get())
+        except ValueError:
+            print("Invalid width or height. Please provide valid dimensions.")
+            return None
+        coverage = Coverage(
+            dict(self.distances), dict(self.coverage.footprints.items())
+        )
+        return Layout(
+            width,
+            height,
+            self.grid_size,
+            self.grid.num_rows,
+            self.grid.num_cols,
+            dict(self.beacon_data),
+            coverage,
+        )
+
+    def create_png_metadata(self, layout):
+        """Create a PNGInfo object holding the layout as a compressed text chunk."""
 
         png_metadata = PngInfo()
-        for key, value in metadata.items():
-            png_metadata.add_text(key, str(value))
+        png_metadata.add_itxt(LAYOUT_KEY, encode_layout(layout), zip=True)
         return png_metadata
 
-    def apply_metadata(self, metadata):
-        """Apply metadata settings to the visualizer."""
+    def apply_metadata(self, metadata, image_path=None):
+        """Restore the grid, beacons and any saved coverage from an image's layout."""
         try:
-            # Apply known keys dynamically where applicable
-            if "width" in metadata:
-                self.width_entry.delete(0, tk.END)
-                self.width_entry.insert(0, metadata["width"])
-            if "height" in metadata:
-                self.height_entry.delete(0, tk.END)
-                self.height_entry.insert(0, metadata["height"])
-            if "grid_size" in metadata:
-                self.grid_size_entry.delete(0, tk.END)
-                self.grid_size_entry.insert(0, metadata["grid_size"])
-                self.generate_grid()
-
-            if "beacons" in metadata:
-                self.beacon_data = (
-                    eval(metadata["beacons"])
-                    if isinstance(metadata["beacons"], str)
-                    else metadata["beacons"]
-                )
-                self.beacon_cells = []
-                for beacon_id, (row, col) in self.beacon_data.items():
-                    self.cells[row][col]["beacon"] = True
-                    self.canvas.itemconfig(self.cells[row][col]["rect"], fill="red")
-
-            # Log unused metadata keys
-            for key in metadata.keys():
-                if key not in ["width", "height", "grid_size", "beacons"]:
-                    print(
-                        f"Unused metadata key detected: {key}. Consider adding support for it."
-                    )
-        except Exception as e:
+            layout = read_layout(metadata, image_path)
+        except (ValueError, KeyError, SyntaxError, OSError) as e:
             print(f"Error applying metadata: {e}")
+            return
+        if layout is None:
+            print("No metadata found in the image.")
+            return
+        # Checked before the grid is rebuilt, so a bad layout leaves the current one
+        try:
+            beacon_data = BeaconIndex(layout.beacons)
+        except ValueError as e:
+            print(f"Error applying metadata: {e}")
+            return
+
+        self.width_entry.delete(0, tk.END)
+        self.width_entry.insert(0, layout.width)
+        self.height_entry.delete(0, tk.END)
+        self.height_entry.insert(0, layout.height)
+        self.grid_size_entry.delete(0, tk.END)
+        self.grid_size_entry.insert(0, layout.grid_size)
+        self.generate_grid()
+        if self.grid is None:
+            return
+
+        for beacon_id, cell in layout.beacons.items():
+            self.grid.add_beacon(beacon_id, cell)
+        self.beacon_data = beacon_data
+        self.renderer.refresh_indices(
+            [self.grid.index(cell) for cell in layout.beacons.values()]
+        )
+
+        # Saved footprints only fit a grid with the same shape
+        shape = (self.grid.num_rows, self.grid.num_cols)
+        if layout.coverage is not None and shape == (layout.num_rows, layout.num_cols):
+            self.distances.update(layout.coverage.distances)
+            if self.view_mode.get() == "Position":
+                self.draw_position()
+            else:
+                self.renderer.paint(*self.coverage.restore(layout.coverage.footprints))
+        self.update_beacon_list()
+
+        # Log unused metadata keys
+        for key in metadata.keys():
+            if key != LAYOUT_KEY and key not in LEGACY_KEYS:
+                print(
+                    f"Unused metadata key detected: {key}. Consider adding support for it."
+                )
 
     def start_serial_reader(self):
-        """Starts a thread to continuously read data from a serial device."""
-        com_port = self.com_port_entry.get().strip()
+        """Starts a thread per serial port to continuously read its clicker."""
+        com_ports = [p.strip() for p in self.com_port_entry.get().split(",")]
+        com_ports = [p for p in com_ports if p]
         baud_rate = self.baud_rate_entry.get().strip()
         try:
-            if not com_port or not baud_rate.isdigit():
+            if not com_ports or not baud_rate.isdigit():
                 raise ValueError(
                     "Invalid COM port or baud rate. Please enter valid inputs."
                 )
 
             baud_rate = int(baud_rate)
 
-            def read_from_serial():
+            def read_from_serial(com_port):
                 while True:
                     try:
                         # Initialize serial port
                         with serial.Serial(com_port, baud_rate, timeout=1) as ser:
                             while ser.is_open:
                                 # Read a line from the serial port
-                                data = ser.readline().strip()
+                                with SERIAL_READ_TIME:
+                                    data = ser.readline().strip()
                                 if data:  # Ensure data is not empty
-                                    self.process_serial_data(data)
+                                    self.process_serial_data(data, com_port)
                     except serial.SerialException as e:
                         print("Serial port error:", e)
                         print("Retrying connection in 5 seconds...")
                         # Sleep for a few seconds before retrying
-                        threading.Event().wait(5)
+                        time.sleep(5)
                     except Exception as e:
                         print("Unexpected error in serial reader:", e)
 
-            # Run the serial reader in a separate thread
-            serial_thread = threading.Thread(target=read_from_serial, daemon=True)
-            serial_thread.start()
-            print(f"Serial reader started on {com_port} at {baud_rate} baud.")
+            # Run each serial reader in a separate thread
+            for com_port in com_ports:
+                threading.Thread(
+                    target=read_from_serial, args=(com_port,), daemon=True
+                ).start()
+                print(f"Serial reader started on {com_port} at {baud_rate} baud.")
         except ValueError as e:
             print(e)
 
-    def process_serial_data(self, data):
-        """Parse and process incoming serial data dynamically."""
+    def start_subscriber(self):
+        """Subscribe to the frames umbra republishes, reconnecting whenever it drops us.
+
+        One subscriber thread serves the app; subscribing again points it at
+        the address now in the entry instead of starting another.
+        """
+        address = self.subscribe_entry.get().strip()
+        host, _, port = address.rpartition(":")
+        if not port.isdigit():
+            print("Invalid umbra address. Please enter host:port.")
+            return
+        address = (host or "127.0.0.1", int(port))
+        if address == self.subscribe_address:
+            print("Already subscribed to umbra at %s:%d." % address)
+            return
+        self.subscribe_address = address
+        if self.subscriber_thread is not None:
+            sock = self.subscribe_sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)  # Wakes the thread to reconnect
+                except OSError:
+                    pass
+            return
+
+        def read_from_umbra():
+            while True:
+                address = self.subscribe_address
+                try:
+                    with socket.create_connection(address) as sock:
+                        self.subscribe_sock = sock
+                        print("Subscribed to umbra at %s:%d." % address)
+                        for line in sock.makefile("rb"):
+                            message = json.loads(line)
+                            SUBSCRIBE_LATENCY.observe(time.time() - message["read_at"])
+                            if self.subscribe_read_at is None:
+                                self.subscribe_read_at = message["read_at"]
+                            for device, beacon_id, metres in payload_readings(
+                                message["payload"]
+                            ):
+                                recorder = self.recorder
+                                if recorder is not None:
+                                    reading = f"{beacon_id}:{metres}"
+                                    recorder.record(tag_reading(reading, device))
+                                self.process_reading(device, beacon_id, metres)
+                    print("umbra closed the subscription.")
+                except (OSError, ValueError, KeyError) as e:
+                    print("Subscription error:", e)
+                finally:
+                    self.subscribe_sock = None
+                if address != self.subscribe_address:
+                    continue  # Subscribed elsewhere meanwhile
+                print("Resubscribing in 5 seconds...")
+                time.sleep(5)
+
+        self.subscriber_thread = threading.Thread(target=read_from_umbra, daemon=True)
+        self.subscriber_thread.start()
+
+    def toggle_metrics(self):
+        """Start or stop recording metrics, with the stats panel and the JSON dump."""
+        if self.metrics_enabled.get():
+            metrics.enable()
+            self.dumper = metrics.Dumper(METRICS_PATH, "visualizer")
+            self.root.after(STATS_INTERVAL_MS, self.update_stats)
+        else:
+            metrics.disable()
+            self.dumper.stop()
+            self.dumper = None
+            self.stats_label.config(text="")
+
+    def update_stats(self):
+        """Show the current metrics in the stats panel, then reschedule while enabled."""
+        if not metrics.enabled:
+            return
+        snapshot = metrics.snapshot("visualizer")
+        lines = metrics.summary(snapshot)
+        if self.coverage is not None:
+            cache = self.footprint_cache.stats()
+            lines.append(
+                f"footprints: {cache['hit_rate']:.0%} cached, {cache['entries']} radii"
+                f" in {cache['bytes'] >> 10} KB, {self.coverage.unchanged} unchanged"
+            )
+            lines.append(f"fully covered: {len(self.coverage.covered())} cells")
+        self.stats_label.config(text="\n".join(lines))
+        self.root.after(STATS_INTERVAL_MS, self.update_stats)
+
+    def toggle_profile(self):
+        """Profile the Tk thread (rendering and coverage) until toggled off."""
+        if self.profile_enabled.get():
+            self.profiler.start()
+        elif self.profiler.running:
+            self.profiler.stop("visualizer.prof")
+
+    def toggle_recording(self):
+        """Start recording raw serial lines to a session file, or stop and close it."""
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+            self.record_button.config(text="Record Session")
+            print(f"Recorded {recorder.lines} lines to {recorder.path}")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".session", filetypes=[("Sessions", "*.session")]
+        )
+        if not file_path:
+            return
+        self.recorder = SessionRecorder(file_path)
+        self.record_button.config(text="Stop Recording")
+
+    def start_replay(self):
+        """Feed a recorded session through process_serial_data on a background thread."""
+        file_path = filedialog.askopenfilename(filetypes=[("Sessions", "*.session")])
+        if not file_path:
+            return
         try:
-            # Decode bytes if necessary, then strip unwanted characters
-            if isinstance(data, bytes):
-                data = data.decode("utf-8", errors="replace").strip()
-            # Example logic to parse dynamic incoming data
-            # Assume data format: BEACON_ID:DISTANCE
-            if ":" in data:
-                beacon_id, distance = data.split(":")
-                distance = float(distance)
-                self.visualize_distances({beacon_id: distance})
-            else:
+            speed = float(self.replay_speed_entry.get())
+        except ValueError:
+            print("Invalid replay speed. Using 1.")
+            speed = 1.0
+
+        def run():
+            try:
+                replay(file_path, self.process_serial_data, speed)
+                print(f"Replay of {file_path} finished.")
+            except (OSError, ValueError) as e:
+                print(f"Error replaying session: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def process_serial_data(self, data, device=None):
+        """Parse incoming serial data and queue it for the next frame.
+
+        Lines that do not name their clicker are credited to device, the port
+        they were read from. Runs on a serial thread, so it must not touch any
+        Tk widgets.
+        """
+        recorder = self.recorder  # toggle_recording may clear it meanwhile
+        if recorder is not None:
+            recorder.record(tag_reading(data, device))
+        SERIAL_LINES.inc()
+        try:
+            reading = parse_reading(data, device or DEFAULT_DEVICE)
+            if reading is None:
                 print("Unrecognized data format:", data)
-        except (ValueError, UnicodeDecodeError) as e:
+                return
+            self.process_reading(*reading)
+        except ValueError as e:
             print(f"Error parsing serial data: {e}")
 
+    def process_reading(self, device, beacon_id, distance):
+        """Filter one parsed reading and queue it for the next frame, from any reader thread."""
+        with FILTER_TIME:
+            distance = self.clickers.get(device).filter.process(beacon_id, distance)
+        if distance is not None:
+            self.readings.put((device, beacon_id), distance)
+
+    def configure_filter(self, *_):
+        """Replace the smoothing stage with the selected filter and dead-band."""
+        try:
+            dead_band = float(self.dead_band_entry.get())
+        except ValueError:
+            print("Invalid dead-band. Using 0.")
+            dead_band = 0.0
+        self.clickers.configure(self.filter_mode.get(), dead_band * self.grid_size)
+
+    def render_frame(self):
+        """Apply the latest queued reading per clicker and beacon in a single pass, then reschedule."""
+        try:
+            while True:
+                try:
+                    task = self.ui_tasks.get_nowait()
+                except queue.Empty:
+                    break
+                task()
+            latest = self.readings.drain()
+            updates = self.clickers.apply(latest)
+            if updates:
+                self.update_clicker_menu()
+            if latest and self.coverage is not None:
+                start = time.perf_counter()
+                with FRAME_TIME:
+                    # Position view marks every clicker; coverage is the focus's
+                    self.visualize_distances(updates.get(self.focus, {}))
+                    # Include Tk's own redraw so both render modes are measured alike
+                    with CANVAS_TIME:
+                        self.canvas.update_idletasks()
+                self.frame_time = time.perf_counter() - start
+                read_at, self.subscribe_read_at = self.subscribe_read_at, None
+                if read_at is not None:
+                    SCREEN_LATENCY.observe(time.time() - read_at)
+            if latest:
+                stats = self.readings.stats()
+                self.ingest_label.config(
+                    text="Queue {depth} | received {received} | "
+                    "merged {merged} | dropped {dropped} | "
+                    "filtered {suppressed} | clickers {active} | "
+                    "frame {frame_ms:.1f} ms".format(
+                        frame_ms=self.frame_time * 1e3,
+                        suppressed=self.clickers.suppressed(),
+                        active=len(self.clickers.active()),
+                        **stats,
+                    )
+                )
+        finally:
+            self.root.after(FRAME_INTERVAL_MS, self.render_frame)
+
     def generate_grid(self):
         if not self.image:
             print("Please upload an image first.")
             return
 
         # Clear the existing grid and all beacons
-        for row in self.cells:
-            for cell in row:
-                self.canvas.delete(
-                    cell["rect"]
-                )  # Remove all grid cells from the canvas
-        self.cells = []
-        self.beacon_cells = []
-        self.beacon_data = {}
+        if self.renderer is not None:
+            self.renderer.clear()  # Remove all grid cells from the canvas
+            self.renderer = None
+        self.grid = None
+        self.beacon_data = BeaconIndex()
+        self.update_beacon_list()
+        self.clickers.reset()
+        self.canvas.delete("position")
 
         # Reset relevant cell properties
         img_width, img_height = self.image.size  # Ensure image dimensions are used
@@ -348,21 +752,21 @@ class BuildingLayoutApp:
         cell_width = img_width / num_cols
         cell_height = img_height / num_rows
 
-        self.cells = []
-        for row in range(num_rows):
-            row_cells = []
-            for col in range(num_cols):
-                x1 = self.image_offset_x + col * cell_width
-                y1 = self.image_offset_y + row * cell_height
-                x2 = x1 + cell_width
-                y2 = y1 + cell_height
+        self.grid = GridModel(num_rows, num_cols)
+        self.configure_filter()  # The dead-band is measured in cells
+
+        renderer_class = RENDERERS[self.render_mode.get()]
+        self.renderer = renderer_class(
+            self.canvas, self.grid, self.image_offset_x, self.image_offset_y
+        )
+        self.renderer.draw_grid(cell_width, cell_height)
 
-                rect = self.canvas.create_rectangle(x1, y1, x2, y2, outline="black")
-                row_cells.append({"rect": rect, "beacon": False, "overlap_count": 0})
-            self.cells.append(row_cells)
+        self.coverage = CoverageEngine(
+            self.grid, cell_width, cell_height, self.footprint_cache
+        )
 
     def select_cell(self, event):
-        if not self.cells or not self.image:
+        if self.grid is None or not self.image:
             return
 
         x, y = event.x - self.image_offset_x, event.y - self.image_offset_y
@@ -373,126 +777,164 @@ class BuildingLayoutApp:
             print("Click outside the image. Ignoring.")
             return
 
-        cell_width = img_width / len(self.cells[0])
-        cell_height = img_height / len(self.cells)
+        cell_width = img_width / self.grid.num_cols
+        cell_height = img_height / self.grid.num_rows
 
         col = int(max(0, x) / cell_width)
         row = int(max(0, y) / cell_height)
 
-        if 0 <= row < len(self.cells) and 0 <= col < len(self.cells[0]):
-            cell = self.cells[row][col]
-            if not cell["beacon"]:
+        if 0 <= row < self.grid.num_rows and 0 <= col < self.grid.num_cols:
+            beacon_id = self.beacon_data.at((row, col))
+            if beacon_id is None:
                 beacon_id = tk.simpledialog.askstring(
                     "Beacon ID", "Enter a unique ID for this beacon:"
                 )
                 if beacon_id and beacon_id not in self.beacon_data:
-                    self.canvas.itemconfig(cell["rect"], fill="red")
-                    cell["beacon"] = True
-                    self.beacon_data[beacon_id] = (row, col)
-                    self.beacon_cells.append((row, col))
+                    self.beacon_data.add(beacon_id, (row, col))
+                    self.grid.add_beacon(beacon_id, (row, col))
+                    self.renderer.refresh_cell((row, col))
+                    self.update_beacon_list()
                 else:
                     print("Invalid or duplicate ID. Try again.")
             else:
-                self.canvas.itemconfig(cell["rect"], fill="")
-                cell["beacon"] = False
-                beacon_id = [k for k, v in self.beacon_data.items() if v == (row, col)]
-                if beacon_id:
-                    del self.beacon_data[beacon_id[0]]
-                self.beacon_cells.remove((row, col))
+                # Drop the beacon's coverage, then the beacon itself
+                self.clear_beacon_visual(beacon_id)
+                self.grid.remove_beacon((row, col))
+                self.renderer.refresh_cell((row, col))
+                self.beacon_data.remove(beacon_id)
+                self.clickers.forget_beacon(beacon_id)
+                self.update_beacon_list()
 
     def update_beacon_list(self):
-        """Update the listbox to display active beacons and their distances."""
+        """Refill the listbox with the placed beacons; only needed when they change."""
         self.beacon_listbox.delete(0, tk.END)
         for beacon_id, (row, col) in self.beacon_data.items():
             # Retrieve distance if available; otherwise, set as 'N/A'
             self.beacon_listbox.insert(tk.END, f"Beacon {beacon_id}: ({row}, {col})")
-        print(f"Beacon list updated: {self.beacon_data}")
 
     def visualize_distances(self, distances):
-        # Clear visuals for updated beacons
+        """Apply new beacon distances and repaint only the cells whose colour changed."""
+        readings = {}
         for beacon_id, distance in distances.items():
             if beacon_id in self.beacon_data:
-                row, col = self.beacon_data[beacon_id]
-                # Draw the new visuals
-                self.draw_circle((row, col), distance, beacon_id)
-
-        # Update the beacon list view
-        self.update_beacon_list()
+                self.distances[beacon_id] = distance
+                cell = self.beacon_data[beacon_id]
+                readings[beacon_id] = (cell, self.pixel_radius(distance))
+        if self.view_mode.get() == "Position":
+            # The solve replaces the full coverage pass
+            with SOLVE_TIME:
+                self.draw_position()
+        elif readings:
+            with COVERAGE_TIME:
+                changes = self.coverage.update(readings)
+            with PAINT_TIME:
+                self.renderer.paint(*changes)
+
+    def draw_circle(self, beacon_id, distance):
+        """Update grid cells within range without altering grid alignment or overall appearance."""
+        cell = self.beacon_data.get(beacon_id)
+        if cell is None:
+            return
+        readings = {beacon_id: (cell, self.pixel_radius(distance))}
+        self.renderer.paint(*self.coverage.update(readings))
+
+    def draw_position(self):
+        """Mark the least-squares position of every active clicker, sized by its RMS residual.
+
+        All clickers are solved in one batch; the focus is drawn in red.
+        """
+        self.canvas.delete("position")
+        shown = {clicker.device: clicker for clicker in self.clickers.active()}
+        shown[self.focus] = self.clickers.get(self.focus)
+        estimates = locate_many(
+            self.beacon_data,
+            {device: clicker.recent() for device, clicker in shown.items()},
+            self.grid_size,
+        )
 
-        # Apply green color to cells affected by 3 or more distinct beacons
-        for row_cells in self.cells:
-            for cell in row_cells:
-                if (
-                    "in_range_beacons" in cell
-                    and len(set(cell["in_range_beacons"])) >= 3
-                ):
-                    self.canvas.itemconfig(cell["rect"], fill="green", stipple="")
-                elif (
-                    "in_range_beacons" in cell
-                    and len(set(cell["in_range_beacons"])) > 0
-                ):
-                    # Retain a lighter gray shade for overlapped areas
-                    self.canvas.itemconfig(
-                        cell["rect"], fill="#D3D3D3", stipple="gray75"
-                    )
-                else:
-                    # Clear visuals only if no beacons affect the cell
-                    self.canvas.itemconfig(cell["rect"], fill="", stipple="")
+        # Metres to pixels along each axis, so cell centers land on cell centers
+        img_width, img_height = self.image.size
+        scale_x = img_width / self.grid.num_cols / self.grid_size
+        scale_y = img_height / self.grid.num_rows / self.grid_size
+        for device, ((x, y), rms) in estimates.items():
+            clicker = shown[device]
+            clicker.position, clicker.rms = (x, y), rms
+            colour = "red" if device == self.focus else "blue"
+            center_x = self.image_offset_x + x * scale_x
+            center_y = self.image_offset_y + y * scale_y
+            radius = max(rms * scale_x, 4)
+            self.canvas.create_oval(
+                center_x - radius,
+                center_y - radius,
+                center_x + radius,
+                center_y + radius,
+                outline=colour,
+                width=2,
+                tags="position",
+            )
+            label = device
+            nearest = nearest_beacon(self.beacon_data, (x, y), self.grid_size)
+            if nearest is not None:
+                label += f" near {nearest[0]} ({nearest[1]:.1f} m)"
+            self.canvas.create_text(
+                center_x,
+                center_y - radius - 4,
+                text=label,
+                anchor="s",
+                fill=colour,
+                tags="position",
+            )
 
-        # Redraw beacon squares after updating distances
-        for beacon_id, (b_row, b_col) in self.beacon_data.items():
-            self.canvas.itemconfig(
-                self.cells[b_row][b_col]["rect"], fill="red", stipple=""
+    def update_clicker_menu(self):
+        """Add newly heard clickers to the Clicker menu; the first takes the focus from local."""
+        devices = self.clickers.devices()
+        if len(devices) == self.known_clickers:
+            return
+        menu = self.clicker_menu["menu"]
+        for device in devices[self.known_clickers :]:
+            menu.add_command(
+                label=device,
+                command=tk._setit(self.clicker_var, device, self.set_focus),
             )
+        self.known_clickers = len(devices)
+        if self.focus == DEFAULT_DEVICE and not self.distances:
+            self.set_focus(devices[1])
 
-    def draw_circle(self, cell, distance, beacon_id):
-        """Update grid cells within range without altering grid alignment or overall appearance."""
-        row, col = cell
-        img_width, img_height = self.image.size  # Use image dimensions
-
-        cell_width = img_width / len(self.cells[0])
-        cell_height = img_height / len(self.cells)
-
-        # Calculate pixel distance for the radius using grid size
-        pixel_distance = (distance / self.grid_size) * cell_width
-        rows = len(self.cells)
-        cols = len(self.cells[0])
-
-        # Iterate over cells to determine if they fall within beacon range
-        for r in range(rows):
-            for c in range(cols):
-                cell_center_x = c * cell_width + cell_width / 2
-                cell_center_y = r * cell_height + cell_height / 2
-
-                center_x = col * cell_width + cell_width / 2
-                center_y = row * cell_height + cell_height / 2
-
-                # Calculate the Euclidean distance between cell center and beacon center
-                distance_to_cell = (
-                    (center_x - cell_center_x) ** 2 + (center_y - cell_center_y) ** 2
-                ) ** 0.5
-                if distance_to_cell <= pixel_distance:
-                    # Mark cell as in range of this beacon
-                    self.cells[r][c].setdefault("in_range_beacons", []).append(
-                        beacon_id
-                    )
-                    self.cells[r][c]["overlap_count"] += 1
-                    # Update fill color without deleting grid rectangles
-                    self.canvas.itemconfig(
-                        self.cells[r][c]["rect"], fill="#D3D3D3", stipple="gray75"
-                    )
+    def set_focus(self, device):
+        """Shade another clicker's coverage; Position view keeps marking all of them."""
+        if device == self.focus:
+            return
+        if self.coverage is not None:
+            self.renderer.paint(*self.coverage.remove(list(self.distances)))
+        self.focus = device
+        self.clicker_var.set(device)
+        self.distances = self.clickers.get(device).distances
+        if self.coverage is not None:
+            self.visualize_distances(dict(self.distances))
+
+    def set_view_mode(self, mode):
+        """Switch between shading coverage and marking the solved position."""
+        if self.coverage is None:
+            return
+        if mode == "Position":
+            self.renderer.paint(*self.coverage.remove(list(self.distances)))
+            self.draw_position()
+        else:
+            self.canvas.delete("position")
+            self.visualize_distances(dict(self.distances))
+
+    def pixel_radius(self, distance):
+        """Convert a distance in metres to a radius in image pixels."""
+        cell_width = self.image.size[0] / self.grid.num_cols
+        return (distance / self.grid_size) * cell_width
 
     def simulate_beacon_distance(self):
         beacon_id = self.beacon_id_entry.get()
         try:
             distance = float(self.distance_entry.get())
             if beacon_id in self.beacon_data:
-                # Clear previous visuals for the beacon
-                self.clear_beacon_visual(beacon_id)
-                # Render updated distance
+                # Render updated distance, replacing the beacon's previous visuals
                 self.visualize_distances({beacon_id: distance})
-                # Refresh the beacon list
-                self.update_beacon_list()
             else:
                 print(f"Beacon ID {beacon_id} not found.")
         except ValueError:
@@ -500,19 +942,10 @@ class BuildingLayoutApp:
 
     def clear_beacon_visual(self, beacon_id):
         """Remove all visuals associated with a specific beacon's previous measurement."""
-        if beacon_id not in self.beacon_data:
+        if beacon_id not in self.beacon_data or self.coverage is None:
             return
 
-        rows = len(self.cells)
-        cols = len(self.cells[0])
-        for r in range(rows):
-            for c in range(cols):
-                cell = self.cells[r][c]
-                if "in_range_beacons" in cell and beacon_id in cell["in_range_beacons"]:
-                    cell["in_range_beacons"].remove(beacon_id)
-                    cell["overlap_count"] -= 1
-                    if cell["overlap_count"] < 3:
-                        self.canvas.itemconfig(cell["rect"], fill="", stipple="")
+        self.renderer.paint(*self.coverage.remove([beacon_id]))
 
 
 if __name__ == "__main__":
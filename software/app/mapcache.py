@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# CAD exports are legitimately huge, far past Pillow's decompression-bomb
+# limit, so plans get their own bound; 400 MP is e.g. 20k x 20k pixels
+MAX_PLAN_PIXELS = int(os.environ.get("VISUALIZER_MAX_PLAN_PIXELS", 400_000_000))
+TILE_SIZE = 256  # Pixels per side of a stored tile
+MIN_LEVEL_SIZE = 256  # Stop halving once the longer side is this small
+INDEX_FILE = "index.json"  # (path, size, mtime) -> content hash, to skip rehashing
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class FloorPlanCache:
+    """Decoded floor plans stored on disk as pyramids of tiles, keyed by file hash.
+
+    The first load of a plan decodes it once and writes each level (full
+    size, half, quarter, ...) as an array of TILE_SIZE tiles. Later loads
+    memory-map the level they need and copy out only the tiles they touch,
+    so a 15k x 10k plan never has to be decoded or held in memory again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+
+    def key(self, path):
+        """Return the content hash of path, reusing it while size and mtime are unchanged."""
+        stat = os.stat(path)
+        source = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        digest = self.index.get(source)
+        if digest is None or not os.path.isdir(os.path.join(self.directory, digest)):
+            digest = file_hash(path)
+            self.index[source] = digest
+            with open(self.index_path + ".tmp", "w") as f:
+                json.dump(self.index, f)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        return digest
+
+    def open(self, path):
+        """Return the FloorPlan for the image at path, building its pyramid on first use."""
+        entry = os.path.join(self.directory, self.key(path))
+        if not os.path.exists(os.path.join(entry, "meta.json")):
+            self.build(path, entry)
+        return FloorPlan(entry)
+
+    def build(self, path, entry):
+        with open_plan(path) as source:
+            info = {
+                k: v.decode("utf-8") if isinstance(v, bytes) else v
+                for k, v in source.info.items()
+                if isinstance(v, (str, bytes))
+            }
+            mode = "RGBA" if "A" in source.getbands() else "RGB"
+            image = source.convert(mode)
+
+        # Written under a temporary name so a half-built entry is never used
+        staging = entry + ".tmp"
+        os.makedirs(staging, exist_ok=True)
+        levels = []
+        while True:
+            levels.append(image.size)
+            save_tiles(image, os.path.join(staging, f"level{len(levels) - 1}.npy"))
+            if max(image.size) <= MIN_LEVEL_SIZE:
+                break
+            image = image.reduce(2)  # 2x2 box filter, much cheaper than a resize
+
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"mode": mode, "levels": levels, "info": info}, f)
+        os.replace(staging, entry)
+
+
+_limit_lock = threading.Lock()
+
+
+def open_plan(path):
+    """Image.open for a floor plan, allowing up to MAX_PLAN_PIXELS.
+
+    Pillow checks the size only inside Image.open, which reads just the
+    header, so its global limit is lifted for that call alone and every other
+    image in the process keeps the decompression-bomb guard.
+    """
+    with _limit_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            source = Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+    width, height = source.size
+    if width * height > MAX_PLAN_PIXELS:
+        source.close()
+        raise Image.DecompressionBombError(
+            f"{path} is {width}x{height} pixels, over the {MAX_PLAN_PIXELS}"
+            " pixel limit for floor plans (VISUALIZER_MAX_PLAN_PIXELS)"
+        )
+    return source
+
+
+def save_tiles(image, path):
+    """Store image as a (tile rows, tile cols, TILE_SIZE, TILE_SIZE, bands) array.
+
+    Converted one strip of tiles at a time, so only the decoded image itself
+    is ever held in memory in full.
+    """
+    width, height = image.size
+    bands = len(image.getbands())
+    tile_rows, tile_cols = -(-height // TILE_SIZE), -(-width // TILE_SIZE)
+    tiles = np.lib.format.open_memmap(
+        path,
+        mode="w+",
+        dtype=np.uint8,
+        shape=(tile_rows, tile_cols, TILE_SIZE, TILE_SIZE, bands),
+    )
+    strip = np.zeros((TILE_SIZE, tile_cols * TILE_SIZE, bands), dtype=np.uint8)
+    for tile_row in range(tile_rows):
+        y0 = tile_row * TILE_SIZE
+        y1 = min(y0 + TILE_SIZE, height)
+        strip[:] = 0
+        strip[: y1 - y0, :width] = np.asarray(image.crop((0, y0, width, y1)))
+        tiles[tile_row] = strip.reshape(
+            TILE_SIZE, tile_cols, TILE_SIZE, bands
+        ).swapaxes(0, 1)
+    tiles.flush()
+
+
+class FloorPlan:
+    """A cached plan: its original metadata and memory-mapped pyramid levels."""
+
+    def __init__(self, entry):
+        self.entry = entry
+        with open(os.path.join(entry, "meta.json")) as f:
+            meta = json.load(f)
+        self.mode = meta["mode"]
+        self.levels = [tuple(size) for size in meta["levels"]]
+        self.info = meta["info"]  # PNG text chunks, e.g. the exported layout
+        self.size = self.levels[0]
+        self._tiles = {}
+
+    def tiles(self, level):
+        if level not in self._tiles:
+            path = os.path.join(self.entry, f"level{level}.npy")
+            self._tiles[level] = np.load(path, mmap_mode="r")
+        return self._tiles[level]
+
+    def level_for(self, width, height):
+        """Return the smallest level that is still at least width x height."""
+        for level in range(len(self.levels) - 1, -1, -1):
+            level_width, level_height = self.levels[level]
+            if level_width >= width and level_height >= height:
+                return level
+        return 0
+
+    def region(self, level, x0, y0, x1, y1):
+        """Return pixels [y0:y1, x0:x1] of a level as an image, reading only the tiles it covers."""
+        tiles = self.tiles(level)
+        t0, t1 = y0 // TILE_SIZE, -(-y1 // TILE_SIZE)
+        s0, s1 = x0 // TILE_SIZE, -(-x1 // TILE_SIZE)
+        block = tiles[t0:t1, s0:s1].swapaxes(1, 2)
+        block = block.reshape(
+            (t1 - t0) * TILE_SIZE, (s1 - s0) * TILE_SIZE, tiles.shape[-1]
+        )
+        top, left = y0 - t0 * TILE_SIZE, x0 - s0 * TILE_SIZE
+        pixels = block[top : top + y1 - y0, left : left + x1 - x0]
+        return Image.fromarray(np.ascontiguousarray(pixels), self.mode)
+
+    def fit(self, width, height):
+        """Return the whole plan resized to width x height, starting from the nearest level."""
+        level = self.level_for(width, height)
+        level_width, level_height = self.levels[level]
+        image = self.region(level, 0, 0, level_width, level_height)
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        return image
@@ -0,0 +1,223 @@
+"""PocketBase access for the dashboard: one shared session, a saved token and a worker pool.
+
+Calls run on worker threads so they never block the Tk main loop. Their
+results are queued and handed to the callbacks passed with each call when
+the Tk thread calls deliver(), which App does from an after() loop.
+"""
+
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+import time
+
+from pocketbase import PocketBase
+from pocketbase.errors import ClientResponseError
+from pocketbase.models.record import Record
+from pocketbase.stores import BaseAuthStore
+from pocketbase.utils import get_token_payload
+
+TOKEN_PATH = os.environ.get(
+    "DASHBOARD_TOKEN", os.path.join(os.path.expanduser("~"), ".dashboard-token.json")
+)
+AUTH_COLLECTION = "users"
+WORKERS = 4  # Concurrent PocketBase calls; they share one keep-alive session
+REFRESH_MARGIN = 24 * 3600  # Refresh a token this many seconds before it expires
+
+
+def token_expiry(token):
+    """Return a token's exp claim in epoch seconds, or 0 if it has none or is malformed."""
+    try:
+        return float(get_token_payload(token).get("exp", 0)) if token else 0
+    except (ValueError, KeyError, TypeError):
+        return 0
+
+
+class FileAuthStore(BaseAuthStore):
+    """An auth store that keeps the token and user record in a file only its owner can read.
+
+    Stored as JSON rather than pickled, so a tampered file cannot run code.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            self.base_token = saved["token"]
+            self.base_model = Record(saved["record"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    @property
+    def is_valid(self):
+        return token_expiry(self.token) > time.time()
+
+    def save(self, token="", model=None):
+        super().save(token, model)
+        if not token:
+            self._remove()
+            return
+        record = {}
+        if model is not None:
+            record = {
+                key: value
+                for key, value in vars(model).items()
+                if isinstance(value, (str, int, float, bool))
+            }
+        tmp = self.path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)  # O_CREAT keeps the mode of a file that already exists
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"token": token, "record": record}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        super().clear()
+        self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PocketBaseService:
+    """Runs PocketBase calls on a worker pool and keeps the signed-in user's token fresh."""
+
+    def __init__(
+        self,
+        url,
+        token_path=TOKEN_PATH,
+        workers=WORKERS,
+        refresh_margin=REFRESH_MARGIN,
+    ):
+        self.store = FileAuthStore(token_path)
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="pocketbase"
+        )
+        # One httpx session for every call, built off the Tk thread since
+        # creating its SSL context alone takes tens of milliseconds
+        self._client = self.pool.submit(PocketBase, url, auth_store=self.store)
+        self.results = queue.Queue()  # (callback, value) waiting for the Tk thread
+        self.refresh_margin = refresh_margin
+        self.refresh_timer = None
+        self.lock = threading.Lock()
+        self.on_logout = None  # Called on the Tk thread when the token is rejected
+
+    @property
+    def client(self):
+        return self._client.result()
+
+    @property
+    def user(self):
+        return self.store.model
+
+    def restore(self):
+        """Resume a saved session without any request; returns whether its token is still valid."""
+        if not self.store.is_valid:
+            self.store.clear()
+            return False
+        self.schedule_refresh()
+        return True
+
+    def login(self, email, password, on_done=None, on_error=None):
+        def request(client):
+            auth = client.collection(AUTH_COLLECTION).auth_with_password(
+                email, password
+            )
+            self.schedule_refresh()
+            return auth
+
+        return self.call(request, on_done, on_error)
+
+    def logout(self):
+        """Forget the saved token; on_logout then runs on the Tk thread."""
+        with self.lock:
+            if self.refresh_timer is not None:
+                self.refresh_timer.cancel()
+                self.refresh_timer = None
+        self.store.clear()
+        if self.on_logout is not None:
+            self.results.put((self.on_logout, None))
+
+    def call(self, request, on_done=None, on_error=None):
+        """Run request(client) on the pool and return its future.
+
+        on_done(result) or on_error(exception) run on the Tk thread once
+        deliver() picks them up. A 401 logs the user out.
+        """
+        future = self.pool.submit(self._run, request)
+        future.add_done_callback(lambda f: self._finish(f, on_done, on_error))
+        return future
+
+    def _run(self, request):
+        try:
+            return request(self.client)
+        except ClientResponseError as e:
+            if e.status == 401 and self.store.token:
+                self.logout()
+            raise
+
+    def _finish(self, future, on_done, on_error):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            if on_done is not None:
+                self.results.put((on_done, future.result()))
+        elif on_error is not None:
+            self.results.put((on_error, error))
+        else:
+            print(f"PocketBase call failed: {error}")
+
+    def deliver(self):
+        """Run the callbacks of finished calls; must be called from the Tk thread."""
+        while True:
+            try:
+                callback, value = self.results.get_nowait()
+            except queue.Empty:
+                return
+            callback(value)
+
+    def schedule_refresh(self):
+        """Refresh the token refresh_margin seconds before it expires.
+
+        A token with less than twice the margin left is refreshed halfway to
+        expiry instead, so short-lived tokens are not refreshed in a loop.
+        """
+        remaining = token_expiry(self.store.token) - time.time()
+        if remaining <= 0:
+            return
+        delay = remaining - min(self.refresh_margin, remaining / 2)
+        with self.lock:
+            if self.refresh_timer is not None:
+                self.refresh_timer.cancel()
+            self.refresh_timer = threading.Timer(delay, self.refresh)
+            self.refresh_timer.daemon = True
+            self.refresh_timer.start()
+
+    def refresh(self):
+        def request(client):
+            auth = client.collection(AUTH_COLLECTION).auth_refresh()
+            self.schedule_refresh()
+            return auth
+
+        def retry(error):
+            # Try again halfway to expiry, e.g. after a network error
+            print(f"Token refresh failed: {error}")
+            self.schedule_refresh()
+
+        return self.call(request, on_error=retry)
+
+    def close(self):
+        with self.lock:
+            if self.refresh_timer is not None:
+                self.refresh_timer.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self._client.done() and self._client.exception() is None:
+            self._client.result().http_client.close()
@@ -0,0 +1,223 @@
+import tkinter as tk
+
+import numpy as np
+from PIL import Image, ImageTk
+
+from coverage import FULL_COVERAGE, NO_COVERAGE, PARTIAL_COVERAGE
+
+# Canvas options for each coverage state of a cell
+CELL_STYLES = {
+    NO_COVERAGE: {"fill": "", "stipple": ""},
+    PARTIAL_COVERAGE: {"fill": "#D3D3D3", "stipple": "gray75"},
+    FULL_COVERAGE: {"fill": "green", "stipple": ""},
+}
+BEACON_STYLE = {"fill": "red", "stipple": ""}
+
+BEACON = 3  # Overlay palette entry for beacon squares, after the coverage states
+TILE_SIZE = 256  # Overlay tiles are pushed to Tk independently, in pixels
+
+
+class ItemRenderer:
+    """Draws the grid as one canvas rectangle per cell and recolours them with itemconfig."""
+
+    def __init__(self, canvas, grid, offset_x, offset_y):
+        self.canvas = canvas
+        self.grid = grid
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.states = np.zeros(len(grid), dtype=np.int8)
+
+    def draw_grid(self, cell_width, cell_height):
+        rects = []
+        for row in range(self.grid.num_rows):
+            for col in range(self.grid.num_cols):
+                x1 = self.offset_x + col * cell_width
+                y1 = self.offset_y + row * cell_height
+                x2 = x1 + cell_width
+                y2 = y1 + cell_height
+                rects.append(
+                    self.canvas.create_rectangle(
+                        x1, y1, x2, y2, outline="black", tags="grid"
+                    )
+                )
+        self.grid.rects[:] = rects
+
+    def clear(self):
+        # All cells share one tag, so Tk removes them in a single call
+        self.canvas.delete("grid")
+        self.grid.rects[:] = 0
+
+    def paint(self, indices, states):
+        """Recolour the given flat cell indices, leaving beacon squares red."""
+        self.states[indices] = states
+        rects = self.grid.rects
+        beacon = self.grid.beacon
+        for index, state in zip(indices.tolist(), states.tolist()):
+            if not beacon[index]:
+                self.canvas.itemconfig(int(rects[index]), **CELL_STYLES[state])
+
+    def refresh_cell(self, cell):
+        """Redraw one cell after its beacon flag changed."""
+        self.refresh_indices([self.grid.index(cell)])
+
+    def refresh_indices(self, indices):
+        """Redraw the given flat cell indices after their beacon flags changed."""
+        for index in indices:
+            if self.grid.beacon[index]:
+                style = BEACON_STYLE
+            else:
+                style = CELL_STYLES[self.states[index]]
+            self.canvas.itemconfig(int(self.grid.rects[index]), **style)
+
+
+class ImageRenderer:
+    """Composites grid lines, coverage shading and beacons into one RGBA overlay.
+
+    The overlay is split into TILE_SIZE tiles, each shown as a single canvas
+    image, so an update only re-encodes the tiles containing changed cells.
+    """
+
+    # RGBA per overlay state; gray is translucent like the items' gray75 stipple
+    PALETTE = np.array(
+        [
+            (0, 0, 0, 0),
+            (0xD3, 0xD3, 0xD3, 191),
+            (0, 128, 0, 255),
+            (255, 0, 0, 255),
+        ],
+        dtype=np.uint8,
+    )
+    LINE_COLOR = np.array((0, 0, 0, 255), dtype=np.uint8)
+
+    def __init__(self, canvas, grid, offset_x, offset_y):
+        self.canvas = canvas
+        self.grid = grid
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.tiles = {}  # (tile_row, tile_col) -> (canvas item, PhotoImage)
+
+        shape = (grid.num_rows, grid.num_cols)
+        self.states = np.zeros(shape, dtype=np.int8)
+        self.beacons = grid.beacon.reshape(shape)  # A view, kept current by the grid
+
+    def draw_grid(self, cell_width, cell_height):
+        self.layout(cell_width, cell_height)
+        for tile_row, tile_col in self.tile_keys():
+            photo = ImageTk.PhotoImage(self.compose(tile_row, tile_col))
+            item = self.canvas.create_image(
+                self.offset_x + tile_col * TILE_SIZE,
+                self.offset_y + tile_row * TILE_SIZE,
+                anchor=tk.NW,
+                image=photo,
+                tags="grid",
+            )
+            self.tiles[tile_row, tile_col] = (item, photo)
+
+    def layout(self, cell_width, cell_height):
+        """Work out which cell and grid line every overlay pixel belongs to."""
+        num_rows, num_cols = self.grid.num_rows, self.grid.num_cols
+
+        # Pixel edges of every cell, and the cell each overlay pixel belongs to
+        self.x_edges = np.round(np.arange(num_cols + 1) * cell_width).astype(int)
+        self.y_edges = np.round(np.arange(num_rows + 1) * cell_height).astype(int)
+        self.width = int(self.x_edges[-1])
+        self.height = int(self.y_edges[-1])
+        self.col_of_x = np.searchsorted(self.x_edges, np.arange(self.width), "right")
+        self.row_of_y = np.searchsorted(self.y_edges, np.arange(self.height), "right")
+        self.col_of_x -= 1
+        self.row_of_y -= 1
+
+        # Grid lines are drawn on the first pixel row/column of each cell and the last pixel
+        self.line_x = np.zeros(self.width, dtype=bool)
+        self.line_y = np.zeros(self.height, dtype=bool)
+        self.line_x[np.minimum(self.x_edges, self.width - 1)] = True
+        self.line_y[np.minimum(self.y_edges, self.height - 1)] = True
+
+    def tile_keys(self):
+        for tile_row in range(-(-self.height // TILE_SIZE)):
+            for tile_col in range(-(-self.width // TILE_SIZE)):
+                yield tile_row, tile_col
+
+    def clear(self):
+        self.canvas.delete("grid")
+        self.tiles = {}
+
+    def compose(self, tile_row, tile_col):
+        """Render one overlay tile from the cell states."""
+        y0, x0 = tile_row * TILE_SIZE, tile_col * TILE_SIZE
+        y1, x1 = min(y0 + TILE_SIZE, self.height), min(x0 + TILE_SIZE, self.width)
+        block = (self.row_of_y[y0:y1, None], self.col_of_x[None, x0:x1])
+
+        states = np.where(self.beacons[block], BEACON, self.states[block])
+        rgba = self.PALETTE[states]
+        rgba[self.line_y[y0:y1], :] = self.LINE_COLOR
+        rgba[:, self.line_x[x0:x1]] = self.LINE_COLOR
+        return Image.fromarray(rgba, "RGBA")
+
+    def dirty_tiles(self, rows, cols):
+        """Return the tiles overlapped by the given cells."""
+        tile_rows0 = self.y_edges[rows] // TILE_SIZE
+        tile_rows1 = (self.y_edges[rows + 1] - 1) // TILE_SIZE
+        tile_cols0 = self.x_edges[cols] // TILE_SIZE
+        tile_cols1 = (self.x_edges[cols + 1] - 1) // TILE_SIZE
+        tiles = set()
+        for r0, r1, c0, c1 in zip(
+            tile_rows0.tolist(),
+            tile_rows1.tolist(),
+            tile_cols0.tolist(),
+            tile_cols1.tolist(),
+        ):
+            for tile_row in range(r0, r1 + 1):
+                for tile_col in range(c0, c1 + 1):
+                    tiles.add((tile_row, tile_col))
+        return tiles
+
+    def refresh(self, rows, cols):
+        for tile in self.dirty_tiles(rows, cols):
+            if tile in self.tiles:
+                self.tiles[tile][1].paste(self.compose(*tile))
+
+    def paint(self, indices, states):
+        """Update the given flat cell indices and re-encode only the tiles they touch."""
+        if len(indices) == 0:
+            return
+        rows, cols = np.divmod(indices, self.grid.num_cols)
+        self.states[rows, cols] = states
+        self.refresh(rows, cols)
+
+    def refresh_cell(self, cell):
+        """Redraw one cell after its beacon flag changed."""
+        self.refresh_indices([self.grid.index(cell)])
+
+    def refresh_indices(self, indices):
+        """Redraw the given flat cell indices after their beacon flags changed."""
+        if len(indices) == 0:
+            return
+        rows, cols = np.divmod(np.asarray(indices), self.grid.num_cols)
+        self.refresh(rows, cols)
+
+
+class HeadlessRenderer(ImageRenderer):
+    """ImageRenderer without a display: tiles are composed into Pillow images only.
+
+    Used to measure the render stage when replaying sessions with no Tk.
+    """
+
+    def __init__(self, grid):
+        super().__init__(None, grid, 0, 0)
+
+    def draw_grid(self, cell_width, cell_height):
+        self.layout(cell_width, cell_height)
+        for tile in self.tile_keys():
+            self.tiles[tile] = self.compose(*tile)
+
+    def clear(self):
+        self.tiles = {}
+
+    def refresh(self, rows, cols):
+        for tile in self.dirty_tiles(rows, cols):
+            if tile in self.tiles:
+                self.tiles[tile] = self.compose(*tile)
+
+
+RENDERERS = {"Items": ItemRenderer, "Image": ImageRenderer}
@@ -0,0 +1,336 @@
+"""Local copies of the devices and building collections, synced from PocketBase.
+
+Records are stored as PocketBase returns them, in SQLite with an in-memory
+LRU in front. sync() only asks for records whose `updated` autodate is at
+least the newest one held, a page at a time. Building map files are
+downloaded once per file name and stored by the SHA-256 of their content.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+CACHE_DIR = os.environ.get(
+    "DASHBOARD_CACHE", os.path.join(os.path.expanduser("~"), ".dashboard-cache")
+)
+DEVICES = "devices"
+BUILDINGS = "building"
+PAGE_SIZE = 500  # Records per list request; PocketBase allows up to 1000
+ID_CHUNK = 100  # Record IDs per `id = ... || ...` filter, to keep URLs short
+LRU_SIZE = 4096  # Decoded records kept in memory in front of SQLite
+DOWNLOAD_CHUNK = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+);
+CREATE INDEX IF NOT EXISTS records_updated ON records (collection, updated);
+CREATE TABLE IF NOT EXISTS files (
+    collection TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (collection, record_id, filename)
+);
+"""
+
+# An opened building: its record, its device records in relation order, and
+# the local path of its map file (None if it has no map)
+Building = collections.namedtuple("Building", "record devices map_path")
+
+
+class RecordCache:
+    """A least-recently-used {(collection, id): record} map of bounded size."""
+
+    __slots__ = ("size", "entries", "hits", "misses")
+
+    def __init__(self, size=LRU_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        record = self.entries.get(key)
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return record
+
+    def put(self, key, record):
+        self.entries[key] = record
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class Repository:
+    """Paged, cached access to devices and buildings through a PocketBaseService.
+
+    Safe to use from the service's worker threads, e.g. inside service.call().
+    """
+
+    def __init__(self, service, directory=CACHE_DIR, lru_size=LRU_SIZE):
+        self.service = service
+        self.directory = directory
+        self.maps = os.path.join(directory, "maps")
+        os.makedirs(self.maps, exist_ok=True)
+        self.db = sqlite3.connect(
+            os.path.join(directory, "records.sqlite3"), check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.cache = RecordCache(lru_size)
+        self.requests = 0  # Round trips to PocketBase, for benchmarks
+        self.downloads = 0  # Map files fetched rather than found on disk
+
+    def _get(self, path, params):
+        self.requests += 1
+        return self.service.client.send(path, {"method": "GET", "params": params})
+
+    # Local store
+
+    def _store(self, collection, records):
+        """Upsert records and return how many were new or had a different `updated`."""
+        rows = []
+        for record in records:
+            record = {key: value for key, value in record.items() if key != "expand"}
+            rows.append(
+                (collection, record["id"], record["updated"], json.dumps(record))
+            )
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT INTO records (collection, id, updated, data) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (collection, id) DO UPDATE"
+                " SET updated = excluded.updated, data = excluded.data"
+                " WHERE updated != excluded.updated",
+                rows,
+            )
+            changed = self.db.total_changes - before
+            for _, record_id, _, _ in rows:
+                self.cache.pop((collection, record_id))
+        return changed
+
+    def get(self, collection, record_id):
+        """Return a cached record, or None if it has not been fetched."""
+        return self.get_many(collection, [record_id]).get(record_id)
+
+    def get_many(self, collection, record_ids):
+        """Return {id: record} for the given IDs that are cached."""
+        found = {}
+        missing = []
+        with self.lock:
+            for record_id in record_ids:
+                record = self.cache.get((collection, record_id))
+                if record is None:
+                    missing.append(record_id)
+                else:
+                    found[record_id] = record
+            # SQLite limits the number of ? placeholders per statement
+            for start in range(0, len(missing), 500):
+                chunk = missing[start : start + 500]
+                rows = self.db.execute(
+                    "SELECT id, data FROM records WHERE collection = ?"
+                    f" AND id IN ({','.join('?' * len(chunk))})",
+                    [collection] + chunk,
+                )
+                for record_id, data in rows:
+                    record = found[record_id] = json.loads(data)
+                    self.cache.put((collection, record_id), record)
+        return found
+
+    def all(self, collection):
+        """Return every cached record of a collection, oldest update first."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT data FROM records WHERE collection = ? ORDER BY updated, id",
+                (collection,),
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def cursor(self, collection):
+        """Return the newest `updated` held for a collection, or None."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT max(updated) FROM records WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+
+    # Fetching
+
+    def _list(self, collection, params):
+        """Yield each page of a list request until a short page."""
+        page = 1
+        while True:
+            result = self._get(
+                f"/api/collections/{collection}/records",
+                dict(params, page=page, perPage=PAGE_SIZE, skipTotal=1),
+            )
+            yield result["items"]
+            if len(result["items"]) < PAGE_SIZE:
+                return
+            page += 1
+
+    def sync(self, collection):
+        """Fetch the records updated since the last sync; returns how many changed.
+
+        Records sharing the newest `updated` are fetched again rather than
+        risk missing one saved in the same millisecond.
+        """
+        params = {"sort": "updated,id"}
+        since = self.cursor(collection)
+        if since is not None:
+            params["filter"] = self.service.client.filter(
+                "updated >= {:since}", {"since": since}
+            )
+        return sum(
+            self._store(collection, items) for items in self._list(collection, params)
+        )
+
+    def prune(self, collection):
+        """Drop cached records deleted on the server; returns how many were dropped.
+
+        Deletions leave no `updated` behind, so this lists every ID instead.
+        """
+        live = set()
+        for items in self._list(collection, {"fields": "id", "sort": "id"}):
+            live.update(item["id"] for item in items)
+        with self.lock, self.db:
+            held = [
+                record_id
+                for record_id, in self.db.execute(
+                    "SELECT id FROM records WHERE collection = ?", (collection,)
+                )
+            ]
+            gone = [
+                (collection, record_id) for record_id in held if record_id not in live
+            ]
+            self.db.executemany(
+                "DELETE FROM records WHERE collection = ? AND id = ?", gone
+            )
+            for key in gone:
+                self.cache.pop(key)
+        return len(gone)
+
+    def fetch(self, collection, record_ids):
+        """Fetch records by ID, ID_CHUNK per request, and cache them."""
+        record_ids = list(record_ids)
+        for start in range(0, len(record_ids), ID_CHUNK):
+            chunk = record_ids[start : start + ID_CHUNK]
+            names = {f"id{i}": record_id for i, record_id in enumerate(chunk)}
+            query = self.service.client.filter(
+                " || ".join(f"id = {{:{name}}}" for name in names), names
+            )
+            for items in self._list(collection, {"filter": query}):
+                self._store(collection, items)
+
+    def open_building(self, building_id):
+        """Return a Building with its devices and map, in one request when the cache is warm.
+
+        A building seen before is fetched with only the ID and `updated` of
+        each related device, and devices whose `updated` matches the cache
+        are not sent again; only changed ones cost a second request. A new
+        building is fetched with its devices expanded in full.
+        """
+        params = {"expand": "devices"}
+        if self.get(BUILDINGS, building_id) is not None:
+            params["fields"] = "*,expand.devices.id,expand.devices.updated"
+        record = self._get(
+            f"/api/collections/{BUILDINGS}/records/{building_id}", params
+        )
+        related = record.get("expand", {}).get("devices", [])
+        if "fields" in params:
+            held = self.get_many(DEVICES, [device["id"] for device in related])
+            stale = [
+                device["id"]
+                for device in related
+                if device["id"] not in held
+                or held[device["id"]]["updated"] != device["updated"]
+            ]
+            if stale:
+                self.fetch(DEVICES, stale)
+        else:
+            self._store(DEVICES, related)
+        self._store(BUILDINGS, [record])
+
+        device_ids = record.get("devices") or []
+        devices = self.get_many(DEVICES, device_ids)
+        map_path = self.map_file(record) if record.get("map") else None
+        return Building(
+            self.get(BUILDINGS, building_id),
+            [devices[device_id] for device_id in device_ids if device_id in devices],
+            map_path,
+        )
+
+    # Map files
+
+    def map_file(self, record, collection=BUILDINGS):
+        """Return the local path of a record's map, downloading it if its file name is new.
+
+        PocketBase gives every uploaded file a new name, so a known name
+        always means the same content.
+        """
+        filename = record["map"]
+        _, ext = os.path.splitext(filename)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT sha256 FROM files WHERE collection = ? AND record_id = ?"
+                " AND filename = ?",
+                (collection, record["id"], filename),
+            ).fetchone()
+        if row is not None:
+            path = os.path.join(self.maps, row[0] + ext)
+            if os.path.exists(path):
+                return path
+
+        client = self.service.client
+        url = client.build_url(f"/api/files/{collection}/{record['id']}/{filename}")
+        headers = (
+            {"Authorization": client.auth_store.token}
+            if client.auth_store.token
+            else {}
+        )
+        digest = hashlib.sha256()
+        tmp = os.path.join(self.maps, f".{record['id']}.{threading.get_ident()}.tmp")
+        self.requests += 1
+        self.downloads += 1
+        try:
+            with client.http_client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK):
+                        digest.update(chunk)
+                        f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = os.path.join(self.maps, sha256 + ext)
+            os.replace(tmp, path)  # The same content always lands on the same path
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files (collection, record_id, filename, sha256)"
+                " VALUES (?, ?, ?, ?)",
+                (collection, record["id"], filename, sha256),
+            )
+        return path
+
+    def close(self):
+        with self.lock:
+            self.db.close()
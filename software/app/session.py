@@ -0,0 +1,86 @@
+"""Record raw serial lines with their timing and play them back.
+
+A session file is gzip-compressed: a magic header, then per line a
+(microseconds since the previous line, length) record and the raw bytes.
+"""
+
+import gzip
+import struct
+import threading
+import time
+
+MAGIC = b"BLVSESS1"
+RECORD = struct.Struct(">IH")  # Delta in microseconds, line length
+MAX_DELTA = 2**32 - 1  # Longer pauses are shortened to about 71 minutes
+
+
+class SessionRecorder:
+    """Appends timestamped serial lines to a session file.
+
+    Safe to call from several reader threads; lines recorded after close()
+    are ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "wb", compresslevel=6)
+        self.file.write(MAGIC)
+        self.start = None  # Timestamp of the first line
+        self.elapsed = 0  # Microseconds recorded so far, so rounding never drifts
+        self.lines = 0
+        self.lock = threading.Lock()
+
+    def record(self, line, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.start is None:
+                self.start = timestamp
+            delta = round((timestamp - self.start) * 1e6) - self.elapsed
+            if delta > MAX_DELTA:
+                self.start += (delta - MAX_DELTA) / 1e6  # Shorten the pause for good
+                delta = MAX_DELTA
+            delta = max(delta, 0)
+            self.elapsed += delta
+            self.file.write(RECORD.pack(delta, len(line)) + line)
+            self.lines += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_session(path):
+    """Yield (seconds since the first line, raw line) for every line in a session file."""
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        elapsed = 0
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            delta, length = RECORD.unpack(header)
+            elapsed += delta
+            yield elapsed / 1e6, f.read(length)
+
+
+def paced(records, speed=1.0):
+    """Re-yield (t, line) records at speed times their recorded pace, or at once if speed is 0."""
+    start = time.perf_counter()
+    for t, line in records:
+        if speed:
+            delay = start + t / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield t, line
+
+
+def replay(path, sink, speed=1.0):
+    """Feed every line of a session file to sink, e.g. process_serial_data."""
+    for _, line in paced(read_session(path), speed):
+        sink(line)
@@ -0,0 +1,125 @@
+import numpy as np
+
+MIN_ANCHORS = 3  # Ranges needed to fix a position in the plane
+REFINE_ITERATIONS = 5  # Gauss-Newton steps after the linear estimate
+
+
+def cell_positions(beacon_data, grid_size):
+    """Return (beacon_ids, anchors): each beacon's cell center in metres as an (n, 2) array of x, y."""
+    beacon_ids = list(beacon_data)
+    cells = np.array([beacon_data[b] for b in beacon_ids], dtype=float).reshape(-1, 2)
+    anchors = (cells[:, ::-1] + 0.5) * grid_size  # (row, col) -> (x, y)
+    return beacon_ids, anchors
+
+
+def _solve2x2(a, b):
+    """Solve a batch of 2x2 systems a @ x = b in closed form; singular systems give NaN."""
+    det = a[..., 0, 0] * a[..., 1, 1] - a[..., 0, 1] * a[..., 1, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (a[..., 1, 1] * b[..., 0] - a[..., 0, 1] * b[..., 1]) / det
+        y = (a[..., 0, 0] * b[..., 1] - a[..., 1, 0] * b[..., 0]) / det
+    singular = np.abs(det) < 1e-12
+    x[singular] = np.nan
+    y[singular] = np.nan
+    return np.stack([x, y], axis=-1)
+
+
+def solve(anchors, distances, iterations=REFINE_ITERATIONS):
+    """Least-squares positions for a batch of range readings.
+
+    anchors is (n, 2), or (batch, n, 2) when every reading has its own
+    beacons; distances is (batch, n), with NaN where a beacon was not heard.
+    Returns (positions, residuals): (batch, 2) estimates and the (batch, n)
+    differences between the estimated and measured range. Readings with
+    fewer than three usable ranges, or only collinear ones, give NaN.
+
+    The linearised system (each range equation minus their mean) gives a
+    closed-form start, which a few Gauss-Newton steps then refine.
+    """
+    distances = np.atleast_2d(np.asarray(distances, dtype=float))
+    anchors = np.broadcast_to(np.asarray(anchors, dtype=float), distances.shape + (2,))
+    weights = np.isfinite(distances).astype(float)
+    d = np.where(weights > 0, distances, 0.0)
+    count = weights.sum(axis=1, keepdims=True)
+    count[count == 0] = 1
+
+    # |p|^2 - 2 a_i.p + |a_i|^2 = d_i^2; subtracting the mean removes |p|^2
+    mean_anchor = (anchors * weights[..., None]).sum(axis=1) / count
+    rhs = d**2 - (anchors**2).sum(axis=-1)
+    mean_rhs = (rhs * weights).sum(axis=1, keepdims=True) / count
+    a = -2 * (anchors - mean_anchor[:, None, :]) * weights[..., None]
+    b = (rhs - mean_rhs) * weights
+    positions = _solve2x2(
+        np.einsum("bni,bnj->bij", a, a), np.einsum("bni,bn->bi", a, b)
+    )
+
+    for _ in range(iterations):
+        offset = positions[:, None, :] - anchors
+        ranges = np.sqrt((offset**2).sum(axis=-1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            jacobian = offset / ranges[..., None] * weights[..., None]
+        jacobian = np.nan_to_num(jacobian)  # A position exactly on an anchor
+        residuals = (ranges - d) * weights
+        step = _solve2x2(
+            np.einsum("bni,bnj->bij", jacobian, jacobian),
+            np.einsum("bni,bn->bi", jacobian, residuals),
+        )
+        # Keep the previous estimate where a step is undefined
+        positions = np.where(np.isnan(step), positions, positions - step)
+
+    too_few = (weights.sum(axis=1) < MIN_ANCHORS)[:, None]
+    positions = np.where(too_few, np.nan, positions)
+    ranges = np.sqrt(((positions[:, None, :] - anchors) ** 2).sum(axis=-1))
+    residuals = np.where(weights > 0, ranges - distances, np.nan)
+    return positions, residuals
+
+
+def locate(beacon_data, distances, grid_size):
+    """Estimate one position from {beacon_id: metres} for beacons in beacon_data.
+
+    Returns ((x, y), rms_residual) in metres, or None without enough ranges.
+    """
+    return locate_many(beacon_data, {None: distances}, grid_size).get(None)
+
+
+def locate_many(beacon_data, readings, grid_size):
+    """Estimate a position per clicker from {key: {beacon_id: metres}} in one batched solve.
+
+    Returns {key: ((x, y), rms_residual)} for the keys with enough ranges.
+    """
+    heard = {}
+    for key, distances in readings.items():
+        beacon_ids = [b for b in distances if b in beacon_data]
+        if len(beacon_ids) >= MIN_ANCHORS:
+            heard[key] = beacon_ids
+    if not heard:
+        return {}
+
+    # Pad every clicker to the same number of ranges; NaN marks the padding
+    width = max(len(beacon_ids) for beacon_ids in heard.values())
+    anchors = np.zeros((len(heard), width, 2))
+    ranges = np.full((len(heard), width), np.nan)
+    for row, (key, beacon_ids) in enumerate(heard.items()):
+        _, anchors[row, : len(beacon_ids)] = cell_positions(
+            {b: beacon_data[b] for b in beacon_ids}, grid_size
+        )
+        ranges[row, : len(beacon_ids)] = [readings[key][b] for b in beacon_ids]
+    positions, residuals = solve(anchors, ranges)
+
+    estimates = {}
+    for row, key in enumerate(heard):
+        if np.isnan(positions[row]).any():
+            continue
+        rms = float(np.sqrt(np.nanmean(residuals[row] ** 2)))
+        estimates[key] = (float(positions[row, 0]), float(positions[row, 1])), rms
+    return estimates
+
+
+def nearest_beacon(beacon_index, position, grid_size):
+    """Return (beacon_id, metres) for the placed beacon closest to an (x, y) position, or None."""
+    x, y = position
+    found = beacon_index.nearest((y / grid_size, x / grid_size))
+    if not found:
+        return None
+    distance, beacon_id = found[0]
+    return beacon_id, distance * grid_size
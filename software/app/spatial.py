@@ -0,0 +1,181 @@
+import heapq
+import math
+
+BUCKET_CELLS = 8  # Grid cells per side of a spatial bucket
+
+
+class BeaconIndex:
+    """Beacon positions bucketed on a coarse uniform grid, for range and nearest queries.
+
+    Behaves like the {beacon_id: (row, col)} dict it replaces, so it can be
+    passed wherever beacon_data was. Positions and radii are in cells, with
+    each beacon at the center of its cell; multiply by grid_size for metres.
+    Queries only visit the buckets a search radius overlaps, so their cost
+    follows the beacons nearby rather than the number placed.
+    """
+
+    __slots__ = ("bucket_cells", "cells", "at_cell", "buckets")
+
+    def __init__(self, beacons=(), bucket_cells=BUCKET_CELLS):
+        self.bucket_cells = bucket_cells
+        self.cells = {}  # beacon_id -> (row, col)
+        self.at_cell = {}  # (row, col) -> beacon_id
+        self.buckets = {}  # (bucket row, bucket col) -> set of beacon_ids
+        beacons = dict(beacons)
+
+        # Name every beacon that shares a cell, not just the first clash
+        by_cell = {}
+        for beacon_id, cell in beacons.items():
+            by_cell.setdefault((int(cell[0]), int(cell[1])), []).append(beacon_id)
+        shared = [
+            f"{', '.join(map(str, ids))} at {cell}"
+            for cell, ids in by_cell.items()
+            if len(ids) > 1
+        ]
+        if shared:
+            raise ValueError(f"Beacons share a cell: {'; '.join(shared)}")
+
+        for beacon_id, cell in beacons.items():
+            self.add(beacon_id, cell)
+
+    # Mapping interface, as used by code written against the old dict
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __contains__(self, beacon_id):
+        return beacon_id in self.cells
+
+    def __getitem__(self, beacon_id):
+        return self.cells[beacon_id]
+
+    def __repr__(self):
+        return f"BeaconIndex({self.cells!r})"
+
+    def get(self, beacon_id, default=None):
+        return self.cells.get(beacon_id, default)
+
+    def items(self):
+        return self.cells.items()
+
+    def keys(self):
+        return self.cells.keys()
+
+    def values(self):
+        return self.cells.values()
+
+    # Updates
+
+    def _bucket(self, cell):
+        return cell[0] // self.bucket_cells, cell[1] // self.bucket_cells
+
+    def add(self, beacon_id, cell):
+        """Place a beacon; raises ValueError if the ID or the cell is already taken."""
+        cell = (int(cell[0]), int(cell[1]))
+        if beacon_id in self.cells:
+            raise ValueError(f"Beacon {beacon_id} is already placed")
+        if cell in self.at_cell:
+            raise ValueError(f"Cell {cell} already holds beacon {self.at_cell[cell]}")
+        self.cells[beacon_id] = cell
+        self.at_cell[cell] = beacon_id
+        self.buckets.setdefault(self._bucket(cell), set()).add(beacon_id)
+
+    def remove(self, beacon_id):
+        """Forget a beacon and return its cell, or None if it was not placed."""
+        cell = self.cells.pop(beacon_id, None)
+        if cell is None:
+            return None
+        del self.at_cell[cell]
+        bucket = self._bucket(cell)
+        members = self.buckets[bucket]
+        members.discard(beacon_id)
+        if not members:
+            del self.buckets[bucket]
+        return cell
+
+    def move(self, beacon_id, cell):
+        old = self.remove(beacon_id)
+        try:
+            self.add(beacon_id, cell)
+        except ValueError:
+            if old is not None:
+                self.add(beacon_id, old)
+            raise
+
+    # Queries
+
+    def at(self, cell):
+        """Return the ID of the beacon in cell, or None."""
+        return self.at_cell.get((cell[0], cell[1]))
+
+    def within(self, point, radius):
+        """Return [(distance, beacon_id)] for beacons within radius of point, nearest first.
+
+        point is (row, col) in cells, fractional for positions between
+        centers; the center of cell (r, c) is (r + 0.5, c + 0.5).
+        """
+        y, x = point
+        size = self.bucket_cells
+        found = []
+        for bucket_row in range(
+            math.floor((y - radius) / size), math.floor((y + radius) / size) + 1
+        ):
+            for bucket_col in range(
+                math.floor((x - radius) / size), math.floor((x + radius) / size) + 1
+            ):
+                for beacon_id in self.buckets.get((bucket_row, bucket_col), ()):
+                    row, col = self.cells[beacon_id]
+                    distance = math.hypot(row + 0.5 - y, col + 0.5 - x)
+                    if distance <= radius:
+                        found.append((distance, beacon_id))
+        found.sort()
+        return found
+
+    def nearest(self, point, count=1):
+        """Return [(distance, beacon_id)] for the count beacons closest to point, nearest first.
+
+        Searches rings of buckets outwards from the one holding point and
+        stops once no unvisited bucket can hold anything closer.
+        """
+        if not self.cells or count < 1:
+            return []
+        y, x = point
+        size = self.bucket_cells
+        center_row, center_col = math.floor(y / size), math.floor(x / size)
+        best = []  # Max-heap of (-distance, beacon_id), at most count long
+        visited = 0
+        ring = 0
+        while visited < len(self.buckets):
+            # Every bucket in this ring is at least this far from point
+            if len(best) == count and -best[0][0] <= (ring - 1) * size:
+                break
+            for bucket in _ring(center_row, center_col, ring):
+                members = self.buckets.get(bucket)
+                if members is None:
+                    continue
+                visited += 1
+                for beacon_id in members:
+                    row, col = self.cells[beacon_id]
+                    distance = math.hypot(row + 0.5 - y, col + 0.5 - x)
+                    if len(best) < count:
+                        heapq.heappush(best, (-distance, beacon_id))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, beacon_id))
+            ring += 1
+        return sorted((-distance, beacon_id) for distance, beacon_id in best)
+
+
+def _ring(center_row, center_col, ring):
+    """Yield the bucket keys at Chebyshev distance ring from the center bucket."""
+    if ring == 0:
+        yield center_row, center_col
+        return
+    for col in range(center_col - ring, center_col + ring + 1):
+        yield center_row - ring, col
+        yield center_row + ring, col
+    for row in range(center_row - ring + 1, center_row + ring):
+        yield row, center_col - ring
+        yield row, center_col + ring
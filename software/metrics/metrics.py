@@ -0,0 +1,223 @@
+"""Counters, histograms and timers for the visualizer and umbra.
+
+It is a workspace member of its own that app and umbra both depend on, so
+both report in one JSON format that can be compared side by side:
+
+    python -m metrics umbra-metrics.json visualizer-metrics.json
+
+Recording is off until enable() is called; while off, every call returns
+after checking one module flag.
+"""
+
+import collections
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+SAMPLES = 1024  # Recent observations kept per histogram for percentiles
+
+enabled = False
+_registry = {}
+_lock = threading.Lock()
+_started = time.time()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+class Counter:
+    __slots__ = ("name", "value")
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount=1):
+        if enabled:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Count, total and range of every observation, plus recent ones for percentiles."""
+
+    __slots__ = ("name", "count", "total", "min", "max", "recent")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.recent = collections.deque(maxlen=SAMPLES)
+
+    def observe(self, value):
+        if not enabled:
+            return
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        recent = sorted(self.recent)
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": recent[len(recent) // 2],
+            "p99": recent[int(len(recent) * 0.99)],
+        }
+
+
+class Timer(Histogram):
+    """A histogram of seconds, filled by using it as a context manager.
+
+    Start times are kept per thread, so several readers can share one timer.
+    """
+
+    __slots__ = ("local",)
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.local = threading.local()
+
+    def __enter__(self):
+        if enabled:
+            self.local.start = time.perf_counter()
+        else:
+            self.local.start = None
+        return self
+
+    def __exit__(self, *exc):
+        start = self.local.start
+        if start is not None:
+            self.observe(time.perf_counter() - start)
+
+
+def _get(kind, name):
+    metric = _registry.get(name)
+    if metric is None:
+        with _lock:
+            metric = _registry.setdefault(name, kind(name))
+    return metric
+
+
+def counter(name):
+    return _get(Counter, name)
+
+
+def histogram(name):
+    return _get(Histogram, name)
+
+
+def timer(name):
+    return _get(Timer, name)
+
+
+def snapshot(source):
+    """Return every metric as a JSON-ready dict."""
+    counters = {}
+    histograms = {}
+    for name, metric in sorted(_registry.items()):
+        if isinstance(metric, Counter):
+            counters[name] = metric.snapshot()
+        else:
+            histograms[name] = metric.snapshot()
+    return {
+        "source": source,
+        "time": time.time(),
+        "uptime": time.time() - _started,
+        "counters": counters,
+        "histograms": histograms,
+    }
+
+
+def summary(snapshot):
+    """Format a snapshot as short text lines, timers in milliseconds."""
+    lines = [f"{name}: {value}" for name, value in snapshot["counters"].items()]
+    for name, stats in snapshot["histograms"].items():
+        if stats["count"]:
+            lines.append(
+                f"{name}: n={stats['count']} mean={stats['mean'] * 1e3:.2f}ms"
+                f" p99={stats['p99'] * 1e3:.2f}ms"
+            )
+    return lines
+
+
+class Dumper:
+    """Writes a snapshot to path every interval seconds from a daemon thread."""
+
+    def __init__(self, path, source, interval=5.0):
+        self.path = path
+        self.source = source
+        self.interval = interval
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def dump(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(snapshot(self.source), f, indent=1)
+        os.replace(self.path + ".tmp", self.path)  # Readers never see half a file
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self.stopped.set()
+        self.dump()
+
+
+class Profiler:
+    """cProfile capture that can be toggled at runtime; it covers the calling thread."""
+
+    def __init__(self):
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self, path):
+        """Save the capture to path and print the most expensive calls."""
+        profile, self.profile = self.profile, None
+        profile.disable()
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(15)
+        print(f"Profile saved to {path}")
+
+
+if __name__ == "__main__":
+    # Compare dumps side by side, e.g. the edge device and the dashboard
+    dumps = []
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            dumps.append(json.load(f))
+    for dump in dumps:
+        print(f"== {dump['source']} ({dump['uptime']:.0f} s up)")
+        for line in summary(dump):
+            print(f"  {line}")
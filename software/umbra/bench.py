@@ -0,0 +1,753 @@
+"""Benchmarks for umbra's serial pipeline. Run with `python bench.py <name>`."""
+
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+import requests
+import serial
+
+import metrics
+from decoder import (
+    BEACON,
+    HEADER,
+    click_to_json,
+    decode,
+    decode_frames,
+    frame_to_json,
+    parse_line,
+    parse_lines,
+)
+from fake_serial import FakeClicker, make_binary_frame, make_text_frame
+from main import READ_TIMEOUT, forward, to_payload
+from publish import Publisher, parse_address
+from reader import ClickerSessions, FrameReader
+from spool import Spool
+from uploader import Uploader
+from wire import COMPRESSORS, CONTENT_TYPE, MAGIC, decode_body, encode_body
+
+
+def legacy_decode(data):
+    """decode() as main.py implemented it before decoder.py."""
+    bits = 32
+    target = int(data[:bits], 2)
+    num_beacons = int(str(data[: bits * 2])[bits:], 2)
+    uuid = int(str(data[: bits * 3])[bits * 2 :], 2)
+    timestamp = int(str(data[: bits * 4])[bits * 3 :], 2)
+
+    beacons = []
+
+    x = 4
+    for i in range(num_beacons):
+        uuid_b = int(str(data[: bits * (x + 1)])[bits * x :], 2)
+        x += 1
+        tof = int(str(data[: bits * (x + 1)])[bits * x :], 2)
+        x += 1
+
+        beacons.append({"uuid": uuid_b, "tof": tof})
+
+    return {
+        "target": target,
+        "num_beacons": num_beacons,
+        "uuid": uuid,
+        "timestamp": timestamp,
+        "beacons": beacons,
+    }
+
+
+def legacy_parse_line(line):
+    """The character loop main.py ran on every serial line before decoder.py."""
+    value = str(line)
+    try:
+        x = value.decode()
+    except:
+        x = value
+    val = []
+    temp = ""
+    y = 0
+    for v in x:
+
+        y += 1
+        if y <= 6:
+            continue
+        if v == " ":
+            print("APPENDING")
+            val.append(temp)
+            temp = ""
+        print(repr(v))
+
+        temp += v
+    print(val)
+    beacons = []
+
+    num = int(int(val[0]) / 10)
+    for i in range(num):
+        beacon_id = (
+            val[(i * 10) + 1]
+            + val[(i * 10) + 2]
+            + val[(i * 10) + 3]
+            + val[(i * 10) + 4]
+            + val[(i * 10) + 5]
+            + val[(i * 10) + 6]
+            + val[(i * 10) + 7]
+            + val[(i * 10) + 8]
+        )
+        meter = int(val[(i * 10) + 9]) * 100
+        centimeter = int(val[(i * 10) + 10]) + meter
+        print(
+            meter,
+            int(val[(i * 10) + 9]),
+            int(val[(i * 10) + 10]),
+            "+ meter ",
+            centimeter,
+        )
+        beacons.append({"beacon_id": beacon_id, "centimeter": centimeter})
+
+    return {"beacon_num": num, "beacons": beacons}
+
+
+def rate(func, items, seconds=0.5):
+    """Return how many items per second func processes, one call per item."""
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for item in items:
+            func(item)
+        done += len(items)
+    return done / (time.perf_counter() - start)
+
+
+def bench_decode(args):
+    """Frames/sec of the legacy decoders against decoder.py at 1, 8 and 32 beacons."""
+    rng = random.Random(0)
+    print(
+        f"{'beacons':>7} {'format':>6} {'legacy f/s':>11} {'decoder f/s':>12}"
+        f" {'batch f/s':>10}"
+    )
+    for num_beacons in (1, 8, 32):
+        binary = [make_binary_frame(rng, num_beacons) for _ in range(100)]
+        bits = ["".join(f"{byte:08b}" for byte in frame) for frame in binary]
+        text = [make_text_frame(rng, num_beacons) for _ in range(100)]
+
+        # Both decoders must agree before their speed means anything
+        assert legacy_decode(bits[0]) == frame_to_json(decode(bits[0]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert legacy_parse_line(text[0]) == click_to_json(parse_line(text[0]))
+
+        joined_binary = b"".join(binary)
+        joined_text = b"".join(text)
+
+        legacy = rate(legacy_decode, bits)
+        fast = rate(decode, bits)
+        batch = rate(lambda buffer: decode_frames(buffer), [joined_binary]) * 100
+        print(
+            f"{num_beacons:>7} {'bits':>6} {legacy:>11.0f} {fast:>12.0f} {batch:>10.0f}"
+        )
+
+        # The legacy loop printed every character; send that to a buffer, not a tty
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = rate(legacy_parse_line, text)
+        fast = rate(parse_line, text)
+        batch = rate(lambda buffer: parse_lines(buffer), [joined_text]) * 100
+        print(
+            f"{num_beacons:>7} {'text':>6} {legacy:>11.0f} {fast:>12.0f} {batch:>10.0f}"
+        )
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def legacy_reader(port):
+    """Yield frames the way main.py used to: readline, parse, then sleep 0.1 s."""
+    while True:
+        line = port.readline()
+        frames = [parse_line(line)] if line.strip() else []
+        time.sleep(0.1)
+        yield frames
+
+
+def bulk_reader(port):
+    reader = FrameReader(port)
+    while True:
+        yield reader.read()
+
+
+def measure_reader(make_reader, count, rate, seconds):
+    """Feed count frames through a pty and return (frames/sec, latencies in seconds)."""
+    clicker = FakeClicker(num_beacons=8)
+    port = serial.Serial(clicker.port, timeout=READ_TIMEOUT)
+    writer = threading.Thread(target=clicker.run, args=(count, rate), daemon=True)
+
+    received = []
+    start = time.perf_counter()
+    writer.start()
+    for frames in make_reader(port):
+        now = time.perf_counter()
+        received += [now] * len(frames)
+        if len(received) >= count or now - start > seconds:
+            break
+    elapsed = time.perf_counter() - start
+    port.close()
+    clicker.close()
+
+    latencies = [done - sent for done, sent in zip(received, clicker.sent)]
+    return len(received) / elapsed, latencies
+
+
+def bench_reader(args):
+    """Throughput and latency of readline + sleep against FrameReader on a fake port."""
+    readers = {"readline+sleep": legacy_reader, "FrameReader": bulk_reader}
+    # Latency is measured at 8 frames/sec, a rate both readers can keep up with
+    print(f"{'reader':>15} {'max f/s':>9} {'p50 @8/s':>11} {'p99 @8/s':>11}")
+    for name, make_reader in readers.items():
+        throughput, _ = measure_reader(make_reader, 20_000, None, seconds=3)
+        _, latencies = measure_reader(make_reader, 24, 8, seconds=4)
+        print(
+            f"{name:>15} {throughput:>9.0f}"
+            f" {percentile(latencies, 0.5) * 1e3:>9.1f}ms"
+            f" {percentile(latencies, 0.99) * 1e3:>9.1f}ms"
+        )
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Accepts /api/click posts like PocketBase would, with keep-alive."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        content_type = self.headers.get("Content-Type", "")
+        encoding = self.headers.get("Content-Encoding")
+        status = 503 if self.server.failing else 200
+        if not self.server.compact and (content_type == CONTENT_TYPE or encoding):
+            status = 415  # A backend that only takes plain JSON
+        if status == 200:
+            payloads = decode_body(body, content_type, encoding)
+            with self.server.lock:
+                self.server.received.extend(payloads)
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.received = []
+    server.failing = False
+    server.compact = True
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/click"
+
+
+def wait_for(condition, seconds=30):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def offer(submit, payloads, rate):
+    """Call submit for each payload, at rate per second or all at once."""
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        submit(payload)
+
+
+def bench_upload(args):
+    """Throughput and enqueue-to-ack latency of per-reading posts against Uploader."""
+    rng = random.Random(0)
+    count, rate = 2000, 200
+    payloads = [
+        {"seq": i, **click_to_json(parse_line(make_text_frame(rng, 8)))}
+        for i in range(count)
+    ]
+    server, url = stub_server()
+
+    # Throughput with everything offered at once; latency at a steady 200/s
+    print(f"{'uploader':>18} {'payloads/s':>11} {'p99 ack @200/s':>15}")
+    start = time.perf_counter()
+    offer(lambda payload: requests.post(url, json=payload), payloads, None)
+    throughput = count / (time.perf_counter() - start)
+    latencies = []
+
+    def post(payload):
+        # The old loop blocked the serial read for the whole post
+        sent = time.perf_counter()
+        requests.post(url, json=payload)
+        latencies.append(time.perf_counter() - sent)
+
+    offer(post, payloads[: rate * 2], rate)
+    print(
+        f"{'requests.post':>18} {throughput:>11.0f}"
+        f" {percentile(latencies, 0.99) * 1e3:>13.2f}ms"
+    )
+
+    for batch_size in (1, 50):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = Spool(spool_dir)
+            uploader = Uploader(url, spool, batch_size=batch_size)
+            uploader.start()
+            start = time.perf_counter()
+            offer(uploader.submit, payloads, None)
+            wait_for(lambda: uploader.sent >= count)
+            throughput = count / (time.perf_counter() - start)
+            uploader.stop()
+
+            uploader = Uploader(url, spool, batch_size=batch_size)
+            uploader.start()
+            offer(uploader.submit, payloads[: rate * 2], rate)
+            wait_for(lambda: uploader.sent >= rate * 2)
+            uploader.stop()
+            spool.close()
+        print(
+            f"{f'Uploader batch={batch_size}':>18} {throughput:>11.0f}"
+            f" {uploader.stats()['p99_latency'] * 1e3:>13.2f}ms"
+        )
+
+    # Outage: the backend is unreachable and umbra restarts before it returns
+    server.received = []
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spool = Spool(spool_dir, segment_bytes=64 << 10)
+        uploader = Uploader("http://127.0.0.1:9/api/click", spool, batch_size=50)
+        uploader.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for payload in payloads:
+                uploader.submit(payload)
+            time.sleep(0.5)
+            spool.close()  # Abandon the retrying worker, as a crash would
+
+            spool = Spool(spool_dir, segment_bytes=64 << 10)
+            replayed = spool.pending
+            uploader = Uploader(url, spool, batch_size=50)
+            uploader.start()
+            wait_for(lambda: uploader.sent >= replayed)
+            uploader.stop()
+        segments = len(spool._segments())
+        spool.close()
+    order = [payload["seq"] for payload in server.received]
+    assert order == list(range(count)), "payloads arrived out of order"
+    print(
+        f"outage: {replayed} replayed from the spool after a restart,"
+        f" all {count} delivered in order, {segments} segment left after compaction"
+    )
+    server.shutdown()
+
+
+def synthetic_day(rng, clickers=40, beacons=60, hours=10, interval=30):
+    """A working day of /api/click payloads from one building, in time order.
+
+    Half the clickers send binary frames and half text frames on their own
+    port; each click hears 4 to 10 of the building's beacons.
+    """
+    beacon_bytes = [[rng.randrange(256) for _ in range(8)] for _ in range(beacons)]
+    beacon_uuids = [rng.getrandbits(32) for _ in range(beacons)]
+    start = 1_760_000_000
+    clicks = []
+    for clicker in range(clickers):
+        t = start + rng.expovariate(1 / interval)
+        while t < start + hours * 3600:
+            clicks.append((t, clicker))
+            t += rng.expovariate(1 / interval)
+    clicks.sort()
+
+    payloads = []
+    for t, clicker in clicks:
+        heard = rng.sample(range(beacons), rng.randint(4, 10))
+        if clicker % 2:
+            frame = b"".join(
+                BEACON.pack(beacon_uuids[i], rng.randrange(2000)) for i in heard
+            )
+            header = HEADER.pack(1, len(heard), 1000 + clicker, int(t))
+            (frame,), _ = decode_frames(header + frame)
+            payloads.append(to_payload(frame, True, None))
+        else:
+            tokens = ["255", str(len(heard) * 10)]
+            for i in heard:
+                tokens += map(str, beacon_bytes[i])
+                tokens += [str(rng.randrange(20)), str(rng.randrange(100))]
+            line = " ".join(tokens).encode()
+            payloads.append(to_payload(parse_line(line), False, f"COM{clicker}"))
+    return payloads
+
+
+def bench_wire(args):
+    """Bytes and CPU per payload for JSON and compact uploads over a synthetic day."""
+    rng = random.Random(0)
+    payloads = synthetic_day(rng)
+    print(f"{len(payloads)} payloads in a 10 hour day; bodies only, no HTTP headers")
+    print(
+        f"{'encoding':>22} {'batch':>5} {'MB/day':>7} {'B/payload':>10}"
+        f" {'encode us':>10} {'decode us':>10}"
+    )
+    setups = [("json", 1, None), ("json", 50, None), ("json", 50, "gzip")]
+    setups += [("compact", 1, None), ("compact", 50, None)]
+    setups += [("compact", 50, compression) for compression in sorted(COMPRESSORS)]
+    for wire, batch_size, compression in setups:
+        batches = [
+            payloads[i : i + batch_size] for i in range(0, len(payloads), batch_size)
+        ]
+        compact = wire == "compact"
+        start = time.perf_counter()
+        bodies = [encode_body(batch, compact, compression) for batch in batches]
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        received = [
+            decode_body(body, headers["Content-Type"], headers.get("Content-Encoding"))
+            for body, headers in bodies
+        ]
+        decode = time.perf_counter() - start
+        assert [p for batch in received for p in batch] == payloads
+        size = sum(len(body) for body, _ in bodies)
+        label = wire if compression is None else f"{wire} + {compression}"
+        print(
+            f"{label:>22} {batch_size:>5} {size / 1e6:>7.2f}"
+            f" {size / len(payloads):>10.1f} {encode / len(payloads) * 1e6:>10.2f}"
+            f" {decode / len(payloads) * 1e6:>10.2f}"
+        )
+
+    # Corrupt batches may only raise ValueError, never IndexError or StopIteration
+    body, _ = encode_body(payloads[:50], True)
+    rejected = 0
+    for _ in range(20_000):
+        corrupt = bytearray(body)
+        for _ in range(rng.randint(1, 4)):
+            corrupt[rng.randrange(len(corrupt))] = rng.randrange(256)
+        corrupt = corrupt[: rng.randint(len(MAGIC), len(corrupt))]
+        try:
+            decode_body(bytes(corrupt), CONTENT_TYPE)
+        except ValueError:
+            rejected += 1
+    print(f"corrupted compact bodies: {rejected} of 20000 rejected, none crashed")
+
+    # Negotiation: a backend that only takes JSON answers 415 and gets JSON
+    sample = payloads[:500]
+    for accepts in (True, False):
+        server, url = stub_server()
+        server.compact = accepts
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = Spool(spool_dir)
+            uploader = Uploader(
+                url, spool, batch_size=50, compact=True, compression="gzip"
+            )
+            uploader.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                offer(uploader.submit, sample, None)
+                wait_for(lambda: uploader.sent >= len(sample))
+            uploader.stop()
+            spool.close()
+        server.shutdown()
+        assert server.received == sample
+        print(
+            f"backend {'accepts' if accepts else 'rejects'} compact:"
+            f" all {len(sample)} delivered as {'compact' if uploader.compact else 'JSON'},"
+            f" {uploader.bytes_sent} bytes"
+        )
+
+
+def subscriber(address, count, results):
+    """Read count published frames, as the visualizer would, and report when each arrived.
+
+    Also reports the CPU seconds the reading took, leaving out process startup.
+    """
+    with socket.create_connection(parse_address(address)) as sock:
+        results.put(None)  # Connected
+        cpu = time.process_time()
+        arrived = []
+        for line in sock.makefile("rb"):
+            json.loads(line)
+            arrived.append(time.time())
+            if len(arrived) == count:
+                break
+    results.put((arrived, time.process_time() - cpu))
+
+
+def fan_out(context, subscribers, count, rate):
+    """Forward count frames from a fake clicker to subscriber processes.
+
+    Returns (latencies, seconds, umbra CPU seconds, subscribers' CPU seconds).
+    """
+    publisher = Publisher("127.0.0.1:0")
+    results = context.Queue()
+    processes = [
+        context.Process(target=subscriber, args=(publisher.address, count, results))
+        for _ in range(subscribers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        results.get()
+    wait_for(lambda: publisher.stats()["subscribers"] == subscribers)
+
+    clicker = FakeClicker(num_beacons=8)
+    port = serial.Serial(clicker.port, timeout=READ_TIMEOUT)
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=forward,
+        args=(
+            FrameReader(port),
+            "COM3",
+            False,
+            lambda payload: None,
+            ClickerSessions(),
+            stopped,
+            publisher.publish,
+        ),
+        daemon=True,
+    )
+    thread.start()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    wall = time.time() - start  # perf_counter to epoch seconds
+    clicker.run(count, rate)
+    wait_for(lambda: publisher.published >= count)
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    stopped.set()
+    thread.join()
+    port.close()
+    clicker.close()
+    publisher.close()
+
+    latencies = [
+        arrived - (sent + wall)
+        for times, _ in reports
+        for arrived, sent in zip(times, clicker.sent)
+    ]
+    return latencies, elapsed, cpu, sum(cpu for _, cpu in reports)
+
+
+def bench_fanout(args):
+    """Serial-to-subscriber latency and umbra's CPU with 0 to 20 subscribers, plus a stalled one."""
+    count, rate = 1000, 200
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{count} text frames of 8 beacons at {rate}/s through a pty;"
+        " subscribers are separate processes"
+    )
+    print(
+        f"{'subscribers':>11} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}"
+        f" {'umbra CPU':>10} {'us/frame':>9} {'per subscriber':>15}"
+    )
+    for subscribers in (0, 1, 5, 20):
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, elapsed, cpu, child_cpu = fan_out(
+                context, subscribers, count, rate
+            )
+        if latencies:
+            timing = (
+                f"{percentile(latencies, 0.5) * 1e3:>7.2f}"
+                f" {percentile(latencies, 0.99) * 1e3:>7.2f}"
+                f" {max(latencies) * 1e3:>7.2f}"
+            )
+        else:
+            timing = f"{'-':>7} {'-':>7} {'-':>7}"
+        share = child_cpu / elapsed / subscribers if subscribers else 0.0
+        print(
+            f"{subscribers:>11} {timing} {cpu / elapsed:>10.1%}"
+            f" {cpu / count * 1e6:>9.0f} {share:>15.1%}"
+        )
+    print("latency is from the pty write to the subscriber's json.loads;")
+    print("umbra CPU includes the fake clicker writing, alike in every row")
+
+    # One subscriber that never reads is dropped once the kernel's socket
+    # buffers and then its own 64 frames fill up; the other keeps up
+    publisher = Publisher("127.0.0.1:0", buffer_frames=64)
+    reader = socket.create_connection(parse_address(publisher.address))
+    stalled = socket.socket()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.connect(parse_address(publisher.address))
+    payload = click_to_json(parse_line(make_text_frame(random.Random(0), 8)))
+    lines = reader.makefile("rb")
+    published = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        wait_for(lambda: publisher.stats()["subscribers"] == 2)
+        while not publisher.dropped and published < 100_000:
+            publisher.publish(payload)
+            json.loads(lines.readline())
+            published += 1
+        stats = publisher.stats()
+        publisher.close()
+    stalled.close()
+    reader.close()
+    assert stats["dropped"] == 1 and stats["subscribers"] == 1
+    print(
+        f"stalled subscriber: dropped after {published} frames;"
+        " the other received every one"
+    )
+
+
+def bench_spool(args):
+    """Spool appends/sec with group commit on and off, then replay and compaction."""
+    rng = random.Random(0)
+    payloads = [
+        [time.time(), click_to_json(parse_line(make_text_frame(rng, 8)))]
+        for _ in range(20_000)
+    ]
+    print(f"spool in {os.path.abspath(args.dir)}")
+    print(f"{'commit':>14} {'appends/s':>10} {'fsyncs':>7}")
+    for group_commit, count in ((False, 500), (True, len(payloads))):
+        with tempfile.TemporaryDirectory(dir=args.dir) as spool_dir:
+            spool = Spool(spool_dir, group_commit=group_commit)
+            start = time.perf_counter()
+            for payload in payloads[:count]:
+                spool.append(payload)
+            spool.sync()
+            appends = count / (time.perf_counter() - start)
+            name = "group (50ms)" if group_commit else "each append"
+            print(f"{name:>14} {appends:>10.0f} {spool.syncs:>7}")
+            spool.close()
+
+    # Replay a backlog in 4 MB segments, at umbra's default batch of 1 and at 50
+    for batch_size in (1, 50):
+        with tempfile.TemporaryDirectory(dir=args.dir) as spool_dir:
+            spool = Spool(spool_dir)
+            for payload in payloads:
+                spool.append(payload)
+            before = len(spool._segments())
+            start = time.perf_counter()
+            while True:
+                batch = spool.read(batch_size)
+                if not batch:
+                    break
+                spool.ack(batch[-1][0], len(batch))
+            replay = len(payloads) / (time.perf_counter() - start)
+            spool.close()
+            print(
+                f"replay: {replay:.0f} records/s with an ack per {batch_size},"
+                f" {before} segments compacted to {len(spool._segments())}"
+            )
+
+
+def per_call(func, calls=1_000_000):
+    """Best-of-three nanoseconds per call of func, net of the loop itself."""
+
+    def loop(body):
+        best = math.inf
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(calls):
+                body()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    return (loop(func) - loop(lambda: None)) / calls * 1e9
+
+
+def bench_metrics(args):
+    """Cost of timers and counters with metrics off and on, and reader throughput."""
+    timer = metrics.timer("bench.timer")
+    counter = metrics.counter("bench.counter")
+
+    def use_timer():
+        with timer:
+            pass
+
+    print(f"{'metrics':>8} {'timer (ns)':>11} {'counter (ns)':>13} {'reader f/s':>11}")
+    for enabled in (False, True):
+        if enabled:
+            metrics.enable()
+        frames, _ = measure_reader(bulk_reader, 20_000, None, seconds=3)
+        print(
+            f"{'on' if enabled else 'off':>8} {per_call(use_timer):>11.0f}"
+            f" {per_call(counter.inc):>13.0f} {frames:>11.0f}"
+        )
+    metrics.disable()
+
+
+def bench_devices(args):
+    """Frames/sec from 1 to 64 fake clickers, one reader thread per port into one spool."""
+    per_device = 2000
+    print(f"{'devices':>7} {'frames/s':>9} {'per device':>11} {'sessions':>9}")
+    for count in (1, 4, 16, 64):
+        clickers = [
+            FakeClicker(binary=True, num_beacons=8, seed=i, uuid=1000 + i)
+            for i in range(count)
+        ]
+        ports = [serial.Serial(c.port, timeout=READ_TIMEOUT) for c in clickers]
+        sessions = ClickerSessions()
+        stopped = threading.Event()
+        with tempfile.TemporaryDirectory(dir=args.dir) as spool_dir:
+            spool = Spool(spool_dir)
+            readers = [
+                threading.Thread(
+                    target=forward,
+                    args=(
+                        FrameReader(port, binary=True),
+                        clicker.port,
+                        True,
+                        spool.append,
+                        sessions,
+                        stopped,
+                    ),
+                    daemon=True,
+                )
+                for clicker, port in zip(clickers, ports)
+            ]
+            writers = [
+                threading.Thread(target=c.run, args=(per_device,), daemon=True)
+                for c in clickers
+            ]
+            with contextlib.redirect_stdout(io.StringIO()):  # "New clicker" lines
+                start = time.perf_counter()
+                for thread in readers + writers:
+                    thread.start()
+                wait_for(lambda: spool.appends >= count * per_device, seconds=120)
+                elapsed = time.perf_counter() - start
+            stopped.set()
+            for thread in readers:
+                thread.join()
+            spool.close()
+
+        frames = {s.clicker_id: s.frames for s in sessions.sessions.values()}
+        assert frames == {1000 + i: per_device for i in range(count)}, frames
+        for port, clicker in zip(ports, clickers):
+            port.close()
+            clicker.close()
+        total = count * per_device / elapsed
+        print(f"{count:>7} {total:>9.0f} {total / count:>11.0f} {len(frames):>9}")
+
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "devices": bench_devices,
+    "fanout": bench_fanout,
+    "metrics": bench_metrics,
+    "reader": bench_reader,
+    "spool": bench_spool,
+    "upload": bench_upload,
+    "wire": bench_wire,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--dir", default=".", help="where spool benchmarks write (fsync cost varies)"
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
@@ -0,0 +1,116 @@
+import collections
+import struct
+
+# Binary frame: target, num_beacons, uuid, timestamp, then (uuid, tof) per beacon
+HEADER = struct.Struct(">IIII")
+BEACON = struct.Struct(">II")
+
+# Text frame: "255 <length> " then 10 decimal tokens per beacon
+START_MARKER = b"255"
+TOKENS_PER_BEACON = 10
+
+Frame = collections.namedtuple("Frame", "target num_beacons uuid timestamp beacons")
+Beacon = collections.namedtuple("Beacon", "uuid tof")
+Click = collections.namedtuple("Click", "beacon_num beacons")
+BeaconRange = collections.namedtuple("BeaconRange", "beacon_id centimeter")
+
+
+def decode_frames(buffer):
+    """Decode every complete binary frame in buffer.
+
+    Returns (frames, consumed): the decoded frames and the number of bytes
+    they used, so a trailing partial frame can be kept for the next read.
+    """
+    view = memoryview(buffer)
+    frames = []
+    offset = 0
+    while len(view) - offset >= HEADER.size:
+        target, num_beacons, uuid, timestamp = HEADER.unpack_from(view, offset)
+        end = offset + HEADER.size + num_beacons * BEACON.size
+        if end > len(view):
+            break
+        beacons = tuple(
+            map(Beacon._make, BEACON.iter_unpack(view[offset + HEADER.size : end]))
+        )
+        frames.append(Frame(target, num_beacons, uuid, timestamp, beacons))
+        offset = end
+    return frames, offset
+
+
+def decode(data):
+    """Decode one frame sent as a string of '0'/'1' characters, 32 per field."""
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("ascii")
+    data = data.strip()
+    data = data[: len(data) - len(data) % 32]  # Ignore a partial trailing field
+    if len(data) < HEADER.size * 8:
+        raise ValueError(f"Incomplete frame of {len(data)} bits")
+    # One int() over the whole frame instead of one per 32-bit field
+    raw = int(data, 2).to_bytes(len(data) // 8, "big")
+    target, num_beacons, uuid, timestamp = HEADER.unpack_from(raw)
+    end = HEADER.size + num_beacons * BEACON.size
+    if len(raw) < end:
+        raise ValueError(f"Incomplete frame of {len(data)} bits")
+    beacons = tuple(map(Beacon._make, BEACON.iter_unpack(raw[HEADER.size : end])))
+    return Frame(target, num_beacons, uuid, timestamp, beacons)
+
+
+def parse_line(line):
+    """Parse one space-separated text frame such as b'255 20 49 9 ... 0 80 \\n'.
+
+    A beacon's ID is its eight ID bytes in decimal, each preceded by a space,
+    which is the form the backend has always received. Its range is the metre
+    and centimetre bytes combined into centimetres.
+    """
+    tokens = line.split()
+    if len(tokens) < 2 or tokens[0] != START_MARKER:
+        raise ValueError(f"Not a frame: {line!r}")
+
+    beacon_num = int(tokens[1]) // TOKENS_PER_BEACON
+    end = 2 + beacon_num * TOKENS_PER_BEACON
+    if len(tokens) < end:
+        raise ValueError(f"Truncated frame: {line!r}")
+
+    beacons = []
+    for i in range(2, end, TOKENS_PER_BEACON):
+        beacon_id = b" " + b" ".join(tokens[i : i + 8])
+        beacon_id = beacon_id.decode("ascii")
+        centimeter = int(tokens[i + 8]) * 100 + int(tokens[i + 9])
+        beacons.append(BeaconRange(beacon_id, centimeter))
+    return Click(beacon_num, tuple(beacons))
+
+
+def parse_lines(buffer):
+    """Parse every newline-terminated text frame in buffer.
+
+    Returns (clicks, rejected): the parsed frames and the lines that were not
+    valid frames.
+    """
+    clicks = []
+    rejected = []
+    for line in bytes(buffer).splitlines():
+        if not line.strip():
+            continue
+        try:
+            clicks.append(parse_line(line))
+        except ValueError:
+            rejected.append(line)
+    return clicks, rejected
+
+
+def click_to_json(click):
+    """Return the /api/click payload for a parsed text frame."""
+    return {
+        "beacon_num": click.beacon_num,
+        "beacons": [
+            {"beacon_id": beacon.beacon_id, "centimeter": beacon.centimeter}
+            for beacon in click.beacons
+        ],
+    }
+
+
+def frame_to_json(frame):
+    """Return the /api/click payload for a decoded binary frame."""
+    payload = frame._asdict()
+    payload["beacons"] = [beacon._asdict() for beacon in frame.beacons]
+    return payload
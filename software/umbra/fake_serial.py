@@ -0,0 +1,89 @@
+"""A pseudo-terminal that behaves like a clicker on a serial port.
+
+Run `python fake_serial.py` and point umbra's --port at the printed device to
+test locally without hardware.
+"""
+
+import argparse
+import os
+import random
+import time
+import tty
+
+from decoder import BEACON, HEADER
+
+
+def make_binary_frame(rng, num_beacons, uuid=None):
+    beacons = b"".join(
+        BEACON.pack(rng.getrandbits(32), rng.randrange(10_000))
+        for _ in range(num_beacons)
+    )
+    if uuid is None:
+        uuid = rng.getrandbits(32)
+    header = HEADER.pack(1, num_beacons, uuid, int(time.time()))
+    return header + beacons
+
+
+def make_text_frame(rng, num_beacons):
+    tokens = ["255", str(num_beacons * 10)]
+    for _ in range(num_beacons):
+        tokens += [str(rng.randrange(256)) for _ in range(8)]
+        tokens += [str(rng.randrange(20)), str(rng.randrange(100))]
+    return (" ".join(tokens) + " \n").encode()
+
+
+class FakeClicker:
+    """Writes synthetic frames into a pty whose other end opens like a serial port."""
+
+    def __init__(self, binary=False, num_beacons=2, seed=0, uuid=None):
+        self.binary = binary
+        self.num_beacons = num_beacons
+        self.rng = random.Random(seed)
+        self.uuid = uuid  # Fixed clicker UUID in binary frames, random if None
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # No echo or newline translation, like a real UART
+        self.port = os.ttyname(self.slave)
+        self.sent = []  # perf_counter() of each frame written, for latency
+
+    def frame(self):
+        if self.binary:
+            return make_binary_frame(self.rng, self.num_beacons, self.uuid)
+        return make_text_frame(self.rng, self.num_beacons)
+
+    def run(self, count, rate=None):
+        """Write count frames, at rate frames/sec or as fast as the reader drains them."""
+        interval = 1 / rate if rate else 0
+        start = time.perf_counter()
+        for i in range(count):
+            if interval:
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            frame = self.frame()
+            self.sent.append(time.perf_counter())
+            try:
+                os.write(self.master, frame)
+            except OSError:
+                return  # The pty was closed under us
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--beacons", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=100, help="frames per second")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    clicker = FakeClicker(binary=args.binary, num_beacons=args.beacons)
+    print(f"Fake clicker on {clicker.port}")
+    try:
+        clicker.run(args.count, args.rate)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        clicker.close()
@@ -1,57 +1,20 @@
-import serial.tools.list_ports
-import requests
+import argparse
+import os
+import threading
 import time
+import serial.tools.list_ports
 from datetime import datetime
 import json
 
-# ports = serial.tools.list_ports.comports()
-serial_inst = serial.Serial(baudrate=115200, port="COM3")
-
-# port_list = []
-
-# i = 1
-# for port in ports:
-# 	port_list.append(str(port))
-# 	print(f"{i}. {str(port)}")
-# 	i += 1
-
-# val = int(input("Select Port: "))
-# # print(f"Selected com port -> {}")
-
-# serial_inst.baudrate = 9600
-# serial_inst.port = port_list[val-1]
-# serial_inst.open()
-
-# inp = b'159,3\n'.decode()
-
-
-def decode(data):
-    bits = 32
-    target = int(data[:bits], 2)
-    num_beacons = int(str(data[: bits * 2])[bits:], 2)
-    uuid = int(str(data[: bits * 3])[bits * 2 :], 2)
-    timestamp = int(str(data[: bits * 4])[bits * 3 :], 2)
-    # print(str(data[:bits*4])[bits*3:])
-
-    beacons = []
-
-    x = 4
-    for i in range(num_beacons):
-        uuid_b = int(str(data[: bits * (x + 1)])[bits * x :], 2)
-        x += 1
-        tof = int(str(data[: bits * (x + 1)])[bits * x :], 2)
-        x += 1
-
-        beacons.append({"uuid": uuid_b, "tof": tof})
-
-    return {
-        "target": target,
-        "num_beacons": num_beacons,
-        "uuid": uuid,
-        "timestamp": timestamp,
-        "beacons": beacons,
-    }
+import metrics
+from decoder import click_to_json, frame_to_json
+from reader import ClickerSessions, FrameReader
+from publish import PUBLISH_ADDRESS, Publisher
+from spool import Spool
+from uploader import Uploader
+from wire import COMPRESSORS
 
+READ_TIMEOUT = 0.05  # Longest an idle read blocks before the loop comes back round
 
 # data_dict = {
 #     "clicker_id": "123",
@@ -65,69 +28,188 @@ def decode(data):
 # # val = b'255 20 49 9 88 159 72 74 134 83 0 54 136 28 56 144 72 74 134 83 0 80 \n'
 
 
-while True:
-    value = str(serial_inst.readline())
-
-    if value is not None and value != "":
-        # print(value)
-        try:
-            x = value.decode()
-        except:
-            x = value
-        val = []
-        temp = ""
-        y = 0
-        for v in x:
-
-            y += 1
-            if y <= 6:
-                continue
-            if v == " ":
-                print("APPENDING")
-                val.append(temp)
-                temp = ""
-            print(repr(v))
-
-            temp += v
-        # val = val.decode().split(" ")
-        print(val)
-        beacons = []
-
-        num = int(int(val[0]) / 10)
-
-        # print(meter, int(val[10]), int(val[i+11]), "+ meter ",  centimeter)
-
-        # beacons.append({"beacon_id": beacon_id, "centimeter": centimeter})
-        for i in range(num):
-            beacon_id = (
-                val[(i * 10) + 1]
-                + val[(i * 10) + 2]
-                + val[(i * 10) + 3]
-                + val[(i * 10) + 4]
-                + val[(i * 10) + 5]
-                + val[(i * 10) + 6]
-                + val[(i * 10) + 7]
-                + val[(i * 10) + 8]
-            )
-            meter = int(val[(i * 10) + 9]) * 100
-            centimeter = int(val[(i * 10) + 10]) + meter
-
-            print(
-                meter,
-                int(val[(i * 10) + 9]),
-                int(val[(i * 10) + 10]),
-                "+ meter ",
-                centimeter,
-            )
-
-            beacons.append({"beacon_id": beacon_id, "centimeter": centimeter})
-
-        data_dict = {"beacon_num": num, "beacons": beacons}
-
-        requests.post(
-            "http://localhost:8090/api/click", json=data_dict
-        )  # Todo: Fix URL
-
-        # Either in json, data or body. Either as string or as a dict
-
-    time.sleep(0.1)
+def parse_args():
+    """Serial settings come from the command line, falling back to UMBRA_* variables."""
+    parser = argparse.ArgumentParser(description="Forward clicker frames to PocketBase")
+    parser.add_argument(
+        "--port",
+        nargs="+",
+        default=os.environ.get("UMBRA_PORT", "COM3").split(","),
+        help="one or more serial ports, each read by its own thread",
+    )
+    parser.add_argument(
+        "--baud", type=int, default=int(os.environ.get("UMBRA_BAUD", "115200"))
+    )
+    parser.add_argument(
+        "--binary",
+        action="store_true",
+        default=os.environ.get("UMBRA_BINARY") == "1",
+        help="the clicker sends length-prefixed binary frames instead of text lines",
+    )
+    parser.add_argument(
+        "--url", default=os.environ.get("UMBRA_URL", "http://localhost:8090/api/click")
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="payloads per request; above 1 they are posted as a JSON list",
+    )
+    parser.add_argument(
+        "--wire",
+        choices=("json", "compact"),
+        default=os.environ.get("UMBRA_WIRE", "json"),
+        help="compact posts column-encoded batches, falling back to JSON on a 415",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSORS),
+        default=os.environ.get("UMBRA_COMPRESS"),
+        help="compress request bodies (zstd needs the zstandard package)",
+    )
+    parser.add_argument(
+        "--spool",
+        default=os.environ.get("UMBRA_SPOOL", "umbra-spool"),
+        help="directory of the on-disk log that holds payloads until they are sent",
+    )
+    parser.add_argument(
+        "--fsync-each",
+        action="store_true",
+        help="fsync every payload instead of committing them in groups",
+    )
+    parser.add_argument(
+        "--publish",
+        nargs="?",
+        const=PUBLISH_ADDRESS,
+        default=os.environ.get("UMBRA_PUBLISH"),
+        help="republish frames to local subscribers such as the visualizer,"
+        f" on host:port (default {PUBLISH_ADDRESS})",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=os.environ.get("UMBRA_METRICS"),
+        help="file to dump counters and timings to as JSON every few seconds",
+    )
+    parser.add_argument("--metrics-interval", type=float, default=5.0)
+    parser.add_argument(
+        "--profile", help="run the read loop under cProfile and save it to this file"
+    )
+    parser.add_argument(
+        "--list-ports", action="store_true", help="print the available ports and exit"
+    )
+    return parser.parse_args()
+
+
+def to_payload(frame, binary, port):
+    """Return the /api/click payload for a frame, tagged with the clicker that sent it.
+
+    Binary frames carry the clicker's UUID; text frames do not, so their
+    clicker is identified by the port it is plugged into.
+    """
+    if binary:
+        payload = frame_to_json(frame)
+        payload["clicker_id"] = frame.uuid
+    else:
+        payload = click_to_json(frame)
+        payload["clicker_id"] = port
+    return payload
+
+
+def forward(reader, port, binary, submit, sessions, stopped, publish=None):
+    """Read one port until stopped, submitting and publishing a payload per frame."""
+    while not stopped.is_set():
+        frames = reader.read()
+        read_at = time.time()
+        for frame in frames:
+            payload = to_payload(frame, binary, port)
+            sessions.seen(payload["clicker_id"], port)
+            submit(payload)
+            if publish is not None:
+                publish(payload, read_at)
+
+
+def main():
+    args = parse_args()
+    if args.list_ports:
+        for i, port in enumerate(serial.tools.list_ports.comports(), start=1):
+            print(f"{i}. {port}")
+        return
+
+    readers = [
+        FrameReader(
+            serial.Serial(port=port, baudrate=args.baud, timeout=READ_TIMEOUT),
+            binary=args.binary,
+        )
+        for port in args.port
+    ]
+    spool = Spool(args.spool, group_commit=not args.fsync_each)
+    if spool.pending:
+        print(f"Replaying {spool.pending} payloads left in {args.spool}")
+    uploader = Uploader(
+        args.url,
+        spool,
+        batch_size=args.batch_size,
+        compact=args.wire == "compact",
+        compression=args.compress,
+    )
+    uploader.start()
+    print(f"Reading {', '.join(args.port)} at {args.baud} baud")
+    publisher = publish = None
+    if args.publish:
+        publisher = Publisher(args.publish)
+        publish = publisher.publish
+        print(f"Publishing frames on {publisher.address}")
+
+    dumper = None
+    if args.metrics:
+        metrics.enable()
+        dumper = metrics.Dumper(args.metrics, "umbra", args.metrics_interval)
+    profiler = metrics.Profiler()
+    if args.profile:
+        profiler.start()
+
+    # One thread per extra port; the first is read here, under the profiler
+    sessions = ClickerSessions()
+    stopped = threading.Event()
+    for port, reader in zip(args.port[1:], readers[1:]):
+        threading.Thread(
+            target=forward,
+            args=(
+                reader,
+                port,
+                args.binary,
+                uploader.submit,
+                sessions,
+                stopped,
+                publish,
+            ),
+            daemon=True,
+        ).start()
+
+    try:
+        forward(
+            readers[0],
+            args.port[0],
+            args.binary,
+            uploader.submit,
+            sessions,
+            stopped,
+            publish,
+        )
+    except KeyboardInterrupt:
+        print("Stopping, sending what is left of the backlog")
+        stopped.set()
+        for line in sessions.summary():
+            print(line)
+        if publisher is not None:
+            publisher.close()
+        uploader.stop(timeout=10)
+        spool.close()
+        if profiler.running:
+            profiler.stop(args.profile)
+        if dumper is not None:
+            dumper.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Republishes decoded frames to local subscribers, such as the visualizer.
+
+Only one process can own a serial port, so umbra reads it and fans every
+payload out over TCP on loopback, one JSON line per frame:
+
+    {"read_at": <epoch seconds the frame was read>, "payload": {...}}
+
+Each subscriber has its own bounded buffer and sender thread, so a slow one
+never holds up the serial loop or the others. A subscriber whose buffer
+fills up is disconnected; it can reconnect and carry on from live data.
+"""
+
+import collections
+import json
+import os
+import socket
+import threading
+import time
+
+import metrics
+
+PUBLISH_ADDRESS = os.environ.get("UMBRA_PUBLISH", "127.0.0.1:8765")
+BUFFER_FRAMES = 1024  # Frames a subscriber may fall behind before it is dropped
+SEND_TIMEOUT = 5.0  # Seconds a stalled socket may block its sender thread
+
+PUBLISHED = metrics.counter("publish.frames")
+SUBSCRIBERS_DROPPED = metrics.counter("publish.dropped")
+
+
+def parse_address(address):
+    """Split "host:port" into (host, port)."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Subscriber:
+    """One connected subscriber: its socket, its buffer and the thread that drains it."""
+
+    def __init__(self, publisher, sock, address):
+        self.publisher = publisher
+        self.sock = sock
+        self.address = "%s:%d" % address[:2]
+        self.buffer = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.sent = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def offer(self, line):
+        """Queue a line; returns False if the buffer was full and the subscriber is dropped."""
+        with self.cond:
+            if self.closed:
+                return True  # Already going; its sender thread removes it
+            if len(self.buffer) >= self.publisher.buffer_frames:
+                self.closed = True
+                self.cond.notify()
+                return False
+            self.buffer.append(line)
+            self.cond.notify()
+        return True
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.buffer and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    lines, self.buffer = self.buffer, collections.deque()
+                # Everything queued since the last send goes out in one write
+                self.sock.sendall(b"".join(lines))
+                self.sent += len(lines)
+        except OSError:
+            pass  # The subscriber went away or stopped reading for SEND_TIMEOUT
+        finally:
+            self.sock.close()
+            self.publisher._remove(self)
+
+
+class Publisher:
+    """Accepts subscribers on a loopback TCP port and sends each of them every published frame."""
+
+    def __init__(self, address=PUBLISH_ADDRESS, buffer_frames=BUFFER_FRAMES):
+        self.buffer_frames = buffer_frames
+        self.server = socket.create_server(parse_address(address))
+        self.address = "%s:%d" % self.server.getsockname()[:2]
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.published = 0
+        self.dropped = 0  # Subscribers disconnected for falling behind
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return  # Closed
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(SEND_TIMEOUT)
+            subscriber = Subscriber(self, sock, address)
+            with self.lock:
+                self.subscribers.append(subscriber)
+            subscriber.thread.start()
+            print(f"Subscriber connected from {subscriber.address}")
+
+    def _remove(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, payload, read_at=None):
+        """Send a payload to every subscriber; costs one encode however many there are."""
+        self.published += 1
+        PUBLISHED.inc()
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        if read_at is None:
+            read_at = time.time()
+        line = json.dumps({"read_at": read_at, "payload": payload}).encode() + b"\n"
+        for subscriber in subscribers:
+            if not subscriber.offer(line):
+                self._remove(subscriber)
+                self.dropped += 1
+                SUBSCRIBERS_DROPPED.inc()
+                print(f"Dropped subscriber {subscriber.address}, it fell behind")
+
+    def stats(self):
+        with self.lock:
+            subscribers = len(self.subscribers)
+        return {
+            "subscribers": subscribers,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import metrics
+from decoder import decode_frames, parse_lines
+
+MAX_BUFFER = 1 << 16  # Bytes kept while waiting for a frame boundary
+
+READ_TIME = metrics.timer("serial.read")
+DECODE_TIME = metrics.timer("decode")
+FRAMES = metrics.counter("frames")
+
+
+class FrameReader:
+    """Reads everything a serial port has buffered and splits it into frames.
+
+    Text frames end at a newline; binary frames carry their own length in the
+    header. Bytes after the last complete frame stay in a reusable bytearray
+    until the rest arrives, so no read ever waits for a whole line.
+    """
+
+    def __init__(self, port, binary=False):
+        self.port = port
+        self.binary = binary
+        self.buffer = bytearray()
+
+        self.bytes_read = 0
+        self.frames = 0
+        self.rejected = 0  # Lines that were not valid text frames
+        self.discarded = 0  # Bytes dropped because no frame boundary arrived
+
+    def read(self):
+        """Return the frames completed by the bytes currently available.
+
+        When nothing is waiting this blocks for at most the port's read
+        timeout, so an idle loop does not spin.
+        """
+        with READ_TIME:
+            data = self.port.read(self.port.in_waiting or 1)
+        if not data:
+            return []
+        self.bytes_read += len(data)
+        self.buffer += data
+
+        with DECODE_TIME:
+            if self.binary:
+                frames, consumed = decode_frames(self.buffer)
+            else:
+                end = self.buffer.rfind(b"\n") + 1
+                frames, rejected = parse_lines(self.buffer[:end])
+                self.rejected += len(rejected)
+                consumed = end
+        del self.buffer[:consumed]
+
+        if len(self.buffer) > MAX_BUFFER:
+            # Lost sync with the clicker; start again from the next bytes
+            self.discarded += len(self.buffer)
+            self.buffer.clear()
+
+        self.frames += len(frames)
+        FRAMES.inc(len(frames))
+        return frames
+
+
+class ClickerSession:
+    __slots__ = ("clicker_id", "port", "frames", "first_seen", "last_seen")
+
+    def __init__(self, clicker_id, port):
+        self.clicker_id = clicker_id
+        self.port = port
+        self.frames = 0
+        self.first_seen = self.last_seen = time.time()
+
+
+class ClickerSessions:
+    """Frames and last-seen time per clicker, shared by the reader threads of every port."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # clicker_id -> ClickerSession
+
+    def seen(self, clicker_id, port, count=1):
+        with self.lock:
+            session = self.sessions.get(clicker_id)
+            if session is None:
+                session = self.sessions[clicker_id] = ClickerSession(clicker_id, port)
+                print(f"New clicker {clicker_id} on {port}")
+            session.frames += count
+            session.last_seen = time.time()
+
+    def summary(self):
+        with self.lock:
+            sessions = sorted(self.sessions.values(), key=lambda s: str(s.clicker_id))
+        return [
+            f"{session.clicker_id} on {session.port}: {session.frames} frames"
+            for session in sessions
+        ]
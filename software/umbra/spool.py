@@ -0,0 +1,261 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+
+RECORD = struct.Struct(">II")  # Payload length, CRC32 of the payload
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+READ_CHUNK = 64 << 10  # Bytes read from a segment at a time while replaying
+CURSOR_RECORDS = 1000  # Acked records between durable cursor writes
+CURSOR_INTERVAL = 1.0  # Seconds between durable cursor writes while acks arrive
+
+APPEND_TIME = metrics.timer("spool.append")
+FSYNC_TIME = metrics.timer("spool.fsync")
+
+
+class Spool:
+    """Append-only, segmented on-disk log of payloads waiting to be uploaded.
+
+    Every payload is appended before anything tries to send it, so a backend
+    outage or a crash loses nothing. Records are read back in order from the
+    acknowledged cursor; segments wholly before the cursor are deleted. With
+    group_commit, appends are fsynced together every commit_interval seconds
+    instead of one at a time. Delivery is at-least-once: records appended
+    after the last ack are replayed after a restart.
+
+    The cursor is only written durably once cursor_records records or
+    cursor_interval seconds have been acked since the last write, and on
+    close(). After a crash, up to cursor_records records that the backend had
+    already accepted may therefore be sent again.
+    """
+
+    def __init__(
+        self,
+        directory,
+        segment_bytes=4 << 20,
+        group_commit=True,
+        commit_interval=0.05,
+        cursor_records=CURSOR_RECORDS,
+        cursor_interval=CURSOR_INTERVAL,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.group_commit = group_commit
+        self.commit_interval = commit_interval
+        self.cursor_records = cursor_records
+        self.cursor_interval = cursor_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.cursor = self._load_cursor()  # (segment, offset) of the first unacked
+        self.saved_cursor = self.cursor  # What the cursor file holds
+        self.cursor_lock = threading.Lock()  # ack() and close() both save it
+        self.unsaved_acks = 0
+        self.saved_at = time.monotonic()
+        self.read_position = self.cursor
+        self.reader = None  # Open file of the read_position segment
+        self.read_buffer = b""  # Read from it but not yet returned
+        self.pending = self._recover()  # Records appended but not yet acked
+
+        segments = self._segments()
+        self.segment = segments[-1] if segments else self.cursor[0]
+        self.fd = os.open(
+            self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+        )
+        self.size = os.fstat(self.fd).st_size
+        self.dirty = False
+        self.appends = 0
+        self.syncs = 0
+
+        self.closed = threading.Event()
+        if group_commit:
+            threading.Thread(target=self._commit_loop, daemon=True).start()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:020d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        return sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as cursor:
+                segment, offset = cursor.read().split()
+                return int(segment), int(offset)
+        except FileNotFoundError:
+            return 1, 0
+        except ValueError:
+            # Empty or corrupt: replay from the oldest segment, at-least-once as ever
+            print("Spool: unreadable cursor, replaying from the first segment")
+            segments = self._segments()
+            return (segments[0] if segments else 1), 0
+
+    def _write_cursor(self, position):
+        """Durably replace the cursor file: fsync it, rename it, then fsync the directory."""
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        with open(cursor_path + ".tmp", "w") as cursor:
+            cursor.write(f"{position[0]} {position[1]}")
+            cursor.flush()
+            os.fsync(cursor.fileno())
+        os.replace(cursor_path + ".tmp", cursor_path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _recover(self):
+        """Count the unacked records and cut off a torn write at the end of the log."""
+        pending = 0
+        for segment in self._segments():
+            if segment < self.cursor[0]:
+                continue
+            offset = self.cursor[1] if segment == self.cursor[0] else 0
+            with open(self._path(segment), "rb") as f:
+                data = f.read()
+            while offset + RECORD.size <= len(data):
+                length, crc = RECORD.unpack_from(data, offset)
+                body = data[offset + RECORD.size : offset + RECORD.size + length]
+                if len(body) < length or zlib.crc32(body) != crc:
+                    break
+                offset += RECORD.size + length
+                pending += 1
+            if offset < len(data):
+                print(f"Spool: truncating torn record in segment {segment}")
+                os.truncate(self._path(segment), offset)
+        return pending
+
+    def append(self, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        record = RECORD.pack(len(body), zlib.crc32(body)) + body
+        with self.lock, APPEND_TIME:
+            if self.size >= self.segment_bytes:
+                self._rotate()
+            # A single write, so readers never see half a record
+            os.write(self.fd, record)
+            self.size += len(record)
+            self.pending += 1
+            self.appends += 1
+            if self.group_commit:
+                self.dirty = True
+            else:
+                os.fsync(self.fd)
+                self.syncs += 1
+
+    def _rotate(self):
+        os.fsync(self.fd)
+        os.close(self.fd)
+        self.segment += 1
+        self.fd = os.open(
+            self._path(self.segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+        )
+        self.size = 0
+
+    def sync(self):
+        with self.lock:
+            if self.dirty:
+                with FSYNC_TIME:
+                    os.fsync(self.fd)
+                self.dirty = False
+                self.syncs += 1
+
+    def _commit_loop(self):
+        while not self.closed.wait(self.commit_interval):
+            self.sync()
+
+    def read(self, limit):
+        """Return up to limit unsent records as (position after record, payload).
+
+        Reading advances past the records without acknowledging them; call
+        ack() with the last position once the backend has accepted them.
+        Segments are read forward through one open file, a chunk at a time,
+        so replaying a backlog costs O(records) however small the batches.
+        """
+        records = []
+        segment, offset = self.read_position
+        buffer = self.read_buffer
+        while True:
+            start = 0
+            while len(records) < limit and start + RECORD.size <= len(buffer):
+                length, _ = RECORD.unpack_from(buffer, start)
+                end = start + RECORD.size + length
+                if end > len(buffer):
+                    break
+                payload = json.loads(buffer[start + RECORD.size : end])
+                offset += end - start
+                start = end
+                records.append(((segment, offset), payload))
+            buffer = buffer[start:]
+            if len(records) >= limit:
+                break
+
+            # Checked before reading: a segment behind the writer gets no more records
+            sealed = segment < self.segment
+            if self.reader is None:
+                try:
+                    self.reader = open(self._path(segment), "rb")
+                    self.reader.seek(offset + len(buffer))
+                except FileNotFoundError:
+                    pass
+            need = RECORD.size
+            if len(buffer) >= RECORD.size:
+                need += RECORD.unpack_from(buffer)[0]
+            chunk = self.reader.read(max(READ_CHUNK, need)) if self.reader else b""
+            if chunk:
+                buffer += chunk
+            elif sealed:
+                # Continue into the next segment
+                if self.reader is not None:
+                    self.reader.close()
+                    self.reader = None
+                segment, offset, buffer = segment + 1, 0, b""
+            else:
+                break
+        self.read_position = (segment, offset)
+        self.read_buffer = buffer
+        return records
+
+    def ack(self, position, count):
+        """Mark everything before position as delivered and delete finished segments."""
+        with self.lock:
+            self.pending -= count
+        with self.cursor_lock:
+            self.cursor = position
+            self.unsaved_acks += count
+            if (
+                self.unsaved_acks >= self.cursor_records
+                or time.monotonic() - self.saved_at >= self.cursor_interval
+            ):
+                self._save_cursor()
+
+    def _save_cursor(self):
+        """Write the cursor durably, then delete the segments wholly before it."""
+        if self.cursor == self.saved_cursor:
+            return
+        position = self.cursor
+        self._write_cursor(position)
+        self.saved_cursor = position
+        self.unsaved_acks = 0
+        self.saved_at = time.monotonic()
+        for segment in self._segments():
+            if segment >= position[0]:
+                break
+            os.remove(self._path(segment))
+
+    def close(self):
+        self.closed.set()
+        self.sync()
+        os.close(self.fd)
+        with self.cursor_lock:
+            self._save_cursor()
+        if self.reader is not None:
+            self.reader.close()
@@ -0,0 +1,163 @@
+import collections
+import threading
+import time
+
+import requests
+
+import metrics
+from wire import encode_body
+
+POST_TIME = metrics.timer("upload.post")
+LATENCY = metrics.histogram("upload.latency")
+SENT = metrics.counter("upload.sent")
+RETRIES = metrics.counter("upload.retries")
+BYTES = metrics.counter("upload.bytes")
+
+
+class Uploader:
+    """Posts payloads to the backend from a worker thread.
+
+    submit() never waits on HTTP: payloads are appended to a durable Spool
+    and the worker replays them in order, so nothing is lost while the
+    backend is down or when umbra restarts. The worker reuses one keep-alive
+    session, sends up to batch_size payloads per request (as a JSON list when
+    there is more than one), retries failed requests with exponential backoff
+    and acknowledges each batch in the spool once the backend has answered.
+
+    With compact, batches go out in wire.py's column encoding, optionally
+    compressed. A backend that answers 415 gets plain JSON from then on.
+    """
+
+    def __init__(
+        self,
+        url,
+        spool,
+        batch_size=1,
+        batch_window=0.05,
+        timeout=5,
+        max_backoff=30,
+        compact=False,
+        compression=None,
+    ):
+        self.url = url
+        self.spool = spool
+        self.batch_size = batch_size
+        self.batch_window = batch_window  # Seconds to wait for a batch to fill
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.compact = compact
+        self.compression = compression  # None, "gzip" or "zstd"
+
+        self.session = requests.Session()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.sent = 0  # Payloads acknowledged by the backend
+        self.rejected = 0  # Payloads the backend refused with a 4xx
+        self.retries = 0
+        self.bytes_sent = 0  # Request bodies as sent, after any compression
+        self.latencies = collections.deque(maxlen=10_000)  # Enqueue to ack, seconds
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the spool has been sent, or after timeout seconds.
+
+        Whatever is still unsent stays in the spool for the next start.
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+
+    def submit(self, payload):
+        self.spool.append([time.time(), payload])
+        with self.cond:
+            self.cond.notify()
+
+    def depth(self):
+        return self.spool.pending
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+        return {
+            "backlog": self.depth(),
+            "sent": self.sent,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "p99_latency": p99,
+        }
+
+    def _next_batch(self):
+        with self.cond:
+            while self.running and not self.spool.pending:
+                self.cond.wait()
+            if not self.spool.pending:
+                return None
+
+            # Give a partial batch a short window to fill up
+            deadline = time.monotonic() + self.batch_window
+            while self.running and self.spool.pending < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+        return self.spool.read(self.batch_size)
+
+    def _post(self, batch):
+        """Send one batch, retrying until the backend accepts or rejects it."""
+        payloads = [payload for _, (_, payload) in batch]
+        delay = 0.1
+        while True:
+            try:
+                body, headers = encode_body(payloads, self.compact, self.compression)
+            except ValueError:
+                # Not something the compact encoding knows; JSON carries anything
+                body, headers = encode_body(payloads, False, self.compression)
+            try:
+                with POST_TIME:
+                    response = self.session.post(
+                        self.url, data=body, headers=headers, timeout=self.timeout
+                    )
+                if response.status_code == 415 and (self.compact or self.compression):
+                    print("Backend does not accept compact uploads, sending JSON")
+                    self.compact = False
+                    self.compression = None
+                    continue
+                if response.ok:
+                    self.bytes_sent += len(body)
+                    BYTES.inc(len(body))
+                    now = time.time()
+                    for _, (queued, _) in batch:
+                        self.latencies.append(now - queued)
+                        LATENCY.observe(now - queued)
+                    self.sent += len(batch)
+                    SENT.inc(len(batch))
+                    return
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    print(f"Upload rejected ({response.status_code}): {response.text}")
+                    self.rejected += len(batch)
+                    return
+                print(f"Upload failed ({response.status_code}), retrying in {delay}s")
+            except requests.RequestException as e:
+                print(f"Upload failed ({e}), retrying in {delay}s")
+            self.retries += 1
+            RETRIES.inc()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._post(batch)
+                self.spool.ack(batch[-1][0], len(batch))
@@ -0,0 +1,289 @@
+"""A compact batch encoding of /api/click payloads, with JSON as the fallback.
+
+A batch is stored column by column rather than payload by payload: one
+array per field, each packed with the narrowest unsigned type that holds
+its values. Beacon and clicker IDs are interned into a table at the head of
+the batch and referenced by index. Frame timestamps are stored as zigzag
+deltas from the previous frame, and the body may be gzip or zstd
+compressed. decode_body() turns either encoding back into exactly the
+payloads umbra built, so the backend can accept both.
+"""
+
+import array
+import gzip
+import itertools
+import json
+import struct
+import sys
+
+try:
+    import zstandard
+except ImportError:  # Optional; gzip is always available
+    zstandard = None
+
+CONTENT_TYPE = "application/vnd.umbra.clicks"
+JSON_TYPE = "application/json"
+MAGIC = b"UMB1"
+COLUMN = struct.Struct("<cI")  # Array typecode, item count
+BLOB = struct.Struct("<I")  # Byte length of the interned strings
+TYPECODES = ("B", "H", "I", "Q")  # Narrowest first
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESS_MIN = 256  # Bodies shorter than this are sent uncompressed
+
+TEXT = 0  # A text frame: beacon_num and (beacon_id, centimeter) pairs
+FRAME = 1  # A binary frame: header fields and (uuid, tof) pairs
+TEXT_KEYS = frozenset(("beacon_num", "beacons", "clicker_id"))
+FRAME_KEYS = frozenset(
+    ("target", "num_beacons", "uuid", "timestamp", "beacons", "clicker_id")
+)
+TEXT_BEACON_KEYS = frozenset(("beacon_id", "centimeter"))
+FRAME_BEACON_KEYS = frozenset(("uuid", "tof"))
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0)}
+DECOMPRESSORS = {"gzip": gzip.decompress}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = zstandard.ZstdCompressor(ZSTD_LEVEL).compress
+    DECOMPRESSORS["zstd"] = zstandard.ZstdDecompressor().decompress
+
+
+def _write_column(out, values):
+    for typecode in TYPECODES:
+        try:
+            column = array.array(typecode, values)
+            break
+        except OverflowError:
+            continue
+    else:
+        raise ValueError("value out of range")
+    if sys.byteorder == "big":
+        column.byteswap()
+    out += COLUMN.pack(typecode.encode(), len(column))
+    out += column
+
+
+def _read_column(body, offset):
+    typecode, count = COLUMN.unpack_from(body, offset)
+    typecode = typecode.decode()
+    if typecode not in TYPECODES:
+        raise ValueError(f"unexpected column type {typecode!r}")
+    column = array.array(typecode)
+    offset += COLUMN.size
+    end = offset + count * column.itemsize
+    if end > len(body):
+        raise ValueError("truncated column")
+    column.frombytes(body[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tolist(), end
+
+
+def _zigzag(values):
+    """Map signed deltas onto unsigned integers, small magnitudes first."""
+    return [value * 2 if value >= 0 else -value * 2 - 1 for value in values]
+
+
+def _unzigzag(values):
+    return [value >> 1 if not value & 1 else -(value >> 1) - 1 for value in values]
+
+
+class _Interner:
+    """Assigns each distinct ID an index, keeping 7 and "7" apart."""
+
+    def __init__(self):
+        self.indices = {}
+        self.values = []
+
+    def __call__(self, value):
+        key = (type(value), value)
+        index = self.indices.get(key)
+        if index is None:
+            if type(value) not in (str, int):
+                raise ValueError(f"cannot intern {value!r}")
+            index = self.indices[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def encode_batch(payloads):
+    """Encode a list of /api/click payloads; raises ValueError for any other shape."""
+    intern = _Interner()
+    kinds, clickers, counts = [], [], []
+    beacon_nums = []
+    targets, num_beacons, uuids, timestamps = [], [], [], []
+    beacon_ids, values = [], []
+    try:
+        for payload in payloads:
+            keys = payload.keys()
+            clickers.append(intern(payload["clicker_id"]))
+            beacons = payload["beacons"]
+            counts.append(len(beacons))
+            if keys == TEXT_KEYS:
+                kinds.append(TEXT)
+                beacon_nums.append(payload["beacon_num"])
+                for beacon in beacons:
+                    if beacon.keys() != TEXT_BEACON_KEYS:
+                        raise ValueError(f"unexpected beacon {beacon!r}")
+                    beacon_ids.append(intern(beacon["beacon_id"]))
+                    values.append(beacon["centimeter"])
+            elif keys == FRAME_KEYS:
+                kinds.append(FRAME)
+                targets.append(payload["target"])
+                num_beacons.append(payload["num_beacons"])
+                uuids.append(payload["uuid"])
+                timestamps.append(payload["timestamp"])
+                for beacon in beacons:
+                    if beacon.keys() != FRAME_BEACON_KEYS:
+                        raise ValueError(f"unexpected beacon {beacon!r}")
+                    beacon_ids.append(intern(beacon["uuid"]))
+                    values.append(beacon["tof"])
+            else:
+                raise ValueError(f"unexpected payload keys {sorted(keys)}")
+
+        # The interned IDs: a type per entry, then the strings and the integers
+        strings = [value.encode() for value in intern.values if type(value) is str]
+        blob = b"".join(strings)
+        deltas = [b - a for a, b in zip([0] + timestamps, timestamps)]
+        out = bytearray(MAGIC)
+        _write_column(out, [type(value) is int for value in intern.values])
+        _write_column(out, [len(string) for string in strings])
+        out += BLOB.pack(len(blob))
+        out += blob
+        _write_column(out, [value for value in intern.values if type(value) is int])
+        for column in (kinds, clickers, counts, beacon_nums, targets, num_beacons):
+            _write_column(out, column)
+        _write_column(out, uuids)
+        _write_column(out, _zigzag(deltas))
+        _write_column(out, beacon_ids)
+        _write_column(out, values)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"not a click payload: {e!r}") from e
+    return bytes(out)
+
+
+def decode_batch(body):
+    """Return the payloads of a batch made by encode_batch."""
+    if body[: len(MAGIC)] != MAGIC:
+        raise ValueError("not an umbra click batch")
+    try:
+        offset = len(MAGIC)
+        is_int, offset = _read_column(body, offset)
+        lengths, offset = _read_column(body, offset)
+        (size,) = BLOB.unpack_from(body, offset)
+        offset += BLOB.size
+        blob = body[offset : offset + size]
+        offset += size
+        ints, offset = _read_column(body, offset)
+        columns = []
+        for _ in range(10):
+            column, offset = _read_column(body, offset)
+            columns.append(column)
+    except struct.error as e:
+        raise ValueError(f"truncated batch: {e}") from e
+    kinds, clickers, counts, beacon_nums, targets, num_beacons = columns[:6]
+    uuids, deltas, beacon_ids, values = columns[6:]
+
+    # Check the columns agree before rebuilding, so corrupt bodies raise ValueError
+    frames = len(kinds)
+    texts = kinds.count(TEXT)
+    if len(is_int) != len(ints) + len(lengths) or sum(is_int) != len(ints):
+        raise ValueError("interned ID table does not add up")
+    if len(blob) != size or sum(lengths) != size:
+        raise ValueError("interned strings do not fill their blob")
+    if texts + kinds.count(FRAME) != frames:
+        raise ValueError("unknown payload kind")
+    if len(clickers) != frames or len(counts) != frames:
+        raise ValueError("payload columns differ in length")
+    if len(beacon_nums) != texts:
+        raise ValueError("beacon_num column does not match the text payloads")
+    if any(len(column) != frames - texts for column in (targets, num_beacons, uuids)):
+        raise ValueError("frame columns do not match the frame payloads")
+    if len(deltas) != frames - texts:
+        raise ValueError("timestamp column does not match the frame payloads")
+    if sum(counts) != len(beacon_ids) or len(values) != len(beacon_ids):
+        raise ValueError("beacon columns do not match the beacon counts")
+    if max(clickers + beacon_ids, default=-1) >= len(is_int):
+        raise ValueError("interned ID index out of range")
+
+    try:
+        # Rebuild the interned IDs in their original order
+        ends = list(itertools.accumulate(lengths))
+        strings = (blob[a:b].decode() for a, b in zip([0] + ends, ends))
+        ints = iter(ints)
+        names = [next(ints) if flag else next(strings) for flag in is_int]
+        timestamps = iter(itertools.accumulate(_unzigzag(deltas)))
+
+        payloads = []
+        beacon_nums, targets = iter(beacon_nums), iter(targets)
+        num_beacons, uuids = iter(num_beacons), iter(uuids)
+        start = 0
+        for kind, clicker, count in zip(kinds, clickers, counts):
+            ids = beacon_ids[start : start + count]
+            ranges = values[start : start + count]
+            start += count
+            if kind == TEXT:
+                payloads.append(
+                    {
+                        "beacon_num": next(beacon_nums),
+                        "beacons": [
+                            {"beacon_id": names[i], "centimeter": centimeter}
+                            for i, centimeter in zip(ids, ranges)
+                        ],
+                        "clicker_id": names[clicker],
+                    }
+                )
+            else:
+                payloads.append(
+                    {
+                        "target": next(targets),
+                        "num_beacons": next(num_beacons),
+                        "uuid": next(uuids),
+                        "timestamp": next(timestamps),
+                        "beacons": [
+                            {"uuid": names[i], "tof": tof}
+                            for i, tof in zip(ids, ranges)
+                        ],
+                        "clicker_id": names[clicker],
+                    }
+                )
+    except (StopIteration, IndexError) as e:  # The checks above should rule these out
+        raise ValueError(f"corrupt batch: {e!r}") from e
+    return payloads
+
+
+def encode_body(payloads, compact=True, compression=None):
+    """Return (body, headers) for a POST of payloads.
+
+    JSON bodies keep the old form: a lone payload is sent as an object and
+    several as a list. Compact bodies are always a batch. Bodies under
+    COMPRESS_MIN bytes are not worth compressing.
+    """
+    if compact:
+        body = encode_batch(payloads)
+        headers = {"Content-Type": CONTENT_TYPE}
+    else:
+        body = json.dumps(payloads[0] if len(payloads) == 1 else payloads).encode()
+        headers = {"Content-Type": JSON_TYPE}
+    if compression is not None and len(body) >= COMPRESS_MIN:
+        body = COMPRESSORS[compression](body)
+        headers["Content-Encoding"] = compression
+    return body, headers
+
+
+def decode_body(body, content_type=JSON_TYPE, content_encoding=None):
+    """Return the list of payloads in a POST body, as the backend receives it.
+
+    Raises ValueError for an unknown content type or encoding, which the
+    backend should answer with 415 so umbra falls back to plain JSON.
+    """
+    if content_encoding:
+        if content_encoding not in DECOMPRESSORS:
+            raise ValueError(f"unsupported encoding {content_encoding}")
+        body = DECOMPRESSORS[content_encoding](body)
+    content_type = (content_type or JSON_TYPE).split(";")[0].strip()
+    if content_type == CONTENT_TYPE:
+        return decode_batch(body)
+    if content_type == JSON_TYPE:
+        payloads = json.loads(body)
+        return payloads if isinstance(payloads, list) else [payloads]
+    raise ValueError(f"unsupported content type {content_type}")